@@ -0,0 +1,113 @@
+"""
+Baseline of known violations.
+
+A baseline records the violations a repository already has, so commits can
+be checked with a strict configuration while only failing on new
+violations. Every violation is recorded as a fingerprint of its path, its
+error code and the normalized text of its source line, which keeps it
+matching when lines are added or removed above it.
+"""
+
+import collections
+import hashlib
+
+from .engine import filter_output
+
+
+class Baseline(object):
+    """ Multiset of violation fingerprints with hash-based lookups. """
+
+    def __init__(self):
+        self.entries = collections.Counter()
+
+    @classmethod
+    def load(cls, path):
+        """ Returns the baseline stored in the file.
+
+        :type path: str
+        :param path: Path of the baseline file
+        """
+        baseline = cls()
+        with open(path, "rb") as file_handle:
+            for line in file_handle:
+                line = line.rstrip(b"\r\n")
+                if line:
+                    baseline.entries[line] += 1
+        return baseline
+
+    def save(self, path):
+        """ Stores the baseline in a file with one sorted entry per line.
+
+        :type path: str
+        :param path: Path of the baseline file
+        """
+        with open(path, "wb") as file_handle:
+            for entry in sorted(self.entries.elements()):
+                file_handle.write(entry + b"\n")
+
+    def __len__(self):
+        return sum(self.entries.values())
+
+    def record(self, filename, output, source):
+        """ Adds the violations in the pep8 output of a file.
+
+        :type filename: str
+        :param filename: The file pep8 was run on
+        :type output: bytes
+        :param output: The pep8 output for the file
+        :type source: bytes
+        :param source: The content pep8 checked
+        """
+        lines = source.splitlines()
+
+        def keep(row, line):
+            """ Records the violation. """
+            self.entries[_fingerprint(filename, line, lines, row)] += 1
+            return True
+
+        filter_output(output, filename, keep)
+
+    def filter(self, filename, output, source):
+        """ Returns the pep8 output of a file without baselined violations.
+
+        Every entry of the baseline matches a single violation of the
+        output. The baseline itself is left unchanged, so it can filter the
+        output of the same file again, like in every pushed commit.
+
+        :type filename: str
+        :param filename: The file pep8 was run on
+        :type output: bytes
+        :param output: The pep8 output for the file
+        :type source: bytes
+        :param source: The content pep8 checked
+        """
+        lines = source.splitlines()
+        remaining = collections.Counter()
+
+        def keep(row, line):
+            """ Returns whether the violation is missing from the baseline. """
+            fingerprint = _fingerprint(filename, line, lines, row)
+            if fingerprint not in remaining:
+                remaining[fingerprint] = self.entries[fingerprint]
+            if remaining[fingerprint] > 0:
+                remaining[fingerprint] -= 1
+                return False
+            return True
+
+        return filter_output(output, filename, keep)
+
+
+def _fingerprint(filename, line, lines, row):
+    """ Returns the fingerprint of a violation.
+
+    The fingerprint consists of the path, the error code and a digest of the
+    source line with the whitespace normalized, separated by tabs.
+    """
+    path = filename
+    if not isinstance(path, bytes):
+        path = path.encode("utf-8")
+    message = line[len(path) + 1:].split(b":", 2)[-1].split()
+    code = message[0] if message else b""
+    source = lines[row - 1] if 0 < row <= len(lines) else b""
+    digest = hashlib.sha1(b" ".join(source.split())).hexdigest()[:16]
+    return b"\t".join([path, code, digest.encode("ascii")])
@@ -0,0 +1,309 @@
+"""
+Persistent cache of pep8 results.
+
+The results are keyed by the SHA of the checked blob and the fingerprint of
+the engine, so a file is only checked again when its content or the pep8
+configuration changes.
+"""
+
+import collections
+import hashlib
+import os
+import tempfile
+
+
+class ResultCache(object):
+    """ Stores the pep8 output of blobs in a directory.
+
+    Every result is stored in its own file named by the key, spread over
+    subdirectories like the git object database. Results are written to a
+    temporary file and renamed into place, so concurrent hooks never see
+    partially written results. A long-running process can keep the recent
+    results in memory as well.
+    """
+
+    def __init__(self, directory, fingerprint, memory=None):
+        """
+        :type directory: str
+        :param directory: Directory holding the results. Default: only keep
+                          the results in memory
+        :type fingerprint: str
+        :param fingerprint: Fingerprint of the engine producing the results
+        :type memory: LRU
+        :param memory: The results kept in memory, shared by the caches of
+                       all fingerprints
+        """
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.memory = memory
+
+    def get(self, sha, filename):
+        """ Returns the cached pep8 output for the blob, or None.
+
+        The output is returned as if the blob was checked as `filename`,
+        even if it was checked under another path.
+
+        :type sha: str
+        :param sha: SHA of the blob
+        :type filename: str
+        :param filename: Path of the file containing the blob
+        """
+        key = self._key(sha)
+        data = None if self.memory is None else self.memory.get(key)
+        if data is None:
+            if self.directory is None:
+                return None
+            try:
+                with open(self._path(key), "rb") as file_handle:
+                    data = file_handle.read()
+            except (IOError, OSError):
+                return None
+            if self.memory is not None:
+                self.memory.put(key, data)
+
+        cached_filename, _, output = data.partition(b"\n")
+        return relocate_output(output, cached_filename, _encode(filename))
+
+    def put(self, sha, filename, output):
+        """ Stores the pep8 output for the blob.
+
+        :type sha: str
+        :param sha: SHA of the blob
+        :type filename: str
+        :param filename: Path the blob was checked as
+        :type output: bytes
+        :param output: The pep8 output
+        """
+        key = self._key(sha)
+        data = _encode(filename) + b"\n" + output
+        if self.memory is not None:
+            self.memory.put(key, data)
+        if self.directory is None:
+            return
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            handle, temp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(handle, "wb") as file_handle:
+                file_handle.write(data)
+            os.rename(temp_path, path)
+        except (IOError, OSError):
+            # The cache is only an optimization, so failing to write to it
+            # (a full disk, or a rename onto an existing file on Windows)
+            # must not stop the commit.
+            pass
+
+    def _key(self, sha):
+        """ Returns the key of the result for the blob. """
+        return hashlib.sha1(
+            _encode(sha) + b"\0" + _encode(self.fingerprint)).hexdigest()
+
+    def _path(self, key):
+        """ Returns the path of the cached result of the key. """
+        return os.path.join(self.directory, key[:2], key[2:])
+
+
+class LRU(object):
+    """ Mapping holding at most a number of the most recently used values.
+    """
+
+    def __init__(self, max_entries):
+        """
+        :type max_entries: int
+        :param max_entries: Number of values to keep
+        """
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """ Returns the value of the key, or None. """
+        value = self.entries.pop(key, None)
+        if value is not None:
+            self.entries[key] = value
+        return value
+
+    def put(self, key, value):
+        """ Stores the value, dropping the least recently used one. """
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class ClassificationCache(object):
+    """ Remembers whether blobs are Python scripts.
+
+    The classifications are kept in a single file with a line holding the
+    SHA and a 0 or 1 for every blob. New classifications are appended, so
+    concurrent hooks at most classify a blob twice.
+    """
+
+    def __init__(self, path):
+        """
+        :type path: str
+        :param path: Path of the file holding the classifications
+        """
+        self.path = path
+        self.classifications = {}
+        self.new_classifications = {}
+        try:
+            with open(path, "rb") as file_handle:
+                for line in file_handle:
+                    fields = line.split()
+                    if len(fields) == 2:
+                        self.classifications[fields[0].decode("ascii")] = (
+                            fields[1] == b"1")
+        except (IOError, OSError):
+            pass
+
+    def get(self, sha):
+        """ Returns whether the blob is a Python script, or None. """
+        return self.classifications.get(sha)
+
+    def put(self, sha, is_python):
+        """ Remembers whether the blob is a Python script. """
+        self.classifications[sha] = is_python
+        self.new_classifications[sha] = is_python
+
+    def save(self):
+        """ Appends the new classifications to the file. """
+        if not self.new_classifications:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.path, "ab") as file_handle:
+                file_handle.write(b"".join(
+                    "{} {}\n".format(sha, int(is_python)).encode("ascii")
+                    for sha, is_python in self.new_classifications.items()))
+            self.new_classifications = {}
+        except (IOError, OSError):
+            pass
+
+
+class Checkpoint(object):
+    """ Progress of a long check, so an interrupted check can resume.
+
+    The file starts with the fingerprint of the engine, followed by a line
+    with the key of every checked blob and whether it passed. Lines are
+    appended as blobs are checked, and a checkpoint of another fingerprint
+    is ignored. The keys are hex digests, like the SHA of the blob.
+    """
+
+    def __init__(self, path, fingerprint):
+        """
+        :type path: str
+        :param path: Path of the file holding the progress
+        :type fingerprint: str
+        :param fingerprint: Fingerprint of the engine checking the blobs
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self.results = {}
+        self.file_handle = None
+        try:
+            with open(path, "rb") as file_handle:
+                if file_handle.readline().strip() == _encode(fingerprint):
+                    for line in file_handle:
+                        fields = line.split()
+                        if len(fields) == 2:
+                            self.results[fields[0].decode("ascii")] = (
+                                fields[1] == b"1")
+        except (IOError, OSError):
+            pass
+
+    def get(self, key):
+        """ Returns whether the blob passed, or None if it wasn't checked. """
+        return self.results.get(key)
+
+    def put(self, key, passed):
+        """ Records that the blob was checked. """
+        if self.file_handle is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.file_handle = open(self.path, "wb")
+            self.file_handle.write(_encode(self.fingerprint) + b"\n")
+            for old_key, old_passed in sorted(self.results.items()):
+                self._write(old_key, old_passed)
+        self.results[key] = passed
+        self._write(key, passed)
+
+    def flush(self):
+        """ Writes the recorded results to the disk. """
+        if self.file_handle is not None:
+            self.file_handle.flush()
+
+    def remove(self):
+        """ Deletes the checkpoint once the check completed. """
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        """ Closes the file holding the progress. """
+        if self.file_handle is not None:
+            self.file_handle.close()
+            self.file_handle = None
+
+    def _write(self, key, passed):
+        """ Appends the result of a blob to the file. """
+        self.file_handle.write(
+            "{} {}\n".format(key, int(passed)).encode("ascii"))
+
+
+def relocate_output(output, old_filename, new_filename):
+    """ Replaces the path in front of every violation in the pep8 output.
+
+    :type output: bytes
+    :param output: The pep8 output
+    :type old_filename: bytes
+    :param old_filename: The path the output was produced for
+    :type new_filename: bytes
+    :param new_filename: The path to use instead
+    """
+    if old_filename == new_filename:
+        return output
+
+    lines = []
+    for line in output.splitlines(True):
+        if line.rstrip(b"\r\n") == old_filename:
+            line = new_filename + line[len(old_filename):]
+        elif line.startswith(old_filename + b":"):
+            line = new_filename + line[len(old_filename):]
+        lines.append(line)
+    return b"".join(lines)
+
+
+def blob_sha(data):
+    """ Returns the SHA git computes for a blob with the specified content.
+
+    :type data: bytes
+    :param data: Content of the blob
+    """
+    header = "blob {}\0".format(len(data)).encode("ascii")
+    return hashlib.sha1(header + data).hexdigest()
+
+
+def file_blob_sha(filename):
+    """ Returns the blob SHA of a file, or None if it cannot be read. """
+    try:
+        with open(filename, "rb") as file_handle:
+            return blob_sha(file_handle.read())
+    except (IOError, OSError):
+        return None
+
+
+def _encode(text):
+    """ Returns the text as bytes. """
+    if isinstance(text, bytes):
+        return text
+    return text.encode("utf-8")
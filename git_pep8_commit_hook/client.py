@@ -0,0 +1,40 @@
+"""
+Thin client of the hook server, installed as the git_pep8_commit_hook
+command.
+
+Only the standard library is imported before the request is sent, so a
+commit checked by a running server doesn't import pep8. Commands reading
+stdin or running for long are run in the process of the client, like all
+commands when no server is running.
+"""
+
+import sys
+
+from .server import reads_stdin, request, socket_path
+
+
+# Commands never sent to the server
+LOCAL_COMMANDS = ("baseline", "audit", "pre-push", "pre-receive",
+                  "merge-reports", "work", "watch", "serve")
+
+
+def main():
+    """ Runs the hook in the server, or in this process without server """
+    argv = sys.argv[1:]
+    if (argv and argv[0] in LOCAL_COMMANDS) or reads_stdin(argv):
+        response = None
+    else:
+        response = request(socket_path(), argv)
+
+    if response is None:
+        from .commit_hook import main as hook_main
+        hook_main()
+        return
+    for stream, output in [(sys.stdout, response["output"]),
+                           (sys.stderr, response["errors"])]:
+        if not isinstance(output, str):
+            # Python 2 writes bytes
+            output = output.encode("utf-8")
+        stream.write(output)
+        stream.flush()
+    sys.exit(response["status"])
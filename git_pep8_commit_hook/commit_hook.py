@@ -14,54 +14,120 @@ from __future__ import print_function
 
 import os
 import sys
-import subprocess
 import collections
+import contextlib
+import hashlib
 import argparse
-try:
-    import configparser
-except ImportError:
-    import ConfigParser as configparser
+import itertools
 
+from .baseline import Baseline
+from .cache import (
+    LRU, Checkpoint, ClassificationCache, ResultCache, file_blob_sha)
+from .config import files_fingerprint, read_options
+from .configtree import CONFIG_NAMES, ConfigTree
+from .engine import config_paths, create_engine, filter_output
+from .gitrepo import (
+    BlobReader, GitRepo, LineRanges, GITLINK_MODE, SYMLINK_MODE, read_paths)
+from .pathfilter import PathFilter
+from .server import HookServer, socket_path
+from .shard import (
+    merge_reports, parse_shard, path_shard, size_shards, write_report)
+from .watch import watch_tree
+from .workqueue import WorkQueue
 
-ExecutionResult = collections.namedtuple(
-    "ExecutionResult",
-    "status, stdout, stderr"
-)
 
 VERSION = "0.1.0"
 
+# Number of bytes read from the start of a file to tell if it is a script
+SNIFF_SIZE = 512
+
+# Number of files the audit checks at a time
+AUDIT_CHUNK_SIZE = 1000
+
+# The recent results kept in memory by the hook server
+_MEMORY_RESULTS = None
+
+# The engines kept by the hook server between requests
+_SERVER_ENGINES = None
+
 
 def main():
     """ Main function handling configuration files etc """
+    # Only the first argument selects a command, so files named like one
+    # are checked when they follow "--"
+    commands = {
+        "baseline": baseline_main,
+        "audit": audit_main,
+        "pre-push": pre_push_main,
+        "pre-receive": pre_receive_main,
+        "merge-reports": merge_reports_main,
+        "work": work_main,
+        "watch": watch_main,
+        "serve": serve_main,
+    }
+    if sys.argv[1:2] and sys.argv[1] in commands:
+        commands[sys.argv[1]](sys.argv[2:])
+        sys.exit(0)
+
     parser = argparse.ArgumentParser(
         description="Git pre-commit hook for checking "
         "coding style of Python code. The hook requires pep8. It will check "
         "files with the '.py' extension and files that contain '#!' (shebang) "
-        "and 'python' in the first line.")
+        "and 'python' in the first line. Run it with 'baseline' as the first "
+        "argument to record the current violations in a baseline file, with "
+        "'audit' to check all files in the repository, with 'pre-push' to "
+        "check the commits about to be pushed, with 'pre-receive' to "
+        "check pushed commits on the server, with 'merge-reports' to "
+        "combine the reports of several shards, with 'work' to share the "
+        "files between runners through a queue directory, with 'watch' to "
+        "check files as they are saved, or with 'serve' to run a server "
+        "checking commits faster.")
 
     parser.add_argument(
-        "--pep8-command",
-        default="pep8",
-        help="path to pep8 executable. Default: pep8")
+        "files",
+        nargs="*",
+        help=(
+            "files to check instead of the files staged in git. Files that "
+            "don't look like Python scripts are skipped. Put '--' before "
+            "the files to check a file named like a command, such as "
+            "'audit'"))
 
     parser.add_argument(
-        "--pep8-params",
-        help="custom pep8 parameters to add to the pep8 command.")
+        "--files-from",
+        help=(
+            "read the files to check instead of the files staged in git "
+            "from this file, one per line. Use '-' for stdin"))
 
     parser.add_argument(
-        "--max-violations-per-file",
-        default=0,
-        type=int,
+        "-z", "--null",
+        action="store_true",
+        help="the files listed by --files-from are separated by NUL bytes")
+
+    _add_pep8_arguments(parser)
+    _add_check_arguments(parser)
+
+    parser.add_argument(
+        "--staged",
+        action="store_true",
         help=(
-            "maximum number of violations. Files with a highter violation "
-            "count will stop the commit. Default: 0"))
+            "check the staged content of the files, read from git, instead "
+            "of the files in the working tree"))
 
     parser.add_argument(
-        "--config",
-        default="setup.cfg",
+        "--changed-lines-only",
+        action="store_true",
         help=(
-            "path to pep8 config file file. Options in the config will "
-            "override the command line parameters. Default: setup.cfg"))
+            "only count violations on lines added or changed in the staged "
+            "diff. Implies --staged"))
+
+    parser.add_argument(
+        "--range",
+        help=(
+            "check the files changed between two commits instead of the "
+            "staged files, like 'origin/master..HEAD'. The files are read "
+            "from git, so no checkout is needed"))
+
+    _add_shard_arguments(parser)
 
     parser.add_argument(
         "--version",
@@ -74,22 +140,523 @@ def main():
         print("git_pep8_commit_hook version {}".format(VERSION))
         sys.exit(0)
 
+    if args.shard and not args.range:
+        parser.error("--shard splits the files of a --range")
+
+    if args.range and not GitRepo().valid_revisions([args.range]):
+        parser.error("Invalid --range: {}".format(args.range))
+
+    if args.files or args.files_from:
+        if (args.cache or args.staged or args.changed_lines_only or
+                args.range or args.report):
+            parser.error(
+                "--cache, --staged, --changed-lines-only, --range and "
+                "--report need the files in git and can't be used with a "
+                "list of files")
+        filenames = args.files
+        if args.files_from:
+            filenames = itertools.chain(filenames, _files_from(
+                args.files_from, b"\0" if args.null else b"\n"))
+        result = check_file_list(
+            filenames,
+            pep8_command=args.pep8_command,
+            pep8_params=args.pep8_params,
+            config=args.config,
+            max_violations_per_file=args.max_violations_per_file,
+            engine=args.engine,
+            jobs=args.jobs,
+            baseline=args.baseline,
+            fail_fast=args.fail_fast,
+            include=args.include,
+            exclude=args.exclude)
+        sys.exit(0 if result else 1)
+
     result = check_repo(
-        args.pep8_command, args.pep8_params,
-        args.config, args.max_violations_per_file)
+        pep8_command=args.pep8_command,
+        pep8_params=args.pep8_params,
+        config=args.config,
+        max_violations_per_file=args.max_violations_per_file,
+        engine=args.engine,
+        jobs=args.jobs,
+        cache=args.cache,
+        staged=args.staged,
+        changed_lines_only=args.changed_lines_only,
+        baseline=args.baseline,
+        fail_fast=args.fail_fast,
+        include=args.include,
+        exclude=args.exclude,
+        revision_range=args.range,
+        shard=args.shard,
+        shard_by=args.shard_by,
+        report=args.report)
 
     if result:
         sys.exit(0)
     sys.exit(1)
 
 
+def baseline_main(argv):
+    """ Main function of the baseline command """
+    parser = argparse.ArgumentParser(
+        prog="git_pep8_commit_hook baseline",
+        description="Record the violations of all Python files tracked by "
+        "git in a baseline file. Commits checked against the baseline only "
+        "fail on violations missing from it.")
+
+    _add_pep8_arguments(parser)
+
+    parser.add_argument(
+        "--output",
+        default=".pep8-baseline",
+        help="path to the baseline file. Default: .pep8-baseline")
+
+    args = parser.parse_args(argv)
+
+    create_baseline(
+        args.pep8_command, args.pep8_params, args.config, args.engine,
+        args.jobs, args.output)
+    sys.exit(0)
+
+
+def audit_main(argv):
+    """ Main function of the audit command """
+    parser = argparse.ArgumentParser(
+        prog="git_pep8_commit_hook audit",
+        description="Check all Python files in the git index, for instance "
+        "after changing the configuration. An interrupted audit resumes "
+        "where it stopped.")
+
+    _add_pep8_arguments(parser)
+    _add_check_arguments(parser)
+    _add_shard_arguments(parser)
+
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="check all files again instead of resuming an interrupted audit")
+
+    args = parser.parse_args(argv)
+
+    result = audit_repo(
+        pep8_command=args.pep8_command,
+        pep8_params=args.pep8_params,
+        config=args.config,
+        max_violations_per_file=args.max_violations_per_file,
+        engine=args.engine,
+        jobs=args.jobs,
+        cache=args.cache,
+        baseline=args.baseline,
+        fail_fast=args.fail_fast,
+        include=args.include,
+        exclude=args.exclude,
+        restart=args.restart,
+        shard=args.shard,
+        shard_by=args.shard_by,
+        report=args.report)
+    sys.exit(0 if result else 1)
+
+
+def merge_reports_main(argv):
+    """ Main function of the merge-reports command """
+    parser = argparse.ArgumentParser(
+        prog="git_pep8_commit_hook merge-reports",
+        description="Combine the reports written by every shard of a "
+        "check. Fails if a shard failed or its report is missing.")
+
+    parser.add_argument(
+        "reports",
+        nargs="+",
+        help="the reports written with --report")
+
+    args = parser.parse_args(argv)
+
+    try:
+        result = merge_reports(args.reports)
+    except (IOError, OSError, ValueError, KeyError) as error:
+        parser.error("Invalid reports: {}".format(error))
+
+    for failed_file in result["failed_files"]:
+        print("{}\t\tFAILED".format(failed_file))
+    for index in result["missing"]:
+        print("Missing the report of shard {}/{}".format(
+            index, result["count"]))
+    print("{} files checked by {} shards, {} failed".format(
+        result["checked"], result["count"], len(result["failed_files"])))
+    sys.exit(0 if result["passed"] else 1)
+
+
+def work_main(argv):
+    """ Main function of the work command """
+    parser = argparse.ArgumentParser(
+        prog="git_pep8_commit_hook work",
+        description="Check the Python files in the git index, or changed in "
+        "a range, together with other runners sharing a queue directory. "
+        "Every runner claims batches of files until none are left.")
+
+    parser.add_argument(
+        "queue",
+        help=(
+            "directory shared by the runners, such as a directory on NFS "
+            "or a CI cache volume. Use a new directory for every check"))
+
+    _add_pep8_arguments(parser)
+    _add_check_arguments(parser)
+
+    parser.add_argument(
+        "--range",
+        help=(
+            "check the files changed between two commits instead of all "
+            "files in the index"))
+
+    parser.add_argument(
+        "--batch-size",
+        default=50,
+        type=int,
+        help="number of files claimed at a time. Default: 50")
+
+    parser.add_argument(
+        "--lease-time",
+        default=600,
+        type=int,
+        help=(
+            "seconds after which the batch of a runner that didn't finish "
+            "it is checked by another runner. Default: 600"))
+
+    args = parser.parse_args(argv)
+
+    if args.range and not GitRepo().valid_revisions([args.range]):
+        parser.error("Invalid --range: {}".format(args.range))
+
+    result = check_queue(
+        args.queue,
+        revision_range=args.range,
+        pep8_command=args.pep8_command,
+        pep8_params=args.pep8_params,
+        config=args.config,
+        max_violations_per_file=args.max_violations_per_file,
+        engine=args.engine,
+        jobs=args.jobs,
+        cache=args.cache,
+        baseline=args.baseline,
+        fail_fast=args.fail_fast,
+        include=args.include,
+        exclude=args.exclude,
+        batch_size=args.batch_size,
+        lease_time=args.lease_time)
+    sys.exit(0 if result else 1)
+
+
+def watch_main(argv):
+    """ Main function of the watch command """
+    parser = argparse.ArgumentParser(
+        prog="git_pep8_commit_hook watch",
+        description="Check the Python files of the working tree as they are "
+        "saved, and cache the results for the pre-commit hook run with "
+        "--cache. Runs until interrupted. Needs Linux.")
+
+    _add_pep8_arguments(parser)
+    _add_check_arguments(parser, cache=False, fail_fast=False)
+
+    parser.add_argument(
+        "--delay",
+        default=0.2,
+        type=float,
+        help=(
+            "seconds a file must stay unchanged before it is checked. "
+            "Default: 0.2"))
+
+    args = parser.parse_args(argv)
+
+    try:
+        watch_repo(
+            pep8_command=args.pep8_command,
+            pep8_params=args.pep8_params,
+            config=args.config,
+            max_violations_per_file=args.max_violations_per_file,
+            engine=args.engine,
+            jobs=args.jobs,
+            baseline=args.baseline,
+            include=args.include,
+            exclude=args.exclude,
+            delay=args.delay)
+    except KeyboardInterrupt:
+        pass
+    except OSError as error:
+        print("Cannot watch the working tree: {}".format(error))
+        sys.exit(1)
+    sys.exit(0)
+
+
+def serve_main(argv):
+    """ Main function of the hook server """
+    global _MEMORY_RESULTS, _SERVER_ENGINES  # pylint: disable=global-statement
+
+    parser = argparse.ArgumentParser(
+        prog="git_pep8_commit_hook serve",
+        description="Run a server keeping pep8, the configs and the recent "
+        "results loaded. The git_pep8_commit_hook command sends the commits "
+        "to it, and checks them itself if no server is running. Runs until "
+        "interrupted.")
+
+    parser.add_argument(
+        "--socket",
+        default=socket_path(),
+        help=(
+            "path of the Unix socket to listen on. Default: "
+            "$GIT_PEP8_COMMIT_HOOK_SOCKET, or git_pep8_commit_hook.sock in "
+            "$XDG_RUNTIME_DIR"))
+
+    parser.add_argument(
+        "--max-results",
+        default=10000,
+        type=int,
+        help="number of results kept in memory. Default: 10000")
+
+    args = parser.parse_args(argv)
+
+    _MEMORY_RESULTS = LRU(args.max_results)
+    _SERVER_ENGINES = {}
+    try:
+        server = HookServer(args.socket, main)
+    except (IOError, OSError) as error:
+        print("Cannot listen on {}: {}".format(args.socket, error))
+        sys.exit(1)
+    print("Listening on {}".format(args.socket))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for _, checker in _SERVER_ENGINES.values():
+            checker.close()
+    sys.exit(0)
+
+
+def pre_push_main(argv):
+    """ Main function of the pre-push hook """
+    parser = argparse.ArgumentParser(
+        prog="git_pep8_commit_hook pre-push",
+        description="Git pre-push hook checking the Python files changed by "
+        "every commit about to be pushed. Git passes the refs to push on "
+        "stdin. Content changed by several commits is checked once.")
+
+    parser.add_argument(
+        "remote",
+        nargs="?",
+        help=(
+            "name of the remote pushed to. Commits on its remote-tracking "
+            "branches are not checked. Default: all remotes"))
+
+    parser.add_argument(
+        "url",
+        nargs="?",
+        help="URL of the remote pushed to. Unused")
+
+    _add_pep8_arguments(parser)
+    _add_check_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    result = check_push(
+        getattr(sys.stdin, "buffer", sys.stdin),
+        remote=args.remote,
+        pep8_command=args.pep8_command,
+        pep8_params=args.pep8_params,
+        config=args.config,
+        max_violations_per_file=args.max_violations_per_file,
+        engine=args.engine,
+        jobs=args.jobs,
+        cache=args.cache,
+        baseline=args.baseline,
+        fail_fast=args.fail_fast,
+        include=args.include,
+        exclude=args.exclude)
+    sys.exit(0 if result else 1)
+
+
+def pre_receive_main(argv):
+    """ Main function of the pre-receive hook """
+    parser = argparse.ArgumentParser(
+        prog="git_pep8_commit_hook pre-receive",
+        description="Git pre-receive hook checking the Python files changed "
+        "by every pushed commit, for servers with bare repositories. Git "
+        "passes the updated refs on stdin. The results are cached for all "
+        "repositories of the host.")
+
+    _add_pep8_arguments(parser)
+    _add_check_arguments(parser, cache=False)
+
+    parser.add_argument(
+        "--cache-dir",
+        help=(
+            "directory holding the results shared by all repositories. "
+            "Default: git_pep8_commit_hook in $XDG_CACHE_HOME or ~/.cache"))
+
+    args = parser.parse_args(argv)
+
+    result = check_receive(
+        getattr(sys.stdin, "buffer", sys.stdin),
+        pep8_command=args.pep8_command,
+        pep8_params=args.pep8_params,
+        config=args.config,
+        max_violations_per_file=args.max_violations_per_file,
+        engine=args.engine,
+        jobs=args.jobs,
+        cache_directory=args.cache_dir,
+        baseline=args.baseline,
+        fail_fast=args.fail_fast,
+        include=args.include,
+        exclude=args.exclude)
+    sys.exit(0 if result else 1)
+
+
+def _add_pep8_arguments(parser):
+    """ Adds the arguments controlling how pep8 is run to the parser """
+    parser.add_argument(
+        "--pep8-command",
+        default="pep8",
+        help="path to pep8 executable. Default: pep8")
+
+    parser.add_argument(
+        "--pep8-params",
+        help="custom pep8 parameters to add to the pep8 command.")
+
+    parser.add_argument(
+        "--config",
+        default="setup.cfg",
+        help=(
+            "path to pep8 config file file. Options in the config will "
+            "override the command line parameters. Default: setup.cfg"))
+
+    parser.add_argument(
+        "--engine",
+        default="subprocess",
+        choices=["subprocess", "batch", "inprocess"],
+        help=(
+            "how to run pep8. 'subprocess' runs the pep8 command for every "
+            "file, 'batch' runs the pep8 command once for many files, "
+            "'inprocess' checks all files with pep8 imported into the hook "
+            "itself. Default: subprocess"))
+
+    parser.add_argument(
+        "--jobs",
+        default=1,
+        type=int,
+        help=(
+            "number of files checked in parallel, either by worker "
+            "processes of the inprocess engine or by pep8 commands running "
+            "at the same time. 0 means one per CPU. Default: 1"))
+
+
+def _add_check_arguments(parser, cache=True, fail_fast=True):
+    """ Adds the arguments controlling which violations fail to the parser
+
+    :type cache: bool
+    :param cache: Add the --cache argument
+    :type fail_fast: bool
+    :param fail_fast: Add the --fail-fast argument
+    """
+    parser.add_argument(
+        "--max-violations-per-file",
+        default=0,
+        type=int,
+        help=(
+            "maximum number of violations. Files with a higher violation "
+            "count fail. Default: 0"))
+
+    if cache:
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            help=(
+                "cache the results under the .git directory and skip files "
+                "whose staged content was already checked with the same "
+                "pep8 version and options"))
+
+    parser.add_argument(
+        "--baseline",
+        help=(
+            "path to a baseline file created by the baseline command. Only "
+            "violations missing from the baseline are counted"))
+
+    if fail_fast:
+        parser.add_argument(
+            "--fail-fast",
+            action="store_true",
+            help=(
+                "stop checking as soon as a file fails. Commits check the "
+                "files that failed last time first"))
+
+    parser.add_argument(
+        "--include",
+        help=(
+            "whitespace separated glob patterns of the files to check, "
+            "such as 'src/ *.py'. Default: all files"))
+
+    parser.add_argument(
+        "--exclude",
+        help=(
+            "whitespace separated glob patterns of the files not to check, "
+            "such as 'vendor/ migrations/ *_pb2.py'"))
+
+
+def _add_shard_arguments(parser):
+    """ Adds the arguments splitting a check over several machines """
+    parser.add_argument(
+        "--shard",
+        type=_shard_type,
+        help=(
+            "only check the files of one shard, like '2/4' for the second "
+            "of four machines checking the files"))
+
+    parser.add_argument(
+        "--shard-by",
+        default="path",
+        choices=["path", "size"],
+        help=(
+            "how files are assigned to shards. 'path' hashes the path of "
+            "every file, 'size' balances the sizes of the shards. "
+            "Default: path"))
+
+    parser.add_argument(
+        "--report",
+        help=(
+            "write the result to this JSON file, to be combined with the "
+            "reports of the other shards by the merge-reports command"))
+
+
+def _shard_type(text):
+    """ Parses the --shard argument """
+    try:
+        return parse_shard(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
 def check_repo(
         pep8_command="pep8",
         pep8_params=None,
         config="setup.cfg",
-        max_violations_per_file=0):
+        max_violations_per_file=0,
+        engine="subprocess",
+        jobs=1,
+        cache=False,
+        staged=False,
+        changed_lines_only=False,
+        baseline=None,
+        fail_fast=False,
+        include=None,
+        exclude=None,
+        revision_range=None,
+        shard=None,
+        shard_by="path",
+        report=None):
     """ Main function doing the checks
 
+    The files staged for the commit are checked, or with a revision range
+    the files changed between two commits, read from git at the second.
+
     :type max_violations_per_file: int
     :param max_violations_per_file: Max violations per file to pass the commit
     :type pep8_command: str
@@ -98,77 +665,816 @@ def check_repo(
     :param config: Path to config file
     :type pep8_params: str
     :param pep8_params: Custom pep8 parameters to add to the pep8 command
+    :type engine: str
+    :param engine: Either "subprocess", "batch" or "inprocess"
+    :type jobs: int
+    :param jobs: Number of files checked in parallel. 0 means one per CPU
+    :type cache: bool
+    :param cache: Skip files whose staged content was already checked
+    :type staged: bool
+    :param staged: Check the staged content instead of the working tree
+    :type changed_lines_only: bool
+    :param changed_lines_only: Only count violations on changed lines
+    :type baseline: str
+    :param baseline: Path to a baseline file of violations not to count
+    :type fail_fast: bool
+    :param fail_fast: Stop checking as soon as a file fails
+    :type include: str
+    :param include: Patterns of the files to check. Default: all files
+    :type exclude: str
+    :param exclude: Patterns of the files not to check
+    :type revision_range: str
+    :param revision_range: Commits to check the changes between, like
+                           "base..head" or "base...head" as `git diff`
+                           takes them
+    :type shard: tuple
+    :param shard: The index and the count of the shard of the files to
+                  check. Default: all files
+    :type shard_by: str
+    :param shard_by: Either "path" or "size"
+    :type report: str
+    :param report: Path of a JSON report of the result
     """
+    repo = GitRepo()
+    state_directory = os.path.join(repo.git_dir, "pep8_commit_hook")
+
+    # Load any pre-commit-hooks options from setup.cfg, tox.ini and
+    # pyproject.toml (if there are any)
+    options, path_filter, cache_directory, output_filters = _check_options(
+        config, state_directory,
+        pep8_command=pep8_command,
+        pep8_params=pep8_params,
+        max_violations_per_file=max_violations_per_file,
+        engine=engine,
+        jobs=jobs,
+        cache=cache,
+        staged=staged,
+        changed_lines_only=changed_lines_only,
+        baseline=baseline,
+        fail_fast=fail_fast,
+        include=include,
+        exclude=exclude)
+    staged = options.staged
+
+    # The patterns are passed to git, so excluded files are never listed
+    pathspecs = path_filter.pathspecs()
+
     # List of checked files and their results
     python_files = []
+    blob_shas = {}
 
-    # Find Python files
-    for filename in _get_list_of_committed_files():
-        try:
-            if _is_python_file(filename):
-                python_files.append((filename))
-        except IOError:
-            print("File not found (probably deleted): {}\t\tSKIPPED".format(
-                filename))
+    # The files of a revision range are not checked out, so their content is
+    # always read from git
+    revisions = ["--cached"]
+    merge_heads = repo.merge_heads()
+    if revision_range:
+        revisions = [revision_range]
+        merge_heads = []
+        staged = True
+
+    # The changed lines are numbered like the staged content, which differs
+    # from the working tree when only some changes are staged
+    if options.changed_lines_only:
+        staged = True
+
+    # Find Python files. Files without the extension are classified by the
+    # start of their staged blob, and the result is remembered by blob SHA.
+    classifications = ClassificationCache(
+        os.path.join(state_directory, "classification"))
+    entries = [
+        entry for entry in repo.diff_entries(revisions, "ADM", pathspecs)
+        if path_filter(entry.path)]
+
+    # When committing a merge, the content taken unchanged from one of the
+    # parents was checked on that branch already. Only the paths differing
+    # from every parent hold conflict resolutions or local changes.
+    for merge_head in merge_heads:
+        changed = set(
+            entry.path
+            for entry in repo.staged_entries("AMT", merge_head, pathspecs))
+        entries = [entry for entry in entries
+                   if entry.status == "D" or entry.path in changed]
+    config_tree = ConfigTree(config)
+    with repo.blob_reader() as reader:
+        python_entries = _python_entries(
+            entries, reader, classifications, config_tree=config_tree)
+        if shard:
+            python_entries = _shard_entries(
+                repo, python_entries, shard, shard_by)
+        for entry in python_entries:
+            python_files.append(entry.path)
+            blob_shas[entry.path] = entry.new_sha
+    classifications.save()
 
     # Don't do anything if there are no Python files
     if len(python_files) == 0:
+        if report:
+            write_report(report, shard or (1, 1), 0, [], True)
         sys.exit(0)
 
-    # Load any pre-commit-hooks options from a setup.cfg file (if there is one)
-    if os.path.exists(config):
-        conf = configparser.SafeConfigParser()
-        conf.read(config)
-        if conf.has_option("pep8_pre_commit_hook", "pep8-command"):
-            pep8_command = conf.get("pep8_pre_commit_hook", "pep8-command")
+    # Violations on unchanged lines are dropped before the baseline is
+    # matched
+    if options.changed_lines_only:
+        output_filters.insert(
+            0, _changed_lines_filter(repo.changed_lines(revisions)))
+
+    checked_files = []
+    failed_files = []
+    if not options.fail_fast:
+        # Set the exit code
+        result = check_files(
+            python_files, options.pep8_command, config,
+            options.pep8_params, options.max_violations_per_file,
+            options.engine, options.jobs, cache_directory, blob_shas, staged,
+            output_filters, False, checked_files, failed_files,
+            config_tree=config_tree)
+    else:
+        # Check the files that failed last time first, and remember the
+        # ones failing now. Files left unchecked keep their old state.
+        last_failures_path = os.path.join(state_directory, "last_failures")
+        last_failures = _read_file_list(last_failures_path)
+        python_files.sort(
+            key=lambda python_file: python_file not in last_failures)
+
+        result = check_files(
+            python_files, options.pep8_command, config,
+            options.pep8_params, options.max_violations_per_file,
+            options.engine, options.jobs, cache_directory, blob_shas, staged,
+            output_filters, True, checked_files, failed_files,
+            config_tree=config_tree)
+
+        failures = set(failed_files)
+        failures.update(last_failures.difference(checked_files))
+        _write_file_list(last_failures_path, sorted(failures))
+
+    if report:
+        write_report(report, shard or (1, 1), len(checked_files),
+                     failed_files, result)
+    return result
+
+
+def audit_repo(
+        pep8_command="pep8",
+        pep8_params=None,
+        config="setup.cfg",
+        max_violations_per_file=0,
+        engine="subprocess",
+        jobs=1,
+        cache=False,
+        baseline=None,
+        fail_fast=False,
+        include=None,
+        exclude=None,
+        restart=False,
+        shard=None,
+        shard_by="path",
+        report=None):
+    """ Checks all Python files in the index
+
+    The files are streamed from a single `git ls-files` and checked in
+    chunks of AUDIT_CHUNK_SIZE files read from git, so the memory used
+    doesn't grow with the size of the repository. Every checked blob is
+    recorded in a checkpoint, and a later audit with the same pep8
+    configuration skips the blobs recorded by an interrupted one. Blobs in
+    several files are checked once.
+
+    Sharding by path keeps the memory flat, while sharding by size lists
+    the Python files of the whole index first.
+
+    :type restart: bool
+    :param restart: Ignore the checkpoint of an interrupted audit
+    :type shard: tuple
+    :param shard: The index and the count of the shard of the files to
+                  check. Default: all files
+    :type shard_by: str
+    :param shard_by: Either "path" or "size"
+    :type report: str
+    :param report: Path of a JSON report of the result
+    :rtype: bool
+    :returns: True if all files passed
+    """
+    repo = GitRepo()
+    state_directory = os.path.join(repo.git_dir, "pep8_commit_hook")
+    options, path_filter, cache_directory, output_filters = _check_options(
+        config, state_directory,
+        pep8_command=pep8_command,
+        pep8_params=pep8_params,
+        max_violations_per_file=max_violations_per_file,
+        engine=engine,
+        jobs=jobs,
+        cache=cache,
+        baseline=baseline,
+        fail_fast=fail_fast,
+        include=include,
+        exclude=exclude)
+
+    try:
+        fingerprint = create_engine(
+            options.engine, options.pep8_command, config,
+            options.pep8_params).fingerprint()
+    except OSError:
+        print("An error occurred. Is pep8 installed?")
+        sys.exit(1)
+    checkpoint_path = os.path.join(state_directory, "audit")
+    if shard:
+        # Shards run on the same machine don't share their progress
+        checkpoint_path += ".{}of{}".format(*shard)
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path, fingerprint)
+    failures = sum(1 for passed in checkpoint.results.values() if not passed)
+    if checkpoint.results:
+        print("Resuming the audit after {} checked files, {} failed".format(
+            len(checkpoint.results), failures))
+
+    # A blob is checked once for every config it is checked with, and for
+    # every path with a baseline, which is matched by path
+    config_tree = ConfigTree(config)
+    by_path = bool(options.baseline)
+    classifications = ClassificationCache(
+        os.path.join(state_directory, "classification"))
+    entries = (
+        entry for entry in repo.index_entries(path_filter.pathspecs())
+        if path_filter(entry.path) and checkpoint.get(
+            _check_key(config_tree, entry, by_path)) is None)
+    stopped = False
+    failed_files = []
+    with repo.blob_reader() as reader, _kept_engines() as engines:
+        # The index has no deletions, so the entries are only streamed once
+        python_entries = _python_entries(entries, reader, classifications, {})
+        if shard:
+            python_entries = iter(_shard_entries(
+                repo, python_entries, shard, shard_by))
+        while not stopped:
+            blob_shas = collections.OrderedDict()
+            keys = {}
+            chunk_keys = set()
+            for entry in python_entries:
+                key = _check_key(config_tree, entry, by_path)
+                if key not in chunk_keys and checkpoint.get(key) is None:
+                    blob_shas[entry.path] = entry.new_sha
+                    keys[entry.path] = key
+                    chunk_keys.add(key)
+                if len(blob_shas) >= AUDIT_CHUNK_SIZE:
+                    break
+            if not blob_shas:
+                break
+
+            checked_files = []
+            chunk_failures = []
+            if not check_files(
+                    list(blob_shas), options.pep8_command, config,
+                    options.pep8_params, options.max_violations_per_file,
+                    options.engine, options.jobs, cache_directory, blob_shas,
+                    True, output_filters, options.fail_fast, checked_files,
+                    chunk_failures, reader, engines, config_tree):
+                stopped = options.fail_fast
+            for python_file in checked_files:
+                checkpoint.put(
+                    keys[python_file], python_file not in chunk_failures)
+            checkpoint.flush()
+            classifications.save()
+            failures += len(chunk_failures)
+            failed_files.extend(chunk_failures)
+
+    if stopped:
+        checkpoint.close()
+    else:
+        checkpoint.remove()
+    print("Audited {} files, {} failed".format(
+        len(checkpoint.results), failures))
+    if report:
+        # The files that failed before resuming are only known by content
+        write_report(report, shard or (1, 1), len(checkpoint.results),
+                     failed_files, failures == 0)
+    return failures == 0
+
+
+def check_queue(
+        queue_directory,
+        revision_range=None,
+        pep8_command="pep8",
+        pep8_params=None,
+        config="setup.cfg",
+        max_violations_per_file=0,
+        engine="subprocess",
+        jobs=1,
+        cache=False,
+        baseline=None,
+        fail_fast=False,
+        include=None,
+        exclude=None,
+        batch_size=50,
+        lease_time=600,
+        owner=None):
+    """ Checks batches of files claimed from a queue shared by runners
+
+    The first runner lists the Python files of the index like an audit, or
+    of a revision range, and fills the queue with batches of them. Every
+    runner then claims batches and checks the files read from git, until
+    no batch is left. The runners need the same commits, but no checkout.
+
+    :type queue_directory: str
+    :param queue_directory: The directory shared by the runners
+    :type revision_range: str
+    :param revision_range: Commits to check the changes between. Default:
+                           all files in the index
+    :type batch_size: int
+    :param batch_size: Number of files claimed at a time
+    :type lease_time: int
+    :param lease_time: Seconds after which the batch of another runner is
+                       claimed again
+    :type owner: str
+    :param owner: Name of the runner. Default: host name and process ID
+    :rtype: bool
+    :returns: True if all files checked by this runner passed
+    """
+    repo = GitRepo()
+    state_directory = os.path.join(repo.git_dir, "pep8_commit_hook")
+    options, path_filter, cache_directory, output_filters = _check_options(
+        config, state_directory,
+        pep8_command=pep8_command,
+        pep8_params=pep8_params,
+        max_violations_per_file=max_violations_per_file,
+        engine=engine,
+        jobs=jobs,
+        cache=cache,
+        baseline=baseline,
+        fail_fast=fail_fast,
+        include=include,
+        exclude=exclude)
+
+    queue = WorkQueue(queue_directory, owner, lease_time)
+    config_tree = ConfigTree(config)
+    with repo.blob_reader() as reader, _kept_engines() as engines:
+        if not queue.exists():
+            classifications = ClassificationCache(
+                os.path.join(state_directory, "classification"))
+            if revision_range:
+                entries = [
+                    entry for entry in repo.diff_entries(
+                        [revision_range], "ADM", path_filter.pathspecs())
+                    if path_filter(entry.path)]
+                deleted_paths = None
+            else:
+                entries = (
+                    entry for entry in repo.index_entries(
+                        path_filter.pathspecs())
+                    if path_filter(entry.path))
+                deleted_paths = {}
+            # A blob is checked once for every config, and for every path
+            # with a baseline
+            queue.fill(
+                ([entry.path, entry.new_sha] for entry in _unique_blobs(
+                    _python_entries(
+                        entries, reader, classifications, deleted_paths),
+                    config_tree, bool(options.baseline))),
+                batch_size)
+            classifications.save()
+        queue.wait(lease_time)
+
+        checked = 0
+        failed_files = []
+        while True:
+            batch = queue.claim()
+            if batch is None:
+                break
+            blob_shas = collections.OrderedDict(batch.items)
+            checked_files = []
+            batch_failures = []
+            # The lease is renewed after every file, so slow batches aren't
+            # claimed by another runner while they are being checked
+            check_files(
+                list(blob_shas), options.pep8_command, config,
+                options.pep8_params, options.max_violations_per_file,
+                options.engine, options.jobs, cache_directory, blob_shas, True,
+                output_filters + [_renew_filter(queue, batch)],
+                options.fail_fast, checked_files, batch_failures, reader,
+                engines, config_tree)
+            checked += len(checked_files)
+            failed_files.extend(batch_failures)
+            # A batch stopped by a failure is done as well, as the check
+            # fails anyway
+            queue.complete(batch, {
+                "owner": queue.owner,
+                "checked": len(checked_files),
+                "failed_files": batch_failures,
+            })
+            if options.fail_fast and batch_failures:
+                break
+
+    print("Checked {} files, {} failed".format(checked, len(failed_files)))
+    if queue.finished():
+        results = list(queue.results())
+        print("All batches done: {} files checked by all runners, "
+              "{} failed".format(
+                  sum(result["checked"] for result in results),
+                  sum(len(result["failed_files"]) for result in results)))
+    return not failed_files
+
+
+def watch_repo(
+        pep8_command="pep8",
+        pep8_params=None,
+        config="setup.cfg",
+        max_violations_per_file=0,
+        engine="subprocess",
+        jobs=1,
+        baseline=None,
+        include=None,
+        exclude=None,
+        delay=0.2,
+        changes=None):
+    """ Checks the Python files of the working tree as they are saved
+
+    The results are stored in the cache of the pre-commit hook by the blob
+    SHA of the checked content, so when the saved content is committed, the
+    hook run with the cache doesn't check it again. The process stays
+    alive, so pep8 is only imported once.
+
+    :type delay: float
+    :param delay: Seconds a file must stay unchanged before it is checked
+    :type changes: iterable
+    :param changes: Lists of the saved files, relative to the repository
+                    root. Default: the files saved in the working tree
+    """
+    repo = GitRepo()
+    options, path_filter, _, output_filters = _check_options(
+        config,
+        pep8_command=pep8_command,
+        pep8_params=pep8_params,
+        max_violations_per_file=max_violations_per_file,
+        engine=engine,
+        jobs=jobs,
+        baseline=baseline,
+        include=include,
+        exclude=exclude)
+
+    # The hook reads the results from here with the cache enabled
+    cache_directory = os.path.join(
+        repo.git_dir, "pep8_commit_hook", "results")
+
+    if changes is None:
+        changes = watch_tree(".", delay)
+    config_tree = ConfigTree(config)
+    with _kept_engines() as engines:
+        for saved_files in changes:
+            # The configs are looked up again once one of them is saved
+            if any(os.path.basename(saved_file) in CONFIG_NAMES
+                   for saved_file in saved_files):
+                config_tree = ConfigTree(config)
+            python_files = []
+            for python_file in saved_files:
+                if not path_filter(python_file):
+                    continue
+                try:
+                    if _is_python_file(python_file):
+                        python_files.append(python_file)
+                except (IOError, OSError):
+                    # Removed since saved, like the files without blob SHA
+                    pass
+            blob_shas = dict(
+                (python_file, file_blob_sha(python_file))
+                for python_file in python_files)
+            python_files = [
+                python_file for python_file in python_files
+                if blob_shas[python_file] is not None]
+            if python_files:
+                check_files(
+                    python_files, options.pep8_command, config,
+                    options.pep8_params, options.max_violations_per_file,
+                    options.engine, options.jobs, cache_directory, blob_shas,
+                    False, output_filters, engines=engines,
+                    config_tree=config_tree)
+
+
+def check_push(
+        ref_lines,
+        remote=None,
+        pep8_command="pep8",
+        pep8_params=None,
+        config="setup.cfg",
+        max_violations_per_file=0,
+        engine="subprocess",
+        jobs=1,
+        cache=False,
+        baseline=None,
+        fail_fast=False,
+        include=None,
+        exclude=None):
+    """ Checks the files changed by every commit about to be pushed
+
+    The commits reachable from the pushed refs but not from the remote refs
+    are listed by a single `git rev-list` and their changes by a single
+    `git diff-tree`. The files are read from git, and a blob changed by
+    several commits is only checked in the first. With the cache, the
+    files checked by the pre-commit hook are not checked again.
+
+    :type ref_lines: iterable
+    :param ref_lines: The "<local ref> <local sha> <remote ref> <remote
+                      sha>" lines git passes to the pre-push hook
+    :type remote: str
+    :param remote: Name of the remote pushed to. Default: all remotes
+    :rtype: bool
+    :returns: True if all commits passed
+    """
+    repo = GitRepo()
+    state_directory = os.path.join(repo.git_dir, "pep8_commit_hook")
+    options, path_filter, cache_directory, output_filters = _check_options(
+        config, state_directory,
+        pep8_command=pep8_command,
+        pep8_params=pep8_params,
+        max_violations_per_file=max_violations_per_file,
+        engine=engine,
+        jobs=jobs,
+        cache=cache,
+        baseline=baseline,
+        fail_fast=fail_fast,
+        include=include,
+        exclude=exclude)
+
+    # Deleted refs push no commits, and a new ref pushes the commits the
+    # remote doesn't have yet
+    revisions = []
+    for line in ref_lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        fields = line.split()
+        if len(fields) != 4 or not fields[1].strip("0"):
+            continue
+        revisions.append(fields[1])
+        if fields[3].strip("0"):
+            revisions.append("^" + fields[3])
+    if not revisions:
+        return True
+    revisions.extend("^" + sha for sha in repo.remote_shas(remote))
+
+    return _check_commits(
+        repo, revisions, options, config, path_filter, cache_directory,
+        output_filters, os.path.join(state_directory, "classification"))
+
+
+def check_receive(
+        ref_lines,
+        pep8_command="pep8",
+        pep8_params=None,
+        config="setup.cfg",
+        max_violations_per_file=0,
+        engine="subprocess",
+        jobs=1,
+        cache_directory=None,
+        baseline=None,
+        fail_fast=False,
+        include=None,
+        exclude=None):
+    """ Checks the files changed by every pushed commit on the server
+
+    Works in bare repositories, as all content is read from the object
+    database. The results are cached in a directory shared by all
+    repositories of the host, keyed by the blob SHA and the fingerprint of
+    the pep8 configuration, so content pushed to several repositories or
+    pushed again is checked once.
+
+    :type ref_lines: iterable
+    :param ref_lines: The "<old sha> <new sha> <ref>" lines git passes to
+                      the pre-receive hook
+    :type cache_directory: str
+    :param cache_directory: Directory holding the cached results. Default:
+                            git_pep8_commit_hook in the user cache directory
+    :rtype: bool
+    :returns: True if all commits passed
+    """
+    repo = GitRepo()
+    options, path_filter, _, output_filters = _check_options(
+        config,
+        pep8_command=pep8_command,
+        pep8_params=pep8_params,
+        max_violations_per_file=max_violations_per_file,
+        engine=engine,
+        jobs=jobs,
+        baseline=baseline,
+        fail_fast=fail_fast,
+        include=include,
+        exclude=exclude)
+
+    # The refs are not updated yet, so the commits no ref has are new
+    revisions = []
+    for line in ref_lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        fields = line.split()
+        if len(fields) == 3 and fields[1].strip("0"):
+            revisions.append(fields[1])
+    if not revisions:
+        return True
+    revisions.extend("^" + sha for sha in repo.ref_shas())
+
+    state_directory = cache_directory or host_cache_directory()
+    return _check_commits(
+        repo, revisions, options, config, path_filter,
+        os.path.join(state_directory, "results"), output_filters,
+        os.path.join(state_directory, "classification"))
+
+
+def host_cache_directory():
+    """ Returns the directory holding the results shared by all repositories
+    of the host.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "git_pep8_commit_hook")
+
 
-        if conf.has_option("pep8_pre_commit_hook", "pep8-params"):
-            pep8_params += " " + conf.get("pep8_pre_commit_hook",
-                                          "pep8-params")
+def _check_commits(
+        repo, revisions, options, config, path_filter, cache_directory,
+        output_filters, classification_path):
+    """ Checks the files changed by the commits selected by the revisions
 
-        if conf.has_option("pep8_pre_commit_hook", "max-violations-per-file"):
-            max_violations_per_file = int(conf.get(
-                "pep8_pre_commit_hook", "max-violations-per-file"))
+    A blob changed by several commits is only checked in the first, unless
+    a later commit moves it under another config, or to another path with
+    a baseline. All blobs are read through a single git process.
+    """
+    result = True
+    checked_keys = set()
+    by_path = bool(options.baseline)
+    classifications = ClassificationCache(classification_path)
+    config_tree = ConfigTree(config)
+    commits = repo.commit_entries(
+        repo.rev_list(revisions), "ADM", path_filter.pathspecs())
+    with repo.blob_reader() as reader, _kept_engines() as engines:
+        for commit, entries in commits:
+            entries = [entry for entry in entries
+                       if path_filter(entry.path) and _check_key(
+                           config_tree, entry, by_path) not in checked_keys]
+            python_entries = list(_python_entries(
+                entries, reader, classifications, config_tree=config_tree))
+            blob_shas = collections.OrderedDict(
+                (entry.path, entry.new_sha) for entry in python_entries)
+            checked_keys.update(
+                _check_key(config_tree, entry, by_path)
+                for entry in python_entries)
+            if not blob_shas:
+                continue
+
+            print("Checking commit {}".format(commit))
+            if not check_files(
+                    list(blob_shas), options.pep8_command, config,
+                    options.pep8_params, options.max_violations_per_file,
+                    options.engine, options.jobs, cache_directory, blob_shas,
+                    True, output_filters, options.fail_fast,
+                    blob_reader=reader, engines=engines,
+                    config_tree=config_tree):
+                result = False
+                if options.fail_fast:
+                    commits.close()
+                    break
+    classifications.save()
+    return result
+
+
+def check_file_list(
+        filenames,
+        pep8_command="pep8",
+        pep8_params=None,
+        config="setup.cfg",
+        max_violations_per_file=0,
+        engine="subprocess",
+        jobs=1,
+        baseline=None,
+        fail_fast=False,
+        include=None,
+        exclude=None):
+    """ Checks the Python files among the specified files without asking git
+
+    Runners that already know which files to check pass them here, so no
+    git command is run. The files are checked as they are in the working
+    tree.
+
+    :type filenames: iterable
+    :param filenames: Paths of the files to check
+    :rtype: bool
+    :returns: True if the files passed, including when there are none
+    """
+    options, path_filter, _, output_filters = _check_options(
+        config,
+        pep8_command=pep8_command,
+        pep8_params=pep8_params,
+        max_violations_per_file=max_violations_per_file,
+        engine=engine,
+        jobs=jobs,
+        baseline=baseline,
+        fail_fast=fail_fast,
+        include=include,
+        exclude=exclude)
+
+    python_files = []
+    for filename in filenames:
+        if not path_filter(filename):
+            continue
+        try:
+            if _is_python_file(filename):
+                python_files.append(filename)
+        except IOError:
+            print("File not found: {}\t\tSKIPPED".format(filename))
+
+    if len(python_files) == 0:
+        return True
 
-    # Set the exit code
     return check_files(
-        python_files, pep8_command, config,
-        pep8_params, max_violations_per_file)
+        python_files, options.pep8_command, config,
+        options.pep8_params, options.max_violations_per_file,
+        options.engine, options.jobs, output_filters=output_filters,
+        fail_fast=options.fail_fast)
 
 
 def check_files(
-        python_files, pep8, config, pep8_params, max_violations_per_file):
+        python_files, pep8, config, pep8_params, max_violations_per_file,
+        engine="subprocess", jobs=1, cache_directory=None, blob_shas=None,
+        staged=False, output_filters=(), fail_fast=False,
+        checked_files=None, failed_files=None, blob_reader=None,
+        engines=None, config_tree=None):
+    """ Checks specified files using pep8
+
+    If a cache directory and the blob SHAs of the files are specified, files
+    whose blob was already checked are not checked again. If `staged` is
+    set, the blobs are read from git and checked instead of the files. The
+    output filters are called with the file, its pep8 output and a function
+    returning the checked content before the violations are counted, and
+    return the output to count. With `fail_fast`, checking stops when the
+    first file fails. The checked and failed files are appended to the
+    `checked_files` and `failed_files` lists if specified.
+
+    Every file is checked with the pep8 config nearest to it, falling back
+    to `config`, and the files sharing a config are checked together. The
+    results are still reported in the order of the files. The blobs are
+    read with `blob_reader` if specified, so callers checking many groups
+    of files keep a single git process. Likewise the engines are kept in
+    the `engines` dict by config if specified, so their worker processes
+    are started once, and the caller closes them. The configs are looked
+    up in `config_tree` if specified, so callers checking many groups of
+    files read every directory once.
+    """
+    reader = blob_reader or BlobReader()
+    if config_tree is None:
+        config_tree = ConfigTree(config)
+
+    def read_blob(python_file):
+        """ Returns the staged content of the file. """
+        return reader.read(blob_shas[python_file])
+
+    try:
+        return _check_files(
+            python_files, pep8, config, pep8_params, max_violations_per_file,
+            engine, jobs, cache_directory, blob_shas,
+            read_blob if staged else None, output_filters, fail_fast,
+            [] if checked_files is None else checked_files,
+            [] if failed_files is None else failed_files, engines,
+            config_tree)
+    finally:
+        if blob_reader is None:
+            reader.close()
+
+
+def _check_files(
+        python_files, pep8, config, pep8_params, max_violations_per_file,
+        engine, jobs, cache_directory, blob_shas, read_blob, output_filters,
+        fail_fast, checked_files, failed_files, engines, config_tree):
     """ Checks specified files using pep8 """
     all_filed_passed = True
 
+    groups = config_tree.group(python_files)
+    results = _group_results(
+        groups, pep8, pep8_params, engine, jobs, cache_directory, blob_shas,
+        read_blob, engines)
+
+    # The groups are checked one after the other, so the outputs of files
+    # checked before their turn are kept until they are reported
+    positions = collections.defaultdict(collections.deque)
+    for index, python_file in enumerate(python_files):
+        positions[python_file].append(index)
+    checked_order = iter([positions[python_file].popleft()
+                          for group_files in groups.values()
+                          for python_file in group_files])
+    outputs = {}
+
     i = 1
-    for python_file in python_files:
+    for index, python_file in enumerate(python_files):
 
         # Start pep8ing
         sys.stdout.write("Running pep8 on {} (file {}/{})..\t".format(
             python_file, i, len(python_files)))
         sys.stdout.flush()
         try:
-            command = [pep8]
-
-            if pep8_params:
-                command += pep8_params.split()
-                if "--config" not in pep8_params:
-                    command.append("--config={}".format(config))
-            else:
-                command.append("--config={}".format(config))
-
-            command.append(python_file)
-
-            proc = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE)
-            out, _ = proc.communicate()
+            while index not in outputs:
+                outputs[next(checked_order)] = next(results)
+            out = outputs.pop(index)
         except OSError:
             print("\nAn error occurred. Is pep8 installed?")
             sys.exit(1)
 
+        for output_filter in output_filters:
+            out = output_filter(python_file, out, read_blob or _read_file)
+
         # Verify the violation count
         violations = _parse_violations(out)
         if violations <= int(max_violations_per_file):
@@ -183,62 +1489,455 @@ def check_files(
         if "FAILED" in status:
             print(out.decode('utf-8'))
 
+        checked_files.append(python_file)
+        if "FAILED" in status:
+            failed_files.append(python_file)
+
         # Increment parsed files
         i += 1
 
+        # Cancel the remaining checks once the commit is known to fail
+        if fail_fast and not all_filed_passed:
+            results.close()
+            if i <= len(python_files):
+                print("Stopped after the first failing file. {} files were "
+                      "not checked.".format(len(python_files) - i + 1))
+            break
+
     return all_filed_passed
 
 
-def _execute(cmd):
-    """ Executes specified command """
-    process = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    stdout, stderr = process.communicate()
-    status = process.poll()
-    return ExecutionResult(status, stdout, stderr)
+def _group_results(groups, pep8, pep8_params, engine, jobs, cache_directory,
+                   blob_shas, read_blob, engines=None):
+    """ Yields the pep8 output of the files of every group in order.
 
+    The files of every group are checked by an engine using the config of
+    the group, taken from `engines` if specified, or kept by the hook
+    server. Closing the generator cancels the running checks.
+    """
+    for config, python_files in groups.items():
+        kept = True
+        checker = (engines or {}).get(config) or _server_engine(
+            engine, pep8, config, pep8_params, jobs)
+        if checker is None:
+            checker = create_engine(engine, pep8, config, pep8_params, jobs)
+            if engines is not None:
+                engines[config] = checker
+            else:
+                kept = False
+
+        # Look up the files checked before
+        cache = None
+        cached = {}
+        if cache_directory and blob_shas:
+            cache = ResultCache(cache_directory, checker.fingerprint(
+                os.path.join(os.path.dirname(cache_directory), "configs")),
+                _MEMORY_RESULTS)
+        elif _MEMORY_RESULTS is not None and blob_shas:
+            cache = ResultCache(None, checker.fingerprint(), _MEMORY_RESULTS)
+        if cache is not None:
+            for python_file in python_files:
+                out = cache.get(blob_shas[python_file], python_file)
+                if out is not None:
+                    cached[python_file] = out
+
+        results = checker.check_many(
+            [python_file for python_file in python_files
+             if python_file not in cached], read_blob)
+        try:
+            for python_file in python_files:
+                if python_file in cached:
+                    yield cached[python_file]
+                else:
+                    out = next(results)
+                    _store_result(
+                        cache, blob_shas, python_file, out, read_blob)
+                    yield out
+        finally:
+            results.close()
+            if not kept:
+                checker.close()
+
+
+def _server_engine(engine, pep8, config, pep8_params, jobs):
+    """ Returns the engine the hook server keeps for a config, or None
+    outside of the server.
+
+    The engine is created again when the content of the config files
+    changes, and the previous one is closed.
+    """
+    if _SERVER_ENGINES is None:
+        return None
+    key = (engine, pep8, os.path.abspath(config), pep8_params, jobs)
+    fingerprint = files_fingerprint(config_paths(config))
+    kept_fingerprint, checker = _SERVER_ENGINES.get(key, (None, None))
+    if kept_fingerprint != fingerprint:
+        if checker is not None:
+            checker.close()
+        checker = create_engine(engine, pep8, config, pep8_params, jobs)
+        _SERVER_ENGINES[key] = (fingerprint, checker)
+    return checker
+
+
+@contextlib.contextmanager
+def _kept_engines():
+    """ Yields a dict keeping the engines of several checks by config, and
+    closes them when done.
+    """
+    engines = {}
+    try:
+        yield engines
+    finally:
+        for checker in engines.values():
+            checker.close()
+
+
+def _store_result(cache, blob_shas, python_file, out, read_blob):
+    """ Stores the pep8 output of a file in the cache.
+
+    Unless the staged content was checked, the engines check the file in the
+    working tree, so the output is only stored if the file still has the
+    staged content.
+    """
+    if cache is None:
+        return
+    sha = blob_shas[python_file]
+    if read_blob or file_blob_sha(python_file) == sha:
+        cache.put(sha, python_file, out)
 
-def _current_commit():
-    """ Returns the current commit. """
-    if _execute("git rev-parse --verify HEAD".split()).status:
-        return "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
-    else:
-        return "HEAD"
 
+def create_baseline(
+        pep8_command="pep8",
+        pep8_params=None,
+        config="setup.cfg",
+        engine="subprocess",
+        jobs=1,
+        output=".pep8-baseline"):
+    """ Records the violations of all tracked Python files in a baseline
 
-def _get_list_of_committed_files():
-    """ Returns a list of files about to be commited. """
-    files = []
+    :type output: str
+    :param output: Path to the baseline file
+    """
+    options = read_options(config, collections.OrderedDict([
+        ("pep8-command", pep8_command),
+        ("pep8-params", pep8_params),
+        ("engine", engine),
+        ("jobs", jobs),
+        ("include", None),
+        ("exclude", None),
+    ]))
+    pep8_command, pep8_params, engine, jobs, include, exclude = options
+    path_filter = PathFilter(include, exclude)
+
+    python_files = []
+    for filename in GitRepo().tracked_files(path_filter.pathspecs()):
+        if not path_filter(filename):
+            continue
+        try:
+            if _is_python_file(filename):
+                python_files.append(filename)
+        except IOError:
+            pass
+
+    baseline = Baseline()
+    try:
+        groups = ConfigTree(config).group(python_files)
+        with _kept_engines() as engines:
+            for python_file, out in zip(
+                    itertools.chain.from_iterable(groups.values()),
+                    _group_results(
+                        groups, pep8_command, pep8_params, engine, jobs,
+                        None, None, None, engines)):
+                baseline.record(python_file, out, _read_file(python_file))
+    except OSError:
+        print("An error occurred. Is pep8 installed?")
+        sys.exit(1)
+
+    baseline.save(output)
+    print("Recorded {} violations in {} files to {}".format(
+        len(baseline), len(python_files), output))
+
+
+def _check_options(config, state_directory=None, **defaults):
+    """ Returns the options of a check with the values in the config files,
+    and what the checks need from them.
+
+    :type config: str
+    :param config: Path to config file
+    :type state_directory: str
+    :param state_directory: Directory holding the results cached with the
+                            cache option. Default: no cache
+    :param defaults: The value of every option, named like the arguments of
+                     check_repo. Include, exclude and baseline are required
+    :rtype: tuple
+    :returns: The options, the PathFilter of the files to check, the
+              directory of the cached results or None, and the output
+              filters of the baseline
+    """
+    options = read_options(config, collections.OrderedDict(
+        (name.replace("_", "-"), value)
+        for name, value in sorted(defaults.items())))
 
-    diff_index_cmd = "git diff-index --cached %s" % _current_commit()
-    output = subprocess.check_output(
-        diff_index_cmd.split()
-    )
-    for result in output.decode('utf-8').split("\n"):
-        if result != "":
-            result = result.split()
-            if result[4] in ["A", "M"]:
-                files.append(result[5])
+    cache_directory = None
+    if state_directory and getattr(options, "cache", False):
+        cache_directory = os.path.join(state_directory, "results")
 
-    return files
+    output_filters = []
+    if options.baseline:
+        output_filters.append(
+            _baseline_filter(Baseline.load(options.baseline)))
+    return (options, PathFilter(options.include, options.exclude),
+            cache_directory, output_filters)
 
 
-def _is_python_file(filename):
+def _changed_lines_filter(changed):
+    """ Returns an output filter keeping violations on changed lines.
+
+    :type changed: dict
+    :param changed: LineRanges of the changed lines of every file
+    """
+    def output_filter(python_file, out, _):
+        """ Drops the violations on lines that weren't changed. """
+        ranges = changed.get(python_file, LineRanges())
+        return filter_output(out, python_file, lambda row, _: row in ranges)
+    return output_filter
+
+
+def _baseline_filter(baseline):
+    """ Returns an output filter keeping violations missing from a baseline.
+
+    :type baseline: Baseline
+    :param baseline: The baseline
+    """
+    def output_filter(python_file, out, read_source):
+        """ Drops the violations recorded in the baseline. """
+        if not out:
+            return out
+        return baseline.filter(python_file, out, read_source(python_file))
+    return output_filter
+
+
+def _renew_filter(queue, batch):
+    """ Returns an output filter renewing the lease of a batch.
+
+    :type queue: WorkQueue
+    :type batch: Batch
+    :param batch: The batch being checked
+    """
+    def output_filter(_, out, __):
+        """ Renews the lease after a file of the batch was checked. """
+        queue.renew(batch)
+        return out
+    return output_filter
+
+
+def _read_file_list(path):
+    """ Returns the set of paths listed in a file, one per line. """
+    try:
+        with open(path, "rb") as file_handle:
+            return set(line.decode("utf-8").rstrip("\n")
+                       for line in file_handle if line.strip())
+    except (IOError, OSError):
+        return set()
+
+
+def _write_file_list(path, filenames):
+    """ Writes the paths to a file, one per line. """
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as file_handle:
+            for filename in filenames:
+                file_handle.write(filename.encode("utf-8") + b"\n")
+    except (IOError, OSError):
+        pass
+
+
+def _files_from(path, separator):
+    """ Yields the paths listed in a file, or on stdin if the path is "-" """
+    if path == "-":
+        for filename in read_paths(
+                getattr(sys.stdin, "buffer", sys.stdin), separator):
+            yield filename
+        return
+
+    with open(path, "rb") as file_handle:
+        for filename in read_paths(file_handle, separator):
+            yield filename
+
+
+def _read_file(filename):
+    """ Returns the content of a file in the working tree. """
+    with open(filename, "rb") as file_handle:
+        return file_handle.read()
+
+
+def _python_entries(entries, reader, classifications, deleted_paths=None,
+                    config_tree=None):
+    """ Yields the entries of the Python files with content to check.
+
+    Files with the extension are always Python files. Files without it are
+    classified by the start of their blob, and the result is remembered by
+    blob SHA.
+
+    :type entries: list
+    :param entries: The raw diff entries, including the deleted files
+    :type reader: BlobReader
+    :param reader: Reads the blobs to classify
+    :type classifications: ClassificationCache
+    :param classifications: The classifications of the blobs seen before
+    :type deleted_paths: dict
+    :param deleted_paths: The path of every deleted blob. Default: read from
+                          the entries, which are then iterated twice
+    :type config_tree: ConfigTree
+    :param config_tree: The configs the files are checked with. Renamed
+                        files are only skipped if it is specified
+    """
+    if deleted_paths is None:
+        deleted_paths = dict(
+            (entry.old_sha, entry.path) for entry in entries
+            if entry.status == "D")
+    for entry in entries:
+        if not _needs_check(entry, deleted_paths, config_tree):
+            continue
+        if entry.path.endswith(".py"):
+            yield entry
+            continue
+        is_python = classifications.get(entry.new_sha)
+        if is_python is None:
+            try:
+                is_python = _is_python_file(
+                    entry.path, reader.read(entry.new_sha, SNIFF_SIZE))
+            except KeyError:
+                print("File not found (probably deleted): {}\t\tSKIPPED"
+                      .format(entry.path))
+                continue
+            classifications.put(entry.new_sha, is_python)
+        if is_python:
+            yield entry
+
+
+def _shard_entries(repo, entries, shard, shard_by="path"):
+    """ Returns the entries of the files in the shard.
+
+    :type repo: GitRepo
+    :param repo: The repository holding the blobs of the entries
+    :type entries: iterable
+    :param entries: The entries of the files to check
+    :type shard: tuple
+    :param shard: The index and the count of the shard
+    :type shard_by: str
+    :param shard_by: Either "path" to assign the files by the hash of their
+                     path as they are iterated, or "size" to balance the
+                     sizes of the shards, which reads all entries first
+    :rtype: iterable
+    """
+    index, count = shard
+    if shard_by == "size":
+        entries = list(entries)
+        sizes = repo.blob_sizes(set(entry.new_sha for entry in entries))
+        shards = size_shards(dict(
+            (entry.path, sizes.get(entry.new_sha, 0)) for entry in entries),
+            count)
+        return [entry for entry in entries if shards[entry.path] == index]
+    return (entry for entry in entries
+            if path_shard(entry.path, count) == index)
+
+
+def _check_key(config_tree, entry, by_path=False):
+    """ Returns the key of the check of an entry.
+
+    A blob checked with the same config gives the same result, unless the
+    result depends on the path as well, like with a baseline.
+
+    :type config_tree: ConfigTree
+    :param config_tree: The configs the files are checked with
+    :type entry: StagedEntry
+    :type by_path: bool
+    :param by_path: Tell apart the same blob at different paths
+    :rtype: str
+    :returns: A hex digest
+    """
+    parts = [entry.new_sha, config_tree.config_for(entry.path)]
+    if by_path:
+        parts.append(entry.path)
+    digest = hashlib.sha1()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = part.encode("utf-8")
+        digest.update(part + b"\0")
+    return digest.hexdigest()
+
+
+def _unique_blobs(entries, config_tree, by_path=False):
+    """ Yields the entries with a check not yielded before.
+
+    :type config_tree: ConfigTree
+    :param config_tree: The configs the files are checked with
+    :type by_path: bool
+    :param by_path: Tell apart the same blob at different paths
+    """
+    keys = set()
+    for entry in entries:
+        key = _check_key(config_tree, entry, by_path)
+        if key not in keys:
+            keys.add(key)
+            yield entry
+
+
+def _needs_check(entry, deleted_paths, config_tree=None):
+    """ Returns whether a staged entry has content that needs checking.
+
+    Symlinks, submodules, mode-only changes and files renamed without
+    changing their content, extension or pep8 config are skipped without
+    reading anything. Copies of checked content are left to the result
+    cache.
+
+    :type entry: StagedEntry
+    :param entry: The raw diff entry of the file
+    :type deleted_paths: dict
+    :param deleted_paths: Paths of the blobs deleted by the staged diff
+    :type config_tree: ConfigTree
+    :param config_tree: The configs the files are checked with. Renamed
+                        files are checked if it isn't specified
+    """
+    if entry.status not in ("A", "M"):
+        return False
+    if entry.new_mode in (SYMLINK_MODE, GITLINK_MODE):
+        return False
+    if entry.status == "M":
+        return entry.old_sha != entry.new_sha
+    deleted_path = deleted_paths.get(entry.new_sha)
+    return deleted_path is None or config_tree is None or (
+        os.path.splitext(deleted_path)[1] !=
+        os.path.splitext(entry.path)[1]) or (
+            config_tree.config_for(deleted_path) !=
+            config_tree.config_for(entry.path))
+
+
+def _is_python_file(filename, data=None):
     """Check if the input file looks like a Python script
 
     Returns True if the filename ends in ".py" or if the first line
-    contains "python" and "#!", returns False otherwise.
+    contains "python" and "#!", returns False otherwise. Only the first
+    SNIFF_SIZE bytes are read, and files containing a NUL byte there are
+    considered binary.
 
+    :type data: bytes
+    :param data: Start of the content to check instead of the file contents
     """
     if filename.endswith(".py"):
         return True
+
+    if data is None:
+        with open(filename, "rb") as file_handle:
+            data = file_handle.read(SNIFF_SIZE)
     else:
-        with open(filename, "r") as file_handle:
-            first_line = file_handle.readline()
-        return "python" in first_line and "#!" in first_line
+        data = data[:SNIFF_SIZE]
+    if b"\0" in data:
+        return False
+    first_line = data.split(b"\n", 1)[0]
+    return b"python" in first_line and b"#!" in first_line
 
 
 def _parse_violations(pep8_output):
@@ -0,0 +1,227 @@
+"""
+Configuration of the commit hook.
+
+The options of the commit hook are read from the ``[pep8_pre_commit_hook]``
+section of ``tox.ini`` and the config file (``setup.cfg`` by default), and
+from the ``[tool.pep8_pre_commit_hook]`` table of ``pyproject.toml``. Every
+file is read once per process, and the options are returned as an immutable
+named tuple.
+"""
+
+import collections
+import hashlib
+import os
+import tempfile
+try:
+    import configparser
+except ImportError:
+    import ConfigParser as configparser
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+
+# The section of the config files holding the options of the commit hook
+CONFIG_SECTION = "pep8_pre_commit_hook"
+
+# The config files read before the config file, which takes precedence
+PYPROJECT = "pyproject.toml"
+TOX_INI = "tox.ini"
+
+# The values read from every config file by its path and stat signature
+_LOADED = {}
+
+# The named tuple types of the options by the names of the options
+_OPTIONS_TYPES = {}
+
+# The boolean values accepted in the config files, like configparser reads
+# them
+BOOLEAN_STATES = {"1": True, "yes": True, "true": True, "on": True,
+                  "0": False, "no": False, "false": False, "off": False}
+
+
+def read_options(config, defaults):
+    """ Returns the options with the values in the config files.
+
+    The config file takes precedence over tox.ini, which takes precedence
+    over pyproject.toml, which takes precedence over the defaults. The
+    pep8 params of all of them are combined instead.
+
+    :type config: str
+    :param config: Path to config file
+    :type defaults: OrderedDict
+    :param defaults: The value of every option by its name in the config.
+                     The type of the value is the type read from the config
+    :rtype: namedtuple
+    :returns: The options in the order of the defaults, named like the
+              options with underscores instead of dashes
+    """
+    values = collections.OrderedDict(defaults)
+    for path in config_files(config):
+        for name, value in _load(path).items():
+            if name not in values:
+                continue
+            if name == "pep8-params":
+                values[name] = " ".join(
+                    params for params in [values[name], value] if params)
+            else:
+                values[name] = _convert(value, defaults[name])
+    return _options_type(tuple(values))(*values.values())
+
+
+def config_files(config):
+    """ Returns the existing config files read for the options, in order of
+    increasing precedence.
+
+    :type config: str
+    :param config: Path to config file
+    """
+    paths = []
+    for path in [PYPROJECT, TOX_INI, config]:
+        if path not in paths and os.path.isfile(path):
+            paths.append(path)
+    return paths
+
+
+def files_fingerprint(paths, state_path=None):
+    """ Returns a digest of the paths and contents of the existing files.
+
+    When a state file is specified, the digest of every file is stored in
+    it with the modification time and size of the file, and files that
+    didn't change since are not read again.
+
+    :type paths: list
+    :param paths: Paths of the files
+    :type state_path: str
+    :param state_path: Path of the file storing the digests
+    """
+    state = _read_state(state_path) if state_path else {}
+    new_state = {}
+    digest = hashlib.sha1()
+    for path in paths:
+        signature = _signature(path)
+        if signature is None:
+            continue
+        # The state can be shared by several repositories
+        key = (os.path.abspath(path), signature)
+        file_digest = state.get(key)
+        if file_digest is None:
+            with open(path, "rb") as file_handle:
+                file_digest = hashlib.sha1(file_handle.read()).hexdigest()
+        new_state[key] = file_digest
+        digest.update(path.encode("utf-8") + b"\0")
+        digest.update(file_digest.encode("ascii") + b"\0")
+
+    if state_path and any(key not in state for key in new_state):
+        # Keep the digests of other files, but only the latest of every file
+        updated = set(path for path, _ in new_state)
+        state = dict((key, value) for key, value in state.items()
+                     if key[0] not in updated)
+        state.update(new_state)
+        _write_state(state_path, state)
+    return digest.hexdigest()
+
+
+def _load(path):
+    """ Returns the option values in a config file, reading it at most once
+    as long as it doesn't change.
+    """
+    # A long-running process can read the config files of several
+    # repositories
+    key = (os.path.abspath(path), _signature(path))
+    if key not in _LOADED:
+        if path.endswith(".toml"):
+            _LOADED[key] = _load_toml(path)
+        else:
+            _LOADED[key] = _load_ini(path)
+    return _LOADED[key]
+
+
+def _load_ini(path):
+    """ Returns the option values in the section of an ini file. """
+    parser = configparser.RawConfigParser()
+    parser.read(path)
+    if not parser.has_section(CONFIG_SECTION):
+        return {}
+    return dict(parser.items(CONFIG_SECTION))
+
+
+def _load_toml(path):
+    """ Returns the option values in the table of a pyproject.toml file.
+
+    The file is skipped if no TOML parser is available.
+    """
+    if tomllib is None:
+        return {}
+    with open(path, "rb") as file_handle:
+        data = tomllib.load(file_handle)
+    values = data.get("tool", {}).get(CONFIG_SECTION, {})
+    return dict(
+        (name, " ".join(value) if isinstance(value, list) else value)
+        for name, value in values.items())
+
+
+def _convert(value, default):
+    """ Returns the value as the type of the default. """
+    if isinstance(default, bool):
+        if isinstance(value, bool):
+            return value
+        value = str(value).lower()
+        if value not in BOOLEAN_STATES:
+            raise ValueError("Not a boolean: {}".format(value))
+        return BOOLEAN_STATES[value]
+    if isinstance(default, int):
+        return int(value)
+    return value
+
+
+def _options_type(names):
+    """ Returns the named tuple type for the option names. """
+    if names not in _OPTIONS_TYPES:
+        _OPTIONS_TYPES[names] = collections.namedtuple(
+            "Options", [name.replace("-", "_") for name in names])
+    return _OPTIONS_TYPES[names]
+
+
+def _signature(path):
+    """ Returns the modification time and size of a file, or None. """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return "{}:{}".format(stat.st_mtime, stat.st_size)
+
+
+def _read_state(path):
+    """ Returns the file digests stored in a state file. """
+    state = {}
+    try:
+        with open(path, "rb") as file_handle:
+            for line in file_handle:
+                fields = line.decode("utf-8").rstrip("\n").split("\t")
+                if len(fields) == 3:
+                    state[(fields[0], fields[1])] = fields[2]
+    except (IOError, OSError):
+        pass
+    return state
+
+
+def _write_state(path, state):
+    """ Stores the file digests in a state file. """
+    try:
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        handle, temp_path = tempfile.mkstemp(dir=directory or ".")
+        with os.fdopen(handle, "wb") as file_handle:
+            for (file_path, signature), digest in sorted(state.items()):
+                file_handle.write("{}\t{}\t{}\n".format(
+                    file_path, signature, digest).encode("utf-8"))
+        os.rename(temp_path, path)
+    except (IOError, OSError):
+        pass
@@ -0,0 +1,98 @@
+"""
+Lookup of the pep8 configuration of every directory.
+
+Sub-projects of a repository can have their own ``setup.cfg``, ``tox.ini``
+or ``.pep8`` with a ``[pep8]`` section. Every file is checked with the
+configuration nearest to it, like the pep8 command finds it when run on a
+single file.
+"""
+
+import collections
+import os
+try:
+    import configparser
+except ImportError:
+    import ConfigParser as configparser
+
+
+# Files pep8 reads its project configuration from
+CONFIG_NAMES = ("setup.cfg", "tox.ini", ".pep8")
+
+# Section holding the pep8 options
+PEP8_SECTION = "pep8"
+
+
+class ConfigTree(object):
+    """ Trie of the directories of the checked files, holding the config
+    used for every directory.
+
+    A directory is looked up once and inherits the config of its parent
+    unless it has one of its own, so every directory is read at most once.
+    """
+
+    def __init__(self, default):
+        """
+        :type default: str
+        :param default: Path of the config of the repository root
+        """
+        self.root = _Directory(default)
+
+    def config_for(self, filename):
+        """ Returns the path of the config to check the file with.
+
+        :type filename: str
+        :param filename: Path of the file relative to the repository root
+        """
+        node = self.root
+        directory = ""
+        for name in os.path.dirname(filename.replace(os.sep, "/")).split("/"):
+            if not name or name == ".":
+                continue
+            directory = os.path.join(directory, name)
+            child = node.children.get(name)
+            if child is None:
+                child = _Directory(_find_config(directory) or node.config)
+                node.children[name] = child
+            node = child
+        return node.config
+
+    def group(self, filenames):
+        """ Returns the files grouped by the config to check them with.
+
+        :type filenames: list
+        :param filenames: Paths of the files relative to the repository root
+        :rtype: OrderedDict
+        :returns: The files by config, in the order the configs are first
+                  used
+        """
+        groups = collections.OrderedDict()
+        for filename in filenames:
+            groups.setdefault(self.config_for(filename), []).append(filename)
+        return groups
+
+
+class _Directory(object):
+    """ Node of the ConfigTree. """
+    # pylint: disable=too-few-public-methods
+
+    __slots__ = ("config", "children")
+
+    def __init__(self, config):
+        self.config = config
+        self.children = {}
+
+
+def _find_config(directory):
+    """ Returns the path of the pep8 config in the directory, or None. """
+    for name in CONFIG_NAMES:
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        parser = configparser.RawConfigParser()
+        try:
+            parser.read(path)
+        except configparser.Error:
+            continue
+        if parser.has_section(PEP8_SECTION):
+            return path
+    return None
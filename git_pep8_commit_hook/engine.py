@@ -0,0 +1,595 @@
+"""
+Engines running pep8 on the files about to be committed.
+
+Every engine returns the output pep8 would have printed for a file, so the
+commit hook can count and report violations the same way regardless of how
+the file was checked.
+"""
+
+from __future__ import print_function
+
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import threading
+import tokenize
+from multiprocessing.pool import ThreadPool
+
+import pep8
+
+from .cache import relocate_output
+from .config import files_fingerprint
+
+
+def pep8_arguments(pep8_params, config):
+    """ Returns the pep8 arguments for the specified params and config.
+
+    :type pep8_params: str
+    :param pep8_params: Custom pep8 parameters to add to the pep8 command
+    :type config: str
+    :param config: Path to config file
+    """
+    arguments = []
+    if pep8_params:
+        arguments += pep8_params.split()
+        if "--config" not in pep8_params:
+            arguments.append("--config={}".format(config))
+    else:
+        arguments.append("--config={}".format(config))
+    return arguments
+
+
+def parse_pep8_options(arguments, config):
+    """ Returns the pep8 options for the arguments as a picklable dict.
+
+    pep8 looks for setup.cfg and tox.ini next to the config like the pep8
+    command does for the checked file. Passing the dict to a StyleGuide
+    doesn't read the config files again.
+
+    :type arguments: list
+    :param arguments: The pep8 arguments
+    :type config: str
+    :param config: Path to config file
+    """
+    options, _ = pep8.process_options(
+        arguments + [os.path.dirname(config) or "."])
+    return dict(vars(options))
+
+
+def config_paths(config):
+    """ Returns the paths of the config files pep8 reads for a config.
+
+    :type config: str
+    :param config: Path to config file
+    """
+    directory = os.path.dirname(config or "")
+    paths = [config, pep8.USER_CONFIG] + [
+        os.path.join(directory, name) for name in pep8.PROJECT_CONFIG]
+    return [path for path in paths if path]
+
+
+# Files are sent to the worker processes in batches of roughly this many bytes
+# so the per-task overhead doesn't dominate for small files.
+BATCH_SIZE = 64 * 1024
+
+# Matches the "path:row:col:" prefix pep8 puts in front of every violation
+VIOLATION_PREFIX = re.compile(br":\d+:\d+:")
+
+
+class Engine(object):
+    """ Base class for the engines. """
+
+    config = None
+    arguments = []
+
+    def version(self):
+        """ Returns the version of pep8 used by the engine. """
+        return pep8.__version__
+
+    def fingerprint(self, state_path=None):
+        """ Returns a digest of everything affecting the pep8 output.
+
+        This covers the pep8 version, the pep8 arguments and the contents of
+        the config files pep8 reads.
+
+        :type state_path: str
+        :param state_path: File remembering the digests of the config files
+                           by their modification time, so unchanged config
+                           files are not read again
+        """
+        digest = hashlib.sha1()
+        for part in [self.version()] + self.arguments:
+            digest.update(part.encode("utf-8") + b"\0")
+        digest.update(files_fingerprint(
+            config_paths(self.config), state_path).encode("ascii"))
+        return digest.hexdigest()
+
+    def check(self, filename, data=None):
+        """ Returns the pep8 output for the specified file.
+
+        :type data: bytes
+        :param data: Content to check instead of the content of the file
+        """
+        raise NotImplementedError
+
+    def check_many(self, filenames, read_blob=None):
+        """ Yields the pep8 output for the specified files in order.
+
+        :type read_blob: callable
+        :param read_blob: Returns the content to check for a file instead of
+                          the content of the file
+        """
+        for filename in filenames:
+            yield self.check(filename, _read(read_blob, filename))
+
+    def close(self):
+        """ Releases the resources kept between checks. """
+
+
+class ExternalEngine(Engine):
+    """ Base class for the engines running an external pep8 command.
+
+    Up to `jobs` commands are running at the same time. The running commands
+    are killed when the engine stops before all files are checked.
+    """
+
+    def __init__(self, pep8_command, config, pep8_params=None, jobs=1):
+        self.config = config
+        self.arguments = pep8_arguments(pep8_params, config)
+        self.command = [pep8_command] + self.arguments
+        self.jobs = jobs
+        self.processes = set()
+        self.lock = threading.Lock()
+
+    def version(self):
+        """ Returns the version printed by the pep8 command. """
+        return self._run(["--version"]).decode("utf-8").strip()
+
+    def check(self, filename, data=None):
+        """ Returns the pep8 output for the specified file.
+
+        If the content is specified, it is passed to pep8 on stdin, and the
+        path pep8 prints is replaced by the path of the file.
+
+        Raises OSError if the pep8 command cannot be executed.
+        """
+        if data is None:
+            return self._run(self.arguments + [filename])
+        out = self._run(self.arguments + ["-"], data)
+        return relocate_output(out, b"stdin", _encode_path(filename))
+
+    def kill(self):
+        """ Kills the running pep8 commands. """
+        with self.lock:
+            for process in self.processes:
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+
+    def _map(self, function, items):
+        """ Yields function(item) for every item in order, running up to
+        `jobs` calls at the same time.
+        """
+        return _ordered_map(function, items, self.jobs, self.kill)
+
+    def _run(self, arguments, data=None):
+        """ Returns the output of the pep8 command. """
+        process = subprocess.Popen(
+            self.command[:1] + arguments,
+            stdin=None if data is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        with self.lock:
+            self.processes.add(process)
+        try:
+            out, _ = process.communicate(data)
+        finally:
+            with self.lock:
+                self.processes.discard(process)
+        return out
+
+
+class SubprocessEngine(ExternalEngine):
+    """ Runs an external pep8 command once for every file. """
+
+    def check_many(self, filenames, read_blob=None):
+        """ Yields the pep8 output for the specified files in order.
+
+        Raises OSError if the pep8 command cannot be executed.
+        """
+        return self._map(
+            lambda filename: self.check(filename, _read(read_blob, filename)),
+            filenames)
+
+
+class BatchEngine(ExternalEngine):
+    """ Runs an external pep8 command once for many files.
+
+    The files are split into chunks keeping the command line below the
+    operating system limit, and the combined output of every chunk is split
+    back into the output of every file. With more than one job the files are
+    spread over at least `jobs` commands running at the same time.
+    """
+
+    def check(self, filename, data=None):
+        """ Returns the pep8 output for the specified file. """
+        if data is not None:
+            return super(BatchEngine, self).check(filename, data)
+        return next(self.check_many([filename]))
+
+    def check_many(self, filenames, read_blob=None):
+        """ Yields the pep8 output for the specified files in order.
+
+        The pep8 command can only read one file from stdin, so content from
+        `read_blob` is checked with one command per file.
+
+        Raises OSError if the pep8 command cannot be executed.
+        """
+        if read_blob is not None:
+            for output in self._map(
+                    lambda filename: self.check(
+                        filename, _read(read_blob, filename)),
+                    filenames):
+                yield output
+            return
+
+        max_files = -(-len(filenames) // self.jobs)
+        chunks = list(_chunks(
+            filenames, _command_length(self.command), max_files))
+        results = self._map(self._check_chunk, chunks)
+        for chunk, outputs in zip(chunks, results):
+            for filename in chunk:
+                yield outputs[filename]
+
+    def _check_chunk(self, chunk):
+        """ Returns the pep8 output for a chunk of files split per file. """
+        return split_output(self._run(self.arguments + chunk), chunk)
+
+
+class InProcessEngine(Engine):
+    """ Checks files with a pep8 StyleGuide living in this process.
+
+    The options are parsed from the config and the pep8 params once, and the
+    output is formatted exactly like the pep8 command would print it.
+    """
+
+    def __init__(self, config, pep8_params=None, options=None):
+        """
+        :type options: dict
+        :param options: The pep8 options returned by parse_pep8_options for
+                        the config and the pep8 params, so they are not
+                        parsed again
+        """
+        self.config = config
+        self.arguments = pep8_arguments(pep8_params, config)
+        if options is None:
+            options = parse_pep8_options(self.arguments, config)
+        self.style_guide = pep8.StyleGuide(**options)
+
+    def check(self, filename, data=None):
+        """ Returns the pep8 output for the specified file.
+
+        :type data: bytes
+        :param data: Content to check instead of the content of the file
+        """
+        options = self.style_guide.options
+        if self.style_guide.excluded(filename):
+            return b""
+
+        # A fresh report per file keeps the counters used by "--first" from
+        # leaking between files, just like a separate pep8 process would.
+        report = self.style_guide.init_report(_CollectingReport)
+        lines = None if data is None else _decode_lines(data)
+        self.style_guide.input_file(filename, lines=lines)
+
+        if options.quiet == 1:
+            output = [filename] if report.file_errors else []
+        elif options.quiet:
+            output = []
+        else:
+            output = report.output
+        output = "".join(line + "\n" for line in output)
+        if not isinstance(output, bytes):
+            output = output.encode("utf-8")
+        return output
+
+
+class _CollectingReport(pep8.StandardReport):
+    """ StandardReport keeping the printed lines instead of printing them. """
+
+    def __init__(self, options):
+        super(_CollectingReport, self).__init__(options)
+        self.output = []
+
+    def get_file_results(self):
+        """ Collect the result and return the overall count for this file. """
+        self._deferred_print.sort()
+        for line_number, offset, code, text, doc in self._deferred_print:
+            self.output.append(self._fmt % {
+                "path": self.filename,
+                "row": self.line_offset + line_number, "col": offset + 1,
+                "code": code, "text": text,
+            })
+            if self._show_source:
+                if line_number > len(self.lines):
+                    line = ""
+                else:
+                    line = self.lines[line_number - 1]
+                self.output.append(line.rstrip())
+                self.output.append(re.sub(r"\S", " ", line[:offset]) + "^")
+            if self._show_pep8 and doc:
+                self.output.append("    " + doc.strip())
+        return self.file_errors
+
+
+class ParallelEngine(Engine):
+    """ Spreads the files over a pool of processes with warm pep8 engines.
+
+    The pool is started by the first check and kept for the next ones until
+    the engine is closed.
+    """
+
+    def __init__(self, config, pep8_params=None, jobs=2):
+        self.config = config
+        self.arguments = pep8_arguments(pep8_params, config)
+        self.pep8_params = pep8_params
+        self.jobs = jobs
+        self.pool = None
+
+    def check(self, filename, data=None):
+        """ Returns the pep8 output for the specified file. """
+        return next(self.check_many(
+            [filename], None if data is None else lambda _: data))
+
+    def check_many(self, filenames, read_blob=None):
+        """ Yields the pep8 output for the specified files in order.
+
+        The pep8 options are parsed once and passed to the workers. If the
+        generator is closed early, the pool is stopped to cancel the running
+        checks, and the next check starts a new one.
+        """
+        if self.pool is None:
+            options = parse_pep8_options(self.arguments, self.config)
+            self.pool = multiprocessing.Pool(
+                self.jobs, _init_worker,
+                (self.config, self.pep8_params, options))
+        finished = False
+        try:
+            for outputs in self.pool.imap(
+                    _check_batch, _batches(filenames, self.jobs, read_blob)):
+                for output in outputs:
+                    yield output
+            finished = True
+        finally:
+            if not finished:
+                self.close()
+
+    def close(self):
+        """ Stops the worker processes. """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+
+# The engine of a ParallelEngine worker process
+_WORKER_ENGINE = None
+
+
+def _init_worker(config, pep8_params, options):
+    """ Creates the engine of a worker process. """
+    global _WORKER_ENGINE  # pylint: disable=global-statement
+    _WORKER_ENGINE = InProcessEngine(config, pep8_params, options)
+
+
+def _check_batch(batch):
+    """ Returns the pep8 output for a batch of files in a worker process. """
+    return [_WORKER_ENGINE.check(filename, data) for filename, data in batch]
+
+
+def _batches(filenames, jobs, read_blob=None):
+    """ Groups the files and their content into batches for the workers.
+
+    Consecutive files are grouped until a batch holds BATCH_SIZE bytes, but
+    every worker gets a few batches so the work stays evenly spread. The
+    content is None unless `read_blob` is specified.
+    """
+    max_files = max(1, len(filenames) // (jobs * 4))
+    batch = []
+    batch_size = 0
+    for filename in filenames:
+        data = _read(read_blob, filename)
+        batch.append((filename, data))
+        if data is None:
+            batch_size += _file_size(filename)
+        else:
+            batch_size += len(data)
+        if len(batch) >= max_files or batch_size >= BATCH_SIZE:
+            yield batch
+            batch = []
+            batch_size = 0
+    if batch:
+        yield batch
+
+
+def _file_size(filename):
+    """ Returns the size of the file, or 0 if it cannot be found. """
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+def split_output(output, filenames):
+    """ Splits combined pep8 output into the output of every file.
+
+    Every violation is assigned to a file by its "path:row:col:" prefix, and
+    lines without a prefix (like the ones added by "--show-source") follow
+    the violation above them.
+
+    :type output: bytes
+    :param output: The pep8 output for all the files
+    :type filenames: list
+    :param filenames: The files pep8 was run on
+    :rtype: dict
+    :returns: The output of every file
+    """
+    paths = dict((_encode_path(filename), filename) for filename in filenames)
+    outputs = dict((filename, []) for filename in filenames)
+    current = None
+    for line in output.splitlines(True):
+        filename = _line_file(line, paths)
+        if filename:
+            current = outputs[filename]
+        if current is not None:
+            current.append(line)
+    return dict(
+        (filename, b"".join(lines)) for filename, lines in outputs.items())
+
+
+def filter_output(output, filename, keep):
+    """ Returns the pep8 output of a file without some of the violations.
+
+    Lines following a violation (like the ones added by "--show-source") are
+    kept or dropped together with the violation.
+
+    :type output: bytes
+    :param output: The pep8 output for the file
+    :type filename: str
+    :param filename: The file pep8 was run on
+    :type keep: callable
+    :param keep: Called with the line number and the line of every violation,
+                 returns whether to keep it
+    """
+    prefix = _encode_path(filename) + b":"
+    lines = []
+    keeping = True
+    for line in output.splitlines(True):
+        if line.startswith(prefix):
+            row, _, _ = line[len(prefix):].partition(b":")
+            if row.isdigit():
+                keeping = keep(int(row), line)
+        if keeping:
+            lines.append(line)
+    return b"".join(lines)
+
+
+def _line_file(line, paths):
+    """ Returns the file a line of pep8 output starts with, if any. """
+    # With "--quiet" pep8 prints just the path of the file
+    filename = paths.get(line.rstrip(b"\r\n"))
+    if filename:
+        return filename
+    for match in VIOLATION_PREFIX.finditer(line):
+        filename = paths.get(line[:match.start()])
+        if filename:
+            return filename
+    return None
+
+
+def _encode_path(filename):
+    """ Returns the path as bytes like it appears in the pep8 output. """
+    if isinstance(filename, bytes):
+        return filename
+    return filename.encode("utf-8")
+
+
+def _read(read_blob, filename):
+    """ Returns the content `read_blob` returns for the file, if any. """
+    if read_blob is None:
+        return None
+    return read_blob(filename)
+
+
+def _decode_lines(data):
+    """ Returns the source lines of the content like pep8 reads a file. """
+    if sys.version_info[0] < 3:
+        return data.splitlines(True)
+    try:
+        coding, _ = tokenize.detect_encoding(io.BytesIO(data).readline)
+        return io.TextIOWrapper(io.BytesIO(data), coding).readlines()
+    except (LookupError, SyntaxError, UnicodeError):
+        # Fall back if the encoding is improperly declared
+        return io.TextIOWrapper(io.BytesIO(data), "latin-1").readlines()
+
+
+def _ordered_map(function, items, jobs, cancel=None):
+    """ Yields function(item) for every item in order.
+
+    With more than one job, up to `jobs` calls run at the same time in
+    threads, and the results are collected as every call finishes. If the
+    generator is closed early, `cancel` is called to stop the running calls.
+    """
+    if jobs == 1:
+        for item in items:
+            yield function(item)
+        return
+
+    pool = ThreadPool(jobs)
+    try:
+        for result in pool.imap(function, items):
+            yield result
+    finally:
+        pool.terminate()
+        if cancel is not None:
+            cancel()
+        pool.join()
+
+
+def _chunks(filenames, command_length, max_files=None):
+    """ Splits the files into chunks fitting on a command line. """
+    max_length = _max_command_length() - command_length
+    chunk = []
+    chunk_length = 0
+    for filename in filenames:
+        length = len(_encode_path(filename)) + 1
+        if chunk and (chunk_length + length > max_length or
+                      len(chunk) == max_files):
+            yield chunk
+            chunk = []
+            chunk_length = 0
+        chunk.append(filename)
+        chunk_length += length
+    if chunk:
+        yield chunk
+
+
+def _command_length(command):
+    """ Returns the number of bytes the command takes on a command line. """
+    return sum(len(_encode_path(argument)) + 1 for argument in command)
+
+
+def _max_command_length():
+    """ Returns a safe maximum length of a command line.
+
+    Half of ARG_MAX is used since the environment shares the same space.
+    """
+    if os.name == "nt":
+        return 32000
+    try:
+        return min(os.sysconf("SC_ARG_MAX") // 2, 1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return 32000
+
+
+def create_engine(name, pep8_command, config, pep8_params, jobs=1):
+    """ Returns the engine with the specified name.
+
+    :type name: str
+    :param name: Either "subprocess", "batch" or "inprocess"
+    :type jobs: int
+    :param jobs: Number of files checked in parallel. 0 means one per CPU
+    """
+    jobs = jobs or multiprocessing.cpu_count()
+    if name == "inprocess":
+        if jobs == 1:
+            return InProcessEngine(config, pep8_params)
+        return ParallelEngine(config, pep8_params, jobs)
+    if name == "batch":
+        return BatchEngine(pep8_command, config, pep8_params, jobs)
+    return SubprocessEngine(pep8_command, config, pep8_params, jobs)
@@ -0,0 +1,549 @@
+"""
+Access to the git repository the commit hook is running in.
+"""
+
+import bisect
+import collections
+import os
+import re
+import subprocess
+import threading
+
+
+# Matches the new line range of a hunk header in a unified diff
+HUNK_HEADER = re.compile(br"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+# An entry of the raw diff between the index and HEAD
+StagedEntry = collections.namedtuple(
+    "StagedEntry",
+    "old_mode, new_mode, old_sha, new_sha, status, path"
+)
+
+# Modes of the entries that are not regular files
+SYMLINK_MODE = "120000"
+GITLINK_MODE = "160000"
+
+# Escape sequences git uses in quoted paths
+ESCAPES = {b"a": b"\a", b"b": b"\b", b"t": b"\t", b"n": b"\n", b"v": b"\v",
+           b"f": b"\f", b"r": b"\r", b'"': b'"', b"\\": b"\\"}
+
+
+class GitRepo(object):
+    """ The git repository the commit hook is running in.
+
+    Every method runs a single git command and streams its output.
+    """
+
+    def __init__(self, cwd=None):
+        """
+        :type cwd: str
+        :param cwd: Directory inside the repository. Default: current
+        """
+        self.cwd = cwd
+        self._git_dir = None
+
+    @property
+    def git_dir(self):
+        """ The path of the .git directory. """
+        if self._git_dir is None:
+            output = subprocess.check_output(
+                ["git", "rev-parse", "--git-dir"], cwd=self.cwd)
+            self._git_dir = os.path.join(
+                self.cwd or "", output.decode("utf-8").strip())
+        return self._git_dir
+
+    def valid_revisions(self, revisions):
+        """ Returns whether git knows all commits of the revisions.
+
+        :type revisions: list
+        :param revisions: Revisions like "sha" or "base..head"
+        :rtype: bool
+        """
+        if any(revision.startswith("-") for revision in revisions):
+            return False
+        with open(os.devnull, "wb") as devnull:
+            status = subprocess.call(
+                ["git", "rev-parse", "--quiet"] + list(revisions) + ["--"],
+                stdout=devnull, stderr=devnull, cwd=self.cwd)
+        return status == 0
+
+    def merge_heads(self):
+        """ Returns the SHAs of the commits being merged, if any.
+
+        :rtype: list
+        """
+        try:
+            with open(os.path.join(self.git_dir, "MERGE_HEAD")) as merge_head:
+                return [line.strip() for line in merge_head if line.strip()]
+        except (IOError, OSError):
+            return []
+
+    def staged_entries(self, diff_filter="AM", commit=None, pathspecs=()):
+        """ Yields the entries of the files about to be committed.
+
+        `git diff --cached` compares the index to the empty tree when there
+        is no HEAD yet, so no separate `git rev-parse` is needed.
+
+        :type diff_filter: str
+        :param diff_filter: Status letters of the entries to yield
+        :type commit: str
+        :param commit: Commit to compare the index to. Default: HEAD
+        :type pathspecs: list
+        :param pathspecs: Only yield the entries matching these pathspecs
+        :rtype: iterator of StagedEntry
+        """
+        revisions = ["--cached"]
+        if commit is not None:
+            revisions.append(commit)
+        return self.diff_entries(revisions, diff_filter, pathspecs)
+
+    def diff_entries(self, revisions, diff_filter="AM", pathspecs=()):
+        """ Yields the entries of the raw diff between two trees.
+
+        :type revisions: list
+        :param revisions: The `git diff` arguments selecting the trees, such
+                          as ["base..head"]
+        :type diff_filter: str
+        :param diff_filter: Status letters of the entries to yield
+        :type pathspecs: list
+        :param pathspecs: Only yield the entries matching these pathspecs
+        :rtype: iterator of StagedEntry
+        """
+        fields = self._stream(
+            ["diff", "--raw", "-z", "--no-abbrev", "--no-renames",
+             "--no-ext-diff", "--diff-filter=" + diff_filter] +
+            list(revisions) + ["--"] + list(pathspecs))
+        for field in fields:
+            yield _parse_entry(field, next(fields))
+
+    def commit_entries(self, commits, diff_filter="ADM", pathspecs=()):
+        """ Yields the entries of the changes of every commit.
+
+        A single `git diff-tree --stdin` compares every commit to its
+        parent. Merge commits are compared to all their parents, so only
+        the files differing from every parent are yielded, like conflict
+        resolutions. Their entries compare the merge to its first parent.
+
+        :type commits: iterable
+        :param commits: SHAs of the commits
+        :type diff_filter: str
+        :param diff_filter: Status letters of the entries to yield
+        :type pathspecs: list
+        :param pathspecs: Only yield the entries matching these pathspecs
+        :rtype: iterator
+        :returns: The SHA and the list of StagedEntry of every commit with
+                  changes
+        """
+        fields = self._stream(
+            ["diff-tree", "--stdin", "-r", "-c", "--root", "--raw", "-z",
+             "--no-abbrev", "--no-renames", "--no-ext-diff",
+             "--diff-filter=" + diff_filter, "--"] + list(pathspecs),
+            commits)
+        commit = None
+        entries = []
+        for field in fields:
+            if field.startswith(b":"):
+                entries.append(_parse_entry(field, next(fields)))
+                continue
+            if commit is not None:
+                yield commit, entries
+            commit = field.decode("ascii").strip()
+            entries = []
+        if commit is not None:
+            yield commit, entries
+
+    def rev_list(self, revisions):
+        """ Yields the SHAs of the commits selected by the revisions, oldest
+        first.
+
+        Revisions missing from the repository are ignored, so the commits
+        a remote has but this repository doesn't can be excluded.
+
+        :type revisions: iterable
+        :param revisions: Revisions like "sha" and "^sha"
+        """
+        for line in self._stream(
+                ["rev-list", "--reverse", "--ignore-missing", "--stdin"],
+                revisions, b"\n"):
+            yield line.decode("ascii").strip()
+
+    def remote_shas(self, remote=None):
+        """ Returns the SHAs of the remote-tracking branches.
+
+        :type remote: str
+        :param remote: Only return the branches of this remote. Default: all
+        :rtype: list
+        """
+        return self.ref_shas(
+            "refs/remotes/" + (remote + "/" if remote else ""))
+
+    def ref_shas(self, prefix="refs/"):
+        """ Returns the SHAs the refs starting with the prefix point to.
+
+        :type prefix: str
+        :param prefix: Prefix of the refs. Default: all refs
+        :rtype: list
+        """
+        return [line.decode("ascii").strip() for line in self._stream(
+            ["for-each-ref", "--format=%(objectname)", prefix],
+            separator=b"\n")]
+
+    def tracked_files(self, pathspecs=()):
+        """ Yields the paths of the files tracked by git.
+
+        :type pathspecs: list
+        :param pathspecs: Only yield the files matching these pathspecs
+        """
+        for field in self._stream(["ls-files", "-z", "--"] + list(pathspecs)):
+            yield _decode_path(field)
+
+    def index_entries(self, pathspecs=()):
+        """ Yields the entries of all files in the index.
+
+        The entries are streamed from a single `git ls-files -s -z`, and look
+        like the files were added to an empty tree. Unmerged files are
+        skipped.
+
+        :type pathspecs: list
+        :param pathspecs: Only yield the entries matching these pathspecs
+        :rtype: iterator of StagedEntry
+        """
+        for field in self._stream(
+                ["ls-files", "-s", "-z", "--"] + list(pathspecs)):
+            info, _, path = field.partition(b"\t")
+            mode, sha, stage = info.decode("ascii").split()
+            if stage == "0":
+                yield StagedEntry(
+                    "000000", mode, "0" * len(sha), sha, "A",
+                    _decode_path(path))
+
+    def blob_sizes(self, shas):
+        """ Returns the sizes of the blobs.
+
+        The sizes are read by a single `git cat-file --batch-check`, without
+        reading the blobs. Missing blobs are left out.
+
+        :type shas: iterable
+        :param shas: SHAs of the blobs
+        :rtype: dict
+        :returns: The size of every blob by its SHA
+        """
+        sizes = {}
+        for line in self._stream(
+                ["cat-file", "--batch-check"], shas, b"\n"):
+            fields = line.decode("ascii").split()
+            if len(fields) == 3:
+                sizes[fields[0]] = int(fields[2])
+        return sizes
+
+    def changed_lines(self, revisions=("--cached",)):
+        """ Returns the lines added or changed in the staged diff.
+
+        The output of a single `git diff --cached -U0` is parsed as it is
+        streamed.
+
+        :type revisions: list
+        :param revisions: The `git diff` arguments selecting the trees.
+                          Default: HEAD and the index
+        :rtype: dict
+        :returns: A LineRanges instance for every added or modified file
+        """
+        process = subprocess.Popen(
+            ["git", "diff"] + list(revisions) +
+            ["-U0", "--no-color", "--no-ext-diff", "--no-renames",
+             "--diff-filter=AM", "--src-prefix=a/", "--dst-prefix=b/"],
+            stdout=subprocess.PIPE,
+            cwd=self.cwd)
+        try:
+            return parse_changed_lines(process.stdout)
+        finally:
+            process.stdout.close()
+            process.wait()
+
+    def blob_reader(self):
+        """ Returns a BlobReader for the blobs of the repository. """
+        return BlobReader(self.cwd)
+
+    def _stream(self, arguments, input_lines=None, separator=b"\0"):
+        """ Yields the NUL separated fields printed by a git command.
+
+        Raises subprocess.CalledProcessError if the command fails.
+
+        :type input_lines: iterable
+        :param input_lines: Lines written to the standard input of the
+                            command by a separate thread
+        """
+        command = ["git"] + arguments
+        process = subprocess.Popen(
+            command,
+            stdin=None if input_lines is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=self.cwd)
+        writer = None
+        if input_lines is not None:
+            writer = threading.Thread(
+                target=_write_lines, args=(process.stdin, input_lines))
+            writer.daemon = True
+            writer.start()
+        try:
+            for field in _split_stream(process.stdout, separator):
+                yield field
+        finally:
+            process.stdout.close()
+            status = process.wait()
+            if writer is not None:
+                writer.join()
+        if status:
+            raise subprocess.CalledProcessError(status, command)
+
+
+class BlobReader(object):
+    """ Reads blobs through a single long-running `git cat-file --batch`.
+
+    The process is started when the first blob is read, and every blob is
+    read from the same pipe, so reading many blobs costs one process spawn.
+    """
+
+    def __init__(self, cwd=None):
+        self.cwd = cwd
+        self.process = None
+        self.lock = threading.Lock()
+
+    def read(self, sha, max_size=None):
+        """ Returns the content of the blob.
+
+        Raises KeyError if the object does not exist.
+
+        :type sha: str
+        :param sha: SHA of the blob
+        :type max_size: int
+        :param max_size: Only return this many bytes from the start of the
+                         blob. The rest is skipped without keeping it in
+                         memory
+        """
+        with self.lock:
+            if self.process is None:
+                self.process = subprocess.Popen(
+                    ["git", "cat-file", "--batch"],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    cwd=self.cwd)
+
+            self.process.stdin.write(sha.encode("ascii") + b"\n")
+            self.process.stdin.flush()
+            header = self.process.stdout.readline().split()
+            if len(header) != 3:
+                raise KeyError(sha)
+            size = int(header[2])
+            if max_size is None or max_size > size:
+                max_size = size
+            data = _read_exactly(self.process.stdout, max_size)
+            _skip(self.process.stdout, size - max_size)
+            # Every blob is followed by a newline
+            self.process.stdout.read(1)
+            return data
+
+    def close(self):
+        """ Stops the git process. """
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _parse_entry(field, path):
+    """ Returns the StagedEntry of a raw diff entry and its path.
+
+    The combined entries of merge commits start with a colon for every
+    parent, and hold the mode, the SHA and the status for every parent.
+    They are returned as changes from the first parent.
+    """
+    text = field.decode("ascii")
+    parents = len(text) - len(text.lstrip(":"))
+    fields = text.lstrip(":").split()
+    if parents == 1:
+        old_mode, new_mode, old_sha, new_sha, status = fields
+    else:
+        modes = fields[:parents + 1]
+        shas = fields[parents + 1:2 * parents + 2]
+        old_mode, new_mode, old_sha, new_sha = (
+            modes[0], modes[-1], shas[0], shas[-1])
+        statuses = set(fields[-1])
+        if not new_sha.strip("0"):
+            status = "D"
+        elif statuses == set("A"):
+            status = "A"
+        else:
+            status = "M"
+    return StagedEntry(
+        old_mode, new_mode, old_sha, new_sha, status, _decode_path(path))
+
+
+def _write_lines(stream, lines):
+    """ Writes the lines to a stream and closes it. """
+    try:
+        for line in lines:
+            stream.write(line.encode("utf-8") + b"\n")
+    except (IOError, OSError):
+        # The command stopped reading
+        pass
+    finally:
+        try:
+            stream.close()
+        except (IOError, OSError):
+            pass
+
+
+def _skip(stream, size, chunk_size=64 * 1024):
+    """ Reads and drops `size` bytes from the stream. """
+    while size > 0:
+        size -= len(_read_exactly(stream, min(size, chunk_size)))
+
+
+def _read_exactly(stream, size):
+    """ Reads exactly `size` bytes from the stream. """
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            raise IOError("Unexpected end of git cat-file output")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class LineRanges(object):
+    """ Index of the line ranges of a file, answering whether a line is in
+    one of them with a binary search.
+    """
+
+    def __init__(self, ranges=()):
+        """
+        :type ranges: list
+        :param ranges: (first, last) line number pairs
+        """
+        self.starts = []
+        self.ends = []
+        for first, last in sorted(ranges):
+            if self.ends and first <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], last)
+            else:
+                self.starts.append(first)
+                self.ends.append(last)
+
+    def __contains__(self, line_number):
+        index = bisect.bisect_right(self.starts, line_number) - 1
+        return index >= 0 and line_number <= self.ends[index]
+
+    def __eq__(self, other):
+        return (self.starts, self.ends) == (other.starts, other.ends)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "LineRanges({!r})".format(list(zip(self.starts, self.ends)))
+
+
+def parse_changed_lines(diff_lines):
+    """ Returns the new line ranges of every file in a unified diff.
+
+    :type diff_lines: iterable
+    :param diff_lines: Lines of the diff as bytes
+    :rtype: dict
+    """
+    ranges = {}
+    current = None
+    for line in diff_lines:
+        if line.startswith(b"+++ "):
+            path = _unquote_path(line[4:].rstrip(b"\r\n"))
+            current = None
+            if path.startswith(b"b/"):
+                current = ranges.setdefault(path[2:].decode("utf-8"), [])
+            continue
+
+        match = HUNK_HEADER.match(line)
+        if match and current is not None:
+            first = int(match.group(1))
+            count = 1 if match.group(2) is None else int(match.group(2))
+            if count:
+                current.append((first, first + count - 1))
+
+    return dict((path, LineRanges(file_ranges))
+                for path, file_ranges in ranges.items())
+
+
+def read_paths(stream, separator=b"\n"):
+    """ Yields the paths listed in a stream as native strings.
+
+    Empty entries are skipped, and with newline separated lists so are
+    trailing carriage returns.
+
+    :type stream: file
+    :param stream: Binary stream listing the paths
+    :type separator: bytes
+    :param separator: Separator of the paths, a newline or NUL
+    """
+    for field in _split_stream(stream, separator):
+        if separator == b"\n":
+            field = field.rstrip(b"\r")
+        if field:
+            yield _decode_path(field)
+
+
+def _split_stream(stream, separator, chunk_size=64 * 1024):
+    """ Yields the separated fields of a stream without reading it all. """
+    pending = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        fields = (pending + chunk).split(separator)
+        pending = fields.pop()
+        for field in fields:
+            yield field
+    if pending:
+        yield pending
+
+
+def _decode_path(path):
+    """ Returns a path printed by git as a native string. """
+    if isinstance(path, str):
+        return path
+    return os.fsdecode(path)
+
+
+def _unquote_path(path):
+    """ Returns the path git printed in a diff header without quoting. """
+    if not path.startswith(b'"'):
+        # Paths with spaces are followed by a tab
+        return path.rstrip(b"\t")
+
+    result = []
+    index = 1
+    while index < len(path) and path[index:index + 1] != b'"':
+        char = path[index:index + 1]
+        if char == b"\\":
+            escape = path[index + 1:index + 2]
+            if escape.isdigit():
+                result.append(_byte(int(path[index + 1:index + 4], 8)))
+                index += 4
+                continue
+            result.append(ESCAPES.get(escape, escape))
+            index += 2
+        else:
+            result.append(char)
+            index += 1
+    return b"".join(result)
+
+
+def _byte(value):
+    """ Returns a byte with the specified value. """
+    return bytes(bytearray([value]))
@@ -0,0 +1,124 @@
+"""
+Include and exclude patterns selecting the files to check.
+
+The patterns are globs matched against the path relative to the repository
+root. ``*`` and ``?`` don't match a ``/`` while ``**`` does. A pattern
+without a ``/`` matches in any directory, and a pattern matching a
+directory matches everything inside it, so ``vendor/``, ``migrations`` and
+``*_pb2.py`` all work as expected.
+"""
+
+import re
+
+
+class PathFilter(object):
+    """ Compiles the include and exclude patterns into a single regular
+    expression each, and into the equivalent git pathspecs.
+    """
+
+    def __init__(self, include=None, exclude=None):
+        """
+        :type include: str
+        :param include: Whitespace separated patterns of the files to check.
+                        Default: all files
+        :type exclude: str
+        :param exclude: Whitespace separated patterns of the files to skip
+        """
+        self.include = [_normalize(pattern)
+                        for pattern in (include or "").split()]
+        self.exclude = [_normalize(pattern)
+                        for pattern in (exclude or "").split()]
+        self.include_regex = _compile(self.include)
+        self.exclude_regex = _compile(self.exclude)
+
+    def __bool__(self):
+        return bool(self.include or self.exclude)
+
+    __nonzero__ = __bool__
+
+    def __call__(self, path):
+        """ Returns whether the file should be checked.
+
+        :type path: str
+        :param path: Path of the file relative to the repository root
+        """
+        path = path.replace("\\", "/")
+        while path.startswith("./"):
+            path = path[2:]
+        if self.include_regex and not self.include_regex.match(path):
+            return False
+        return not (self.exclude_regex and self.exclude_regex.match(path))
+
+    def pathspecs(self):
+        """ Returns git pathspecs limiting a command to the matching files.
+
+        Git applies the same patterns, so the excluded files never leave
+        git. The files are still matched afterwards, so the pathspecs only
+        need to select a superset.
+
+        :rtype: list
+        """
+        if not self:
+            return []
+        pathspecs = []
+        for pattern in self.include:
+            pathspecs.extend([":(top,glob){}".format(pattern),
+                              ":(top,glob){}/**".format(pattern)])
+        if not pathspecs:
+            # The whole tree, as git needs a pattern besides the exclusions
+            pathspecs.append(":/")
+        for pattern in self.exclude:
+            pathspecs.extend([":(top,glob,exclude){}".format(pattern),
+                              ":(top,glob,exclude){}/**".format(pattern)])
+        return pathspecs
+
+
+def _normalize(pattern):
+    """ Returns the pattern anchored at the repository root. """
+    pattern = pattern.rstrip("/")
+    if pattern.startswith("/"):
+        return pattern.lstrip("/")
+    if "/" not in pattern and not pattern.startswith("**"):
+        return "**/" + pattern
+    return pattern
+
+
+def _compile(patterns):
+    """ Returns a regular expression matching any of the patterns, or None.
+
+    Every pattern also matches the contents of the directories it matches.
+    """
+    if not patterns:
+        return None
+    return re.compile("(?:{})(?:/.*)?$".format(
+        "|".join(_translate(pattern) for pattern in patterns)))
+
+
+def _translate(pattern):
+    """ Returns the regular expression of a glob pattern. """
+    result = []
+    index = 0
+    while index < len(pattern):
+        if pattern.startswith("**/", index):
+            result.append("(?:.*/)?")
+            index += 3
+        elif pattern.startswith("**", index):
+            result.append(".*")
+            index += 2
+        elif pattern[index] == "*":
+            result.append("[^/]*")
+            index += 1
+        elif pattern[index] == "?":
+            result.append("[^/]")
+            index += 1
+        elif pattern[index] == "[" and "]" in pattern[index + 2:]:
+            end = pattern.index("]", index + 2)
+            chars = pattern[index + 1:end].replace("\\", "\\\\")
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            result.append("[{}]".format(chars))
+            index = end + 1
+        else:
+            result.append(re.escape(pattern[index]))
+            index += 1
+    return "".join(result)
@@ -0,0 +1,237 @@
+"""
+Hook server listening on a Unix domain socket.
+
+Every commit pays for starting Python and importing pep8 before checking a
+single file. A long-running server keeps both warm, together with the
+parsed configs and the recent results, and the console script only sends
+its arguments, working directory and environment to it. The client
+falls back to checking in its own process if no server is listening.
+
+Every request is a JSON line, answered by a JSON line holding the output,
+the error output and the exit status of the hook. Requests are handled
+one at a time, as they change the working directory of the server.
+"""
+
+import io
+import json
+import os
+import socket
+import sys
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+try:
+    # Python 2 prints both str and unicode
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+# Environment variable overriding the path of the socket
+SOCKET_ENV = "GIT_PEP8_COMMIT_HOOK_SOCKET"
+
+# Seconds the client waits for the server to accept the connection
+CONNECT_TIMEOUT = 1.0
+
+# Variables of the client environment set in the server, besides the git
+# ones, so the pep8 command and the python files are found as in the client
+FORWARDED_VARIABLES = ("PATH", "VIRTUAL_ENV")
+
+# Paths of the standard input, which the server can't read for the client
+STDIN_PATHS = ("-", "/dev/stdin", "/dev/fd/0", "/proc/self/fd/0")
+
+
+def reads_stdin(argv):
+    """ Returns whether the arguments may make the hook read stdin.
+
+    Both "--files-from -" and "--files-from=-" are recognized, as well as
+    any other argument naming the standard input.
+
+    :type argv: list
+    :param argv: The arguments of the hook
+    """
+    for argument in argv:
+        if argument.startswith("--") and "=" in argument:
+            argument = argument.partition("=")[2]
+        if argument in STDIN_PATHS:
+            return True
+    return False
+
+
+def forwarded(name):
+    """ Returns whether the environment variable is sent to the server.
+
+    :type name: str
+    :param name: Name of the environment variable
+    """
+    return name.startswith("GIT_") or name in FORWARDED_VARIABLES
+
+
+def socket_path():
+    """ Returns the path of the socket of the server of the user.
+
+    The socket is in $XDG_RUNTIME_DIR, or the cache directory of the user,
+    unless GIT_PEP8_COMMIT_HOOK_SOCKET is set.
+    """
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    directory = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"),
+        "git_pep8_commit_hook")
+    return os.path.join(directory, "git_pep8_commit_hook.sock")
+
+
+def request(path, argv, cwd=None, environment=None):
+    """ Runs the hook in the server.
+
+    :type path: str
+    :param path: Path of the socket
+    :type argv: list
+    :param argv: The arguments of the hook
+    :type cwd: str
+    :param cwd: The directory to run the hook in. Default: the current one
+    :type environment: dict
+    :param environment: The environment variables. Default: the git
+                        variables and the search path of the current
+                        environment
+    :rtype: dict
+    :returns: The output, the error output and the exit status of the hook,
+              or None if no server answered
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    if environment is None:
+        environment = dict((name, value) for name, value in os.environ.items()
+                           if forwarded(name))
+    message = json.dumps({
+        "argv": list(argv),
+        "cwd": cwd or os.getcwd(),
+        "environment": environment,
+    }).encode("utf-8") + b"\n"
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.settimeout(CONNECT_TIMEOUT)
+        connection.connect(path)
+        connection.settimeout(None)
+        connection.sendall(message)
+        chunks = []
+        while True:
+            chunk = connection.recv(64 * 1024)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        response = json.loads(b"".join(chunks).decode("utf-8"))
+    except (socket.error, OSError, ValueError):
+        return None
+    finally:
+        connection.close()
+    if "error" in response:
+        return None
+    return response
+
+
+class HookServer(socketserver.UnixStreamServer):
+    """ Runs the hook for the clients connecting to the socket. """
+
+    def __init__(self, path, main):
+        """
+        Raises OSError if another server listens on the socket.
+
+        :type path: str
+        :param path: Path of the socket
+        :type main: callable
+        :param main: The main function of the hook, reading sys.argv
+        """
+        self.main = main
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        if os.path.exists(path):
+            if request(path, ["--version"]) is not None:
+                raise OSError("A server listens on {}".format(path))
+            # Left by a server that died
+            os.remove(path)
+        # Only the user may run hooks as the user
+        umask = os.umask(0o077)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def run_hook(self, argv, cwd, environment):
+        """ Returns the output, the error output and the exit status of the
+        hook.
+
+        Raises ValueError if the hook would read the standard input of the
+        client, which isn't sent to the server.
+
+        :type argv: list
+        :param argv: The arguments of the hook
+        :type cwd: str
+        :param cwd: The directory to run the hook in
+        :type environment: dict
+        :param environment: The forwarded environment variables of the
+                            client
+        """
+        if reads_stdin(argv):
+            raise ValueError("Cannot read stdin of the client")
+        # Reading stdin anyway fails instead of reading no files
+        stdin = io.BytesIO()
+        stdin.close()
+
+        old_cwd = os.getcwd()
+        old_environment = dict(os.environ)
+        old_argv, old_stdin = sys.argv, sys.stdin
+        old_stdout, old_stderr = sys.stdout, sys.stderr
+        output, errors = StringIO(), StringIO()
+        status = 0
+        try:
+            os.chdir(cwd)
+            for name in list(os.environ):
+                if forwarded(name):
+                    del os.environ[name]
+            os.environ.update(environment)
+            sys.argv = ["git_pep8_commit_hook"] + list(argv)
+            sys.stdout, sys.stderr = output, errors
+            sys.stdin = stdin
+            self.main()
+        except SystemExit as exit_error:
+            status = exit_error.code
+        finally:
+            sys.argv, sys.stdin = old_argv, old_stdin
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+            os.environ.clear()
+            os.environ.update(old_environment)
+            os.chdir(old_cwd)
+        if not isinstance(status, int):
+            if status is not None:
+                errors.write(u"{}\n".format(status))
+            status = 0 if status is None else 1
+        return output.getvalue(), errors.getvalue(), status
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """ Handles a request of a client. """
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline().decode("utf-8"))
+            output, errors, status = self.server.run_hook(
+                message["argv"], message["cwd"], message["environment"])
+            response = {"output": output, "errors": errors,
+                        "status": status}
+        except Exception as error:  # pylint: disable=broad-except
+            # The client checks in its own process instead
+            response = {"error": repr(error)}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
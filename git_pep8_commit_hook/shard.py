@@ -0,0 +1,138 @@
+"""
+Splitting the checked files over several machines.
+
+A shard like ``2/4`` selects the second of four disjoint sets of files.
+Files are assigned by a hash of their path, which is stable across
+machines and commits, or by their size into bins holding about the same
+number of bytes. Every shard can write a JSON report, and the reports of
+all shards are merged into the result of the whole check.
+"""
+
+import hashlib
+import heapq
+import json
+
+
+def parse_shard(text):
+    """ Returns the index and the count of a shard like "2/4".
+
+    Raises ValueError if the text is not a valid shard.
+
+    :type text: str
+    :param text: The shard, counting from 1
+    :rtype: tuple
+    """
+    index, _, count = text.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError("Not a shard like 2/4: {}".format(text))
+    if not 1 <= index <= count:
+        raise ValueError("Not a shard like 2/4: {}".format(text))
+    return index, count
+
+
+def path_shard(path, count):
+    """ Returns the shard of a file by the hash of its path.
+
+    :type path: str
+    :param path: Path of the file relative to the repository root
+    :type count: int
+    :param count: Number of shards
+    :rtype: int
+    :returns: The shard, counting from 1
+    """
+    digest = hashlib.sha1(path.replace("\\", "/").encode("utf-8"))
+    return int(digest.hexdigest()[:8], 16) % count + 1
+
+
+def size_shards(sizes, count):
+    """ Returns the shard of every file, balancing the sizes of the shards.
+
+    The largest files are assigned first, each to the shard holding the
+    fewest bytes so far. Ties are broken by path and shard, so every
+    machine computes the same assignment from the same files.
+
+    :type sizes: dict
+    :param sizes: The size of every file by its path
+    :type count: int
+    :param count: Number of shards
+    :rtype: dict
+    :returns: The shard of every file by its path, counting from 1
+    """
+    bins = [(0, index) for index in range(1, count + 1)]
+    shards = {}
+    for path, size in sorted(sizes.items(), key=lambda item: (-item[1],
+                                                              item[0])):
+        total, index = heapq.heappop(bins)
+        shards[path] = index
+        heapq.heappush(bins, (total + size, index))
+    return shards
+
+
+def write_report(path, shard, checked, failed_files, passed):
+    """ Stores the result of a shard in a JSON file.
+
+    :type path: str
+    :param path: Path of the report
+    :type shard: tuple
+    :param shard: The index and the count of the shard
+    :type checked: int
+    :param checked: Number of files checked
+    :type failed_files: list
+    :param failed_files: The files that failed
+    :type passed: bool
+    :param passed: Whether the shard passed
+    """
+    report = {
+        "shard": "{}/{}".format(*shard),
+        "checked": checked,
+        "failed_files": sorted(failed_files),
+        "passed": passed,
+    }
+    with open(path, "w") as file_handle:
+        json.dump(report, file_handle, indent=2, sort_keys=True)
+        file_handle.write("\n")
+
+
+def merge_reports(paths):
+    """ Returns the result of all shards from their reports.
+
+    Raises ValueError if the reports are of different shard counts or
+    several reports are of the same shard.
+
+    :type paths: list
+    :param paths: Paths of the reports
+    :rtype: dict
+    :returns: The number of shards, the missing shards, the number of
+              checked files, the failed files, and whether all shards
+              passed
+    """
+    reports = {}
+    count = None
+    for path in paths:
+        with open(path) as file_handle:
+            report = json.load(file_handle)
+        index, report_count = parse_shard(report["shard"])
+        if count is not None and report_count != count:
+            raise ValueError("Reports of {} and {} shards".format(
+                count, report_count))
+        if index in reports:
+            raise ValueError("Several reports of shard {}".format(
+                report["shard"]))
+        count = report_count
+        reports[index] = report
+
+    missing = [index for index in range(1, (count or 0) + 1)
+               if index not in reports]
+    failed_files = sorted(
+        path for report in reports.values()
+        for path in report["failed_files"])
+    return {
+        "count": count,
+        "missing": missing,
+        "checked": sum(report["checked"] for report in reports.values()),
+        "failed_files": failed_files,
+        "passed": bool(reports) and not missing and all(
+            report["passed"] for report in reports.values()),
+    }
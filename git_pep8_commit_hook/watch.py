@@ -0,0 +1,219 @@
+"""
+Watching the working tree for saved files.
+
+The files are watched with the inotify API of Linux, called through
+ctypes, so no extra package is needed. Every directory of the tree is
+watched, and the files saved in them are reported once they stop changing
+for a moment, as editors often write a file several times when saving.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+
+# Events of the inotify API, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Events of the watched directories
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE_SELF)
+
+# Header of every event read from the inotify file descriptor
+EVENT_HEADER = struct.Struct("iIII")
+
+# Directories never watched
+SKIPPED_DIRECTORIES = (".git", ".hg", ".svn", ".tox", "__pycache__")
+
+
+class Inotify(object):
+    """ Watches directories through an inotify file descriptor. """
+
+    def __init__(self):
+        """ Raises OSError if inotify is not available. """
+        libc_name = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.paths = {}
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """ Watches a directory.
+
+        :type path: str
+        :param path: Path of the directory
+        :type mask: int
+        :param mask: The events to report
+        """
+        descriptor = self._add_watch(self.fd, _encode_path(path), mask)
+        if descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self.paths[descriptor] = path
+
+    def read_events(self, timeout=None):
+        """ Returns the events that occurred, waiting for one at most the
+        timeout.
+
+        :type timeout: float
+        :param timeout: Seconds to wait. Default: until an event occurs
+        :rtype: list
+        :returns: The mask and the path of every event. The path is None if
+                  events were lost
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as error:
+            if error.errno == errno.EAGAIN:
+                return []
+            raise
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, _, length = EVENT_HEADER.unpack_from(
+                data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.append((mask, None))
+                continue
+            directory = self.paths.get(descriptor)
+            if mask & IN_IGNORED:
+                self.paths.pop(descriptor, None)
+                continue
+            if directory is None:
+                continue
+            path = directory
+            if name:
+                path = os.path.join(directory, _decode_path(name))
+            events.append((mask, path))
+        return events
+
+    def close(self):
+        """ Stops watching. """
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def watch_tree(root, delay=0.2, inotify=None):
+    """ Yields the files saved in a directory tree.
+
+    Every file is yielded once it wasn't changed for `delay` seconds, in
+    lists of the files that settled at the same time. Directories created
+    later are watched as well. If the kernel lost events, all files of the
+    tree are yielded.
+
+    :type root: str
+    :param root: The directory to watch
+    :type delay: float
+    :param delay: Seconds a file must stay unchanged before it is yielded
+    :type inotify: Inotify
+    :param inotify: The watcher to use. Default: a new one
+    :rtype: iterator of list
+    :returns: The paths of the saved files, relative to the root
+    """
+    inotify = inotify or Inotify()
+    with inotify:
+        _watch_directory(inotify, root)
+        changed = {}
+        while True:
+            timeout = None
+            if changed:
+                timeout = max(0, min(changed.values()) + delay - time.time())
+            for mask, path in inotify.read_events(timeout):
+                if path is None:
+                    for path in _walk_files(root):
+                        changed[path] = time.time()
+                elif mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        _watch_directory(inotify, path)
+                        for new_path in _walk_files(path):
+                            changed[new_path] = time.time()
+                elif not mask & (IN_MOVED_FROM | IN_DELETE_SELF):
+                    changed[path] = time.time()
+                else:
+                    changed.pop(path, None)
+
+            now = time.time()
+            settled = sorted(path for path, changed_at in changed.items()
+                             if changed_at + delay <= now)
+            if not settled:
+                continue
+            for path in settled:
+                del changed[path]
+            settled = [os.path.relpath(path, root) for path in settled
+                       if os.path.isfile(path)]
+            if settled:
+                yield settled
+
+
+def _watch_directory(inotify, root):
+    """ Watches a directory and all directories in it. """
+    for directory, directories, _ in os.walk(root):
+        directories[:] = [name for name in directories
+                          if name not in SKIPPED_DIRECTORIES]
+        try:
+            inotify.add_watch(directory)
+        except OSError as error:
+            # Removed meanwhile, or out of watches
+            if error.errno not in (errno.ENOENT, errno.ENOTDIR):
+                raise
+
+
+def _walk_files(root):
+    """ Yields the paths of the files in a directory tree. """
+    for directory, directories, files in os.walk(root):
+        directories[:] = [name for name in directories
+                          if name not in SKIPPED_DIRECTORIES]
+        for name in files:
+            yield os.path.join(directory, name)
+
+
+def _encode_path(path):
+    """ Returns the path as bytes, like the C functions take it. """
+    if isinstance(path, bytes):
+        return path
+    if hasattr(os, "fsencode"):
+        return os.fsencode(path)
+    return path.encode(sys.getfilesystemencoding())
+
+
+def _decode_path(name):
+    """ Returns a file name read from inotify as a native string. """
+    if isinstance(name, str):
+        return name
+    return os.fsdecode(name)
@@ -0,0 +1,260 @@
+"""
+Work queue in a directory shared by several runners.
+
+Runners on several hosts share the files to check through a directory,
+for instance on NFS or a CI cache volume, without a coordinator. The first
+runner splits the files into batches, and every runner claims batches
+until none are left, so fast runners take over the work of slow ones.
+
+The queue relies on renaming files being atomic::
+
+    claimed/                 created by the runner filling the queue
+    pending/<batch>          batches nobody claimed yet
+    claimed/<batch>.<deadline>.<owner>
+                             leases of the batches being checked
+    done/<batch>.json        results of the checked batches
+
+A batch is claimed by renaming it from ``pending`` to ``claimed``, which
+only one runner can do. A lease expires at its deadline, and an expired
+lease is claimed by another runner the same way, so the batches of a
+runner that died are checked by the others. The clocks of the hosts need
+to agree within the lease time.
+"""
+
+import json
+import os
+import socket
+import tempfile
+import time
+
+
+# Subdirectories of the queue
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+
+
+class Batch(object):
+    """ Files claimed by a runner. """
+    # pylint: disable=too-few-public-methods
+
+    __slots__ = ("name", "lease", "items")
+
+    def __init__(self, name, lease, items):
+        """
+        :type name: str
+        :param name: Name of the batch
+        :type lease: str
+        :param lease: Name of the lease in the claimed directory
+        :type items: list
+        :param items: The items of the batch
+        """
+        self.name = name
+        self.lease = lease
+        self.items = items
+
+
+class WorkQueue(object):
+    """ Batches of work shared by runners through a directory. """
+
+    def __init__(self, directory, owner=None, lease_time=600):
+        """
+        :type directory: str
+        :param directory: The shared directory
+        :type owner: str
+        :param owner: Name of this runner. Default: host name and process ID
+        :type lease_time: int
+        :param lease_time: Seconds a claimed batch is reserved for this
+                           runner
+        """
+        self.directory = directory
+        self.owner = owner or "{}-{}".format(socket.gethostname(), os.getpid())
+        self.lease_time = lease_time
+
+    def exists(self):
+        """ Returns whether a runner filled or is filling the queue. """
+        return os.path.isdir(os.path.join(self.directory, CLAIMED))
+
+    def ready(self):
+        """ Returns whether the queue is filled. """
+        return os.path.isdir(os.path.join(self.directory, PENDING))
+
+    def fill(self, items, batch_size=50):
+        """ Splits the items into batches, unless another runner did.
+
+        The batches are written to a temporary directory renamed into
+        place, so the other runners see all of them or none.
+
+        :type items: iterable
+        :param items: JSON serializable items, like the files to check
+        :type batch_size: int
+        :param batch_size: Number of items in a batch
+        :rtype: bool
+        :returns: True if this runner filled the queue
+        """
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # Created by another runner
+                pass
+        try:
+            os.mkdir(os.path.join(self.directory, CLAIMED))
+        except OSError:
+            return False
+
+        temp_directory = tempfile.mkdtemp(dir=self.directory)
+        batch = []
+        count = 0
+        for item in items:
+            batch.append(item)
+            if len(batch) == batch_size:
+                _write_json(os.path.join(
+                    temp_directory, _batch_name(count)), batch)
+                batch = []
+                count += 1
+        if batch:
+            _write_json(os.path.join(
+                temp_directory, _batch_name(count)), batch)
+        os.mkdir(os.path.join(self.directory, DONE))
+        os.rename(temp_directory, os.path.join(self.directory, PENDING))
+        return True
+
+    def wait(self, timeout, interval=0.5):
+        """ Waits until the queue is filled by another runner.
+
+        Raises OSError if it isn't filled before the timeout.
+
+        :type timeout: float
+        :param timeout: Seconds to wait
+        """
+        deadline = time.time() + timeout
+        while not self.ready():
+            if time.time() > deadline:
+                raise OSError("The queue in {} was never filled".format(
+                    self.directory))
+            time.sleep(interval)
+
+    def claim(self):
+        """ Returns the next batch to process, or None if there is none.
+
+        Pending batches are claimed first, then the batches of expired
+        leases.
+
+        :rtype: Batch
+        """
+        pending = os.path.join(self.directory, PENDING)
+        for name in sorted(_list(pending)):
+            lease = self._lease_name(name)
+            try:
+                os.rename(os.path.join(pending, name), self._path(lease))
+            except OSError:
+                # Claimed by another runner
+                continue
+            return self._read(name, lease)
+
+        for old_lease in sorted(_list(os.path.join(self.directory, CLAIMED))):
+            name, deadline, _ = _parse_lease(old_lease)
+            if name is None or deadline >= time.time():
+                continue
+            lease = self._lease_name(name)
+            try:
+                os.rename(self._path(old_lease), self._path(lease))
+            except OSError:
+                continue
+            return self._read(name, lease)
+        return None
+
+    def renew(self, batch):
+        """ Extends the lease of a batch being processed.
+
+        :type batch: Batch
+        :rtype: bool
+        :returns: False if the lease expired and another runner claimed it
+        """
+        lease = self._lease_name(batch.name)
+        try:
+            os.rename(self._path(batch.lease), self._path(lease))
+        except OSError:
+            return False
+        batch.lease = lease
+        return True
+
+    def complete(self, batch, result):
+        """ Stores the result of a batch and releases its lease.
+
+        If the lease expired and another runner processes the batch as
+        well, both store the same result.
+
+        :type batch: Batch
+        :type result: dict
+        :param result: JSON serializable result of the batch
+        """
+        _write_json(os.path.join(
+            self.directory, DONE, batch.name + ".json"), result)
+        try:
+            os.remove(self._path(batch.lease))
+        except OSError:
+            pass
+
+    def finished(self):
+        """ Returns whether every batch is done. """
+        return self.ready() and not (
+            _list(os.path.join(self.directory, PENDING)) or
+            _list(os.path.join(self.directory, CLAIMED)))
+
+    def results(self):
+        """ Yields the results of the batches done so far, in order. """
+        done = os.path.join(self.directory, DONE)
+        for name in sorted(_list(done)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(done, name)) as file_handle:
+                    yield json.load(file_handle)
+            except (IOError, OSError, ValueError):
+                # Removed, or written by a runner that died
+                continue
+
+    def _lease_name(self, name):
+        """ Returns the name of a lease of the batch starting now. """
+        return "{}.{}.{}".format(
+            name, int(time.time() + self.lease_time), self.owner)
+
+    def _path(self, lease):
+        """ Returns the path of a lease. """
+        return os.path.join(self.directory, CLAIMED, lease)
+
+    def _read(self, name, lease):
+        """ Returns the claimed batch. """
+        with open(self._path(lease)) as file_handle:
+            return Batch(name, lease, json.load(file_handle))
+
+
+def _batch_name(index):
+    """ Returns the name of a batch, sorting like the index. """
+    return "{:08d}".format(index)
+
+
+def _parse_lease(lease):
+    """ Returns the batch name, the deadline and the owner of a lease. """
+    fields = lease.split(".", 2)
+    if len(fields) != 3 or not fields[1].isdigit():
+        return None, None, None
+    return fields[0], int(fields[1]), fields[2]
+
+
+def _list(directory):
+    """ Returns the names in a directory, or an empty list. """
+    try:
+        return os.listdir(directory)
+    except OSError:
+        return []
+
+
+def _write_json(path, data):
+    """ Writes a JSON file atomically. """
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(handle, "w") as file_handle:
+        json.dump(data, file_handle)
+    os.rename(temp_path, path)
@@ -56,7 +56,7 @@ setup(
     ],
     entry_points={
         "console_scripts": [
-            "git_pep8_commit_hook = git_pep8_commit_hook.commit_hook:main",
+            "git_pep8_commit_hook = git_pep8_commit_hook.client:main",
         ],
     },
     cmdclass={"test": PyTest},
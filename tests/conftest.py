@@ -7,6 +7,8 @@ import os
 import subprocess
 import shutil
 
+from git_pep8_commit_hook import commit_hook, engine
+
 
 @pytest.fixture()
 def temp_repo_dir(request):
@@ -31,6 +33,23 @@ def temp_repo_dir(request):
     return tmp_dir
 
 
+@pytest.fixture()
+def checked_files(monkeypatch):
+    """Record the files checked by the engines of the commit hook."""
+    checked = []
+
+    def create_engine(*args):
+        """Create an engine recording the checked files."""
+        checker = engine.create_engine(*args)
+        check_many = checker.check_many
+        checker.check_many = lambda files, *args: check_many(
+            checked.extend(files) or files, *args)
+        return checker
+    monkeypatch.setattr(commit_hook, "create_engine", create_engine)
+
+    return checked
+
+
 def cmd(current_working_directory, args):
     """Run command in specified directory."""
     return subprocess.check_output(args.split(), cwd=current_working_directory)
@@ -0,0 +1,59 @@
+"""
+This module contains the tests for the violation baseline.
+"""
+
+import os
+
+from git_pep8_commit_hook import baseline
+
+
+SOURCE = b"x=1\ny=2\nz = 3\n"
+OUTPUT = (b"a.py:1:2: E225 missing whitespace around operator\n"
+          b"a.py:2:2: E225 missing whitespace around operator\n")
+
+
+class TestBaseline(object):
+    """
+    Test class for the violation baseline.
+    """
+    # pylint: disable=no-self-use
+
+    def test_record_save_load(self, tmpdir):
+        """Test recording, saving and loading a baseline"""
+
+        recorded = baseline.Baseline()
+        recorded.record("a.py", OUTPUT, SOURCE)
+        recorded.record("a.py", OUTPUT, SOURCE)
+        assert len(recorded) == 4
+
+        path = os.path.join(str(tmpdir), "baseline")
+        recorded.save(path)
+        with open(path, "rb") as rfile:
+            lines = rfile.read().splitlines()
+        assert lines == sorted(lines)
+        assert lines[0].split(b"\t")[:2] == [b"a.py", b"E225"]
+        assert baseline.Baseline.load(path).entries == recorded.entries
+
+    def test_filter(self):
+        """Test that only violations missing from the baseline are kept"""
+
+        recorded = baseline.Baseline()
+        recorded.record("a.py", OUTPUT, SOURCE)
+
+        # Lines moved down still match, the new violation doesn't
+        source = b"import os\n\nx=1\ny=2\nw=4\n"
+        output = (b"a.py:3:2: E225 missing whitespace around operator\n"
+                  b"a.py:4:2: E225 missing whitespace around operator\n"
+                  b"a.py:5:2: E225 missing whitespace around operator\n")
+        assert recorded.filter("a.py", output, source) == (
+            b"a.py:5:2: E225 missing whitespace around operator\n")
+
+        # Every entry matches once per output, and the baseline is kept
+        assert recorded.filter("a.py", OUTPUT + OUTPUT, SOURCE) == OUTPUT
+        assert recorded.filter("a.py", OUTPUT, SOURCE) == b""
+        assert len(recorded) == 2
+
+        # Other files don't match
+        recorded.record("a.py", OUTPUT, SOURCE)
+        output = OUTPUT.replace(b"a.py", b"b.py")
+        assert recorded.filter("b.py", output, SOURCE) == output
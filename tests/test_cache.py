@@ -0,0 +1,115 @@
+"""
+This module contains the tests for the result cache.
+"""
+
+import os
+
+from conftest import cmd, write_file
+from git_pep8_commit_hook import cache
+
+
+class TestResultCache(object):
+    """
+    Test class for the result cache.
+    """
+    # pylint: disable=no-self-use
+
+    def test_get_put(self, temp_repo_dir):
+        """Test cache.ResultCache.get and cache.ResultCache.put"""
+
+        directory = os.path.join(temp_repo_dir, "results")
+        results = cache.ResultCache(directory, "fingerprint")
+        assert results.get("abc", "a.py") is None
+
+        results.put("abc", "a.py", b"a.py:1:1: E1 a\n")
+        assert results.get("abc", "a.py") == b"a.py:1:1: E1 a\n"
+
+        # Another fingerprint doesn't see the result
+        other = cache.ResultCache(directory, "other")
+        assert other.get("abc", "a.py") is None
+
+    def test_memory(self, temp_repo_dir):
+        """Test keeping the results in memory"""
+
+        memory = cache.LRU(2)
+        results = cache.ResultCache(None, "fingerprint", memory)
+        results.put("abc", "a.py", b"a.py:1:1: E1 a\n")
+        assert results.get("abc", "b.py") == b"b.py:1:1: E1 a\n"
+        assert cache.ResultCache(None, "other", memory).get(
+            "abc", "a.py") is None
+
+        # Results read from the directory are kept in memory
+        directory = os.path.join(temp_repo_dir, "results")
+        cache.ResultCache(directory, "fingerprint").put("def", "a.py", b"")
+        results = cache.ResultCache(directory, "fingerprint", memory)
+        assert results.get("def", "a.py") == b""
+        assert len(memory) == 2
+
+    def test_lru(self):
+        """Test cache.LRU"""
+
+        lru = cache.LRU(2)
+        lru.put("a", 1)
+        lru.put("b", 2)
+        assert lru.get("a") == 1
+        lru.put("c", 3)
+        assert lru.get("b") is None
+        assert lru.get("a") == 1
+        assert len(lru) == 2
+
+    def test_relocate_output(self):
+        """Test cache.relocate_output"""
+
+        output = b"a.py:1:1: E1 a\n  a.py:2\na.py\n"
+        assert cache.relocate_output(output, b"a.py", b"b/c.py") == (
+            b"b/c.py:1:1: E1 a\n  a.py:2\nb/c.py\n")
+
+    def test_blob_sha(self, temp_repo_dir):
+        """Test that cache.blob_sha matches git hash-object"""
+
+        test_file = write_file(temp_repo_dir, "a.py", "x = 1\n")
+        sha = cmd(temp_repo_dir, "git hash-object " + test_file)
+        assert cache.file_blob_sha(test_file) == sha.decode("utf-8").strip()
+        assert cache.file_blob_sha("missing.py") is None
+
+    def test_classification_cache(self, temp_repo_dir):
+        """Test cache.ClassificationCache"""
+
+        path = os.path.join(temp_repo_dir, "cache", "classification")
+        classifications = cache.ClassificationCache(path)
+        assert classifications.get("abc") is None
+
+        classifications.put("abc", True)
+        classifications.put("def", False)
+        assert classifications.get("abc")
+        classifications.save()
+
+        classifications = cache.ClassificationCache(path)
+        assert classifications.get("abc") is True
+        assert classifications.get("def") is False
+        classifications.save()
+        with open(path, "rb") as file_handle:
+            assert len(file_handle.readlines()) == 2
+
+    def test_checkpoint(self, temp_repo_dir):
+        """Test cache.Checkpoint"""
+
+        path = os.path.join(temp_repo_dir, "state", "audit")
+        checkpoint = cache.Checkpoint(path, "fingerprint")
+        assert checkpoint.get("abc") is None
+        checkpoint.put("abc", True)
+        checkpoint.put("def", False)
+        checkpoint.close()
+
+        checkpoint = cache.Checkpoint(path, "fingerprint")
+        assert checkpoint.get("abc") is True
+        assert checkpoint.get("def") is False
+        checkpoint.put("ghi", True)
+        checkpoint.flush()
+        assert len(cache.Checkpoint(path, "fingerprint").results) == 3
+
+        # Another configuration starts over
+        assert cache.Checkpoint(path, "other").get("abc") is None
+
+        checkpoint.remove()
+        assert not os.path.exists(path)
@@ -2,8 +2,15 @@
 This module contains the tests for the commit hook.
 """
 
+import os
+import subprocess
+import sys
+
+import pytest
+
 from conftest import cmd, write_file
-from git_pep8_commit_hook import commit_hook
+from git_pep8_commit_hook import (
+    cache, commit_hook, configtree, engine, gitrepo)
 
 
 class TestPep8CommitHook(object):
@@ -12,42 +19,791 @@ class TestPep8CommitHook(object):
     """
     # pylint: disable=protected-access,too-many-public-methods,no-self-use
 
-    def test_current_commit(self, temp_repo_dir):
-        """Test commit_hook._current_commit"""
+    def test_check_files_cache(self, temp_repo_dir, checked_files):
+        """Test that commit_hook.check_files skips cached files"""
+
+        good_file = write_file(temp_repo_dir, "a.py", "x = 1\n")
+        bad_file = write_file(temp_repo_dir, "b.py", "x=1\n")
+        cmd(temp_repo_dir, "git add a.py b.py")
+        blob_shas = _staged_blob_shas()
+        cache_directory = os.path.join(temp_repo_dir, "cache")
+
+        for _ in range(2):
+            assert not commit_hook.check_files(
+                [good_file, bad_file], "pep8", "setup.cfg", None, 0,
+                "inprocess", 1, cache_directory, blob_shas)
+        assert checked_files == [good_file, bad_file]
 
-        # Test empty tree
-        empty_hash = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
-        assert commit_hook._current_commit() == empty_hash
+        # Files differing from the staged content are not cached
+        write_file(temp_repo_dir, "c.py", "y = 1\n")
+        cmd(temp_repo_dir, "git add c.py")
+        blob_shas = _staged_blob_shas()
+        write_file(temp_repo_dir, "c.py", "y=1\n")
+        for _ in range(2):
+            assert not commit_hook.check_files(
+                ["c.py"], "pep8", "setup.cfg", None, 0,
+                "inprocess", 1, cache_directory, blob_shas)
+        assert checked_files == [good_file, bad_file, "c.py", "c.py"]
 
-        # Test after commit
-        cmd(temp_repo_dir, "git commit --allow-empty -m msg")
-        assert commit_hook._current_commit() == "HEAD"
+    def test_check_files_order(self, temp_repo_dir, capsys, checked_files):
+        """Test that files of several configs are reported in their order"""
 
-    def test_list_of_committed_files(self, temp_repo_dir):
-        """Test commit_hook._get_list_of_committed_files"""
+        os.mkdir("legacy")
+        write_file(temp_repo_dir, "legacy/setup.cfg",
+                   "[pep8]\nignore = E225\n")
+        files = [write_file(temp_repo_dir, "a.py", "x=1\n"),
+                 write_file(temp_repo_dir, "legacy/m.py", "x=1\n"),
+                 write_file(temp_repo_dir, "b.py", "x = 1\n"),
+                 write_file(temp_repo_dir, "a.py", "x=1\n")]
+        engines = {}
+        assert not commit_hook.check_files(
+            files, "pep8", "setup.cfg", None, 0, "inprocess",
+            engines=engines)
+        out = capsys.readouterr()[0]
+        assert [line.split()[3] for line in out.splitlines()
+                if line.startswith("Running pep8")] == files
+        assert "legacy/m.py (file 2/4)..\t0 violations" in out
+        assert checked_files == ["a.py", "b.py", "a.py", "legacy/m.py"]
+        assert sorted(engines) == ["legacy/setup.cfg", "setup.cfg"]
 
-        # Test empty tree
-        assert commit_hook._get_list_of_committed_files() == []
+    def test_check_files_staged(self, temp_repo_dir):
+        """Test that commit_hook.check_files checks the staged content"""
 
-        # Create file "a"
-        test_file = write_file(temp_repo_dir, "a", "foo")
-        assert commit_hook._get_list_of_committed_files() == []
+        test_file = write_file(temp_repo_dir, "a.py", "x=1\n")
+        cmd(temp_repo_dir, "git add a.py")
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        blob_shas = _staged_blob_shas()
 
-        # Add "a"
-        cmd(temp_repo_dir, "git add " + test_file)
-        assert commit_hook._get_list_of_committed_files() == [test_file]
+        for name in ["subprocess", "inprocess"]:
+            assert commit_hook.check_files(
+                [test_file], "pep8", "setup.cfg", None, 0, name)
+            assert not commit_hook.check_files(
+                [test_file], "pep8", "setup.cfg", None, 0, name,
+                blob_shas=blob_shas, staged=True)
 
-        # Commit "a"
+    def test_check_files_changed_lines_only(self, temp_repo_dir):
+        """Test counting only violations on changed lines"""
+
+        test_file = write_file(temp_repo_dir, "a.py", "x=1\ny = 2\n")
+        cmd(temp_repo_dir, "git add a.py")
         cmd(temp_repo_dir, "git commit -m msg")
-        assert commit_hook._get_list_of_committed_files() == []
+        write_file(temp_repo_dir, "a.py", "x=1\ny = 3\n")
+        cmd(temp_repo_dir, "git add a.py")
+
+        output_filters = [commit_hook._changed_lines_filter(
+            gitrepo.GitRepo().changed_lines())]
+        assert not commit_hook.check_files(
+            [test_file], "pep8", "setup.cfg", None, 0)
+        assert commit_hook.check_files(
+            [test_file], "pep8", "setup.cfg", None, 0,
+            output_filters=output_filters)
+
+        write_file(temp_repo_dir, "a.py", "x=1\ny=3\n")
+        cmd(temp_repo_dir, "git add a.py")
+        output_filters = [commit_hook._changed_lines_filter(
+            gitrepo.GitRepo().changed_lines())]
+        assert not commit_hook.check_files(
+            [test_file], "pep8", "setup.cfg", None, 0,
+            output_filters=output_filters)
+
+    def test_check_repo_changed_lines_only(self, temp_repo_dir):
+        """Test that the changed lines are matched in the staged content"""
+
+        write_file(temp_repo_dir, "a.py", "x = 1\ny = 2\n")
+        cmd(temp_repo_dir, "git add a.py")
+        cmd(temp_repo_dir, "git commit -q -m msg --no-verify")
+        write_file(temp_repo_dir, "a.py", "x = 1\nz=3\n")
+        cmd(temp_repo_dir, "git add a.py")
+        # Unstaged lines move the violation in the working tree
+        write_file(temp_repo_dir, "a.py", "import os\nimport re\nx = 1\nz=3\n")
+
+        assert not commit_hook.check_repo(changed_lines_only=True)
+
+    def test_baseline(self, temp_repo_dir):
+        """Test checking files against a baseline"""
+
+        test_file = write_file(temp_repo_dir, "a.py", "x=1\n")
+        write_file(temp_repo_dir, "b", "#!/usr/bin/python\ny=2\n")
+        write_file(temp_repo_dir, "c.txt", "z=3\n")
+        cmd(temp_repo_dir, "git add .")
+        commit_hook.create_baseline(output="baseline")
+        with open("baseline", "rb") as rfile:
+            entries = [line.split(b"\t")[:2] for line in rfile]
+        assert entries == [[b"a.py", b"E225"], [b"b", b"E225"]]
+
+        write_file(temp_repo_dir, "a.py", "import os\nx=1\n")
+        output_filters = [commit_hook._baseline_filter(
+            commit_hook.Baseline.load("baseline"))]
+        assert commit_hook.check_files(
+            [test_file], "pep8", "setup.cfg", None, 0,
+            output_filters=output_filters)
+
+        write_file(temp_repo_dir, "a.py", "x=1\nw=4\n")
+        output_filters = [commit_hook._baseline_filter(
+            commit_hook.Baseline.load("baseline"))]
+        assert not commit_hook.check_files(
+            [test_file], "pep8", "setup.cfg", None, 0,
+            output_filters=output_filters)
+
+    def test_baseline_engines(self, temp_repo_dir, monkeypatch):
+        """Test that the engines recording a baseline are closed"""
+
+        closed = []
+
+        def create_engine(*args):
+            """Create an engine recording when it is closed."""
+            checker = engine.create_engine(*args)
+            close = checker.close
+            checker.close = lambda: closed.append(checker) or close()
+            return checker
+        monkeypatch.setattr(commit_hook, "create_engine", create_engine)
+
+        os.mkdir("legacy")
+        write_file(temp_repo_dir, "legacy/setup.cfg",
+                   "[pep8]\nignore = E225\n")
+        write_file(temp_repo_dir, "legacy/a.py", "x=1\n")
+        write_file(temp_repo_dir, "b.py", "x=1\n")
+        cmd(temp_repo_dir, "git add .")
+        commit_hook.create_baseline(
+            engine="inprocess", jobs=2, output="baseline")
+        assert len(set(closed)) == 2
+        assert all(checker.pool is None for checker in closed)
+        with open("baseline", "rb") as rfile:
+            entries = [line.split(b"\t")[:2] for line in rfile]
+        assert entries == [[b"b.py", b"E225"]]
+
+    def test_fail_fast(self, temp_repo_dir, capsys):
+        """Test that checking stops when the first file fails"""
+
+        for name in ["a.py", "c.py", "d.py"]:
+            write_file(temp_repo_dir, name, "x = 1\n")
+        write_file(temp_repo_dir, "b.py", "x=1\n")
+        cmd(temp_repo_dir, "git add .")
+
+        python_files = ["a.py", "b.py", "c.py", "d.py"]
+        for name in ["subprocess", "batch", "inprocess"]:
+            for jobs in [1, 2]:
+                checked_files = []
+                failed_files = []
+                assert not commit_hook.check_files(
+                    python_files, "pep8", "setup.cfg", None, 0, name, jobs,
+                    fail_fast=True, checked_files=checked_files,
+                    failed_files=failed_files)
+                assert checked_files == ["a.py", "b.py"]
+                assert failed_files == ["b.py"]
+
+        capsys.readouterr()
+        assert not commit_hook.check_repo(fail_fast=True)
+        assert "2 files were not checked" in capsys.readouterr()[0]
+
+        # The failing file is checked first the next time
+        assert not commit_hook.check_repo(fail_fast=True)
+        out = capsys.readouterr()[0]
+        assert out.startswith("Running pep8 on b.py (file 1/4)")
+        assert "3 files were not checked" in out
+
+        write_file(temp_repo_dir, "b.py", "x = 1\n")
+        cmd(temp_repo_dir, "git add .")
+        assert commit_hook.check_repo(fail_fast=True)
+        last_failures = os.path.join(
+            ".git", "pep8_commit_hook", "last_failures")
+        assert commit_hook._read_file_list(last_failures) == set()
+
+    def test_check_repo_classification(self, temp_repo_dir, capsys):
+        """Test that staged scripts are classified by their blob"""
+
+        write_file(temp_repo_dir, "script", "#!/usr/bin/env python\nx=1\n")
+        with open(write_file(temp_repo_dir, "binary", ""), "wb") as wfile:
+            wfile.write(b"#!python\0" + b"\xff" * 1000)
+        cmd(temp_repo_dir, "git add .")
+        os.remove("script")
+
+        assert not commit_hook.check_repo(staged=True)
+        out = capsys.readouterr()[0]
+        assert "Running pep8 on script" in out
+        assert "binary" not in out
+
+        classification = os.path.join(
+            ".git", "pep8_commit_hook", "classification")
+        with open(classification, "rb") as file_handle:
+            assert len(file_handle.readlines()) == 2
+
+    def test_check_repo_skips_entries(self, temp_repo_dir, capsys):
+        """Test that entries without new content are not checked"""
+
+        write_file(temp_repo_dir, "a.py", "x=1\n")
+        write_file(temp_repo_dir, "b.py", "x=2\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m init --no-verify")
+
+        os.chmod("a.py", 0o755)
+        cmd(temp_repo_dir, "git mv b.py c.py")
+        os.symlink("a.py", "d.py")
+        cmd(temp_repo_dir, "git add .")
+        with pytest.raises(SystemExit):
+            commit_hook.check_repo()
+        assert "Running pep8" not in capsys.readouterr()[0]
+
+        cmd(temp_repo_dir, "git mv c.py e.txt")
+        with pytest.raises(SystemExit):
+            commit_hook.check_repo()
+        write_file(temp_repo_dir, "f.py", "x=3\n")
+        cmd(temp_repo_dir, "git add f.py")
+        assert not commit_hook.check_repo()
+        out = capsys.readouterr()[0]
+        assert out.count("Running pep8") == 1
+        assert "f.py" in out
+
+    def test_check_repo_rename_extension(self, temp_repo_dir, capsys):
+        """Test that a blob classified without extension is checked as .py"""
+
+        write_file(temp_repo_dir, "tool", "x=1\n")
+        cmd(temp_repo_dir, "git add .")
+        with pytest.raises(SystemExit):
+            commit_hook.check_repo()
+        cmd(temp_repo_dir, "git commit -q -m init --no-verify")
+
+        cmd(temp_repo_dir, "git mv tool tool.py")
+        write_file(temp_repo_dir, "c.py", "x=1\n")
+        cmd(temp_repo_dir, "git add .")
+        assert not commit_hook.check_repo()
+        out = capsys.readouterr()[0]
+        assert "tool.py:1:2: E225" in out
+        assert "c.py:1:2: E225" in out
+
+    def test_check_repo_rename_config(self, temp_repo_dir, capsys):
+        """Test that files renamed under another config are checked"""
+
+        os.mkdir("legacy")
+        write_file(temp_repo_dir, "legacy/setup.cfg",
+                   "[pep8]\nignore = E225\n")
+        write_file(temp_repo_dir, "legacy/m.py", "x=1\n")
+        write_file(temp_repo_dir, "legacy/n.py", "x=2\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m init --no-verify")
+
+        cmd(temp_repo_dir, "git mv legacy/n.py legacy/o.py")
+        with pytest.raises(SystemExit):
+            commit_hook.check_repo()
+        cmd(temp_repo_dir, "git mv legacy/m.py m.py")
+        assert not commit_hook.check_repo()
+        out = capsys.readouterr()[0]
+        assert out.count("Running pep8") == 1
+        assert "m.py:1:2: E225" in out
+
+    def test_check_repo_merge(self, temp_repo_dir, capsys):
+        """Test that a merge only checks paths differing from every parent"""
+
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m init --no-verify")
+        cmd(temp_repo_dir, "git checkout -q -b feature")
+        write_file(temp_repo_dir, "b.py", "x=1\n")
+        write_file(temp_repo_dir, "c.py", "x=1\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m feature --no-verify")
+        cmd(temp_repo_dir, "git checkout -q -")
+        write_file(temp_repo_dir, "a.py", "x = 2\n")
+        cmd(temp_repo_dir, "git commit -q -a -m main --no-verify")
+
+        cmd(temp_repo_dir, "git merge -q --no-commit --no-ff feature")
+        assert gitrepo.GitRepo().merge_heads()
+        with pytest.raises(SystemExit):
+            commit_hook.check_repo()
+
+        write_file(temp_repo_dir, "c.py", "x=2\n")
+        cmd(temp_repo_dir, "git add c.py")
+        assert not commit_hook.check_repo()
+        out = capsys.readouterr()[0]
+        assert out.count("Running pep8") == 1
+        assert "c.py" in out
+
+    def test_check_file_list(self, temp_repo_dir, capsys):
+        """Test checking a list of files without asking git"""
+
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        write_file(temp_repo_dir, "b.py", "x=1\n")
+        write_file(temp_repo_dir, "c.txt", "x=1\n")
+
+        assert commit_hook.check_file_list([])
+        assert commit_hook.check_file_list(iter(["a.py", "c.txt", "d"]))
+        out = capsys.readouterr()[0]
+        assert out.count("Running pep8") == 1
+        assert "File not found: d" in out
+
+        assert not commit_hook.check_file_list(["a.py", "b.py"])
+        assert commit_hook.check_file_list(
+            ["a.py", "b.py"], max_violations_per_file=1)
+
+    def test_main_files(self, temp_repo_dir, capsys, monkeypatch):
+        """Test that files named like a command are checked after --"""
+
+        write_file(temp_repo_dir, "audit", "#!/usr/bin/env python\nx=1\n")
+        monkeypatch.setattr(sys, "argv", ["hook", "--", "audit"])
+        with pytest.raises(SystemExit) as exit_info:
+            commit_hook.main()
+        assert exit_info.value.code == 1
+        assert "Running pep8 on audit" in capsys.readouterr()[0]
+
+    def test_main_invalid_range(self, temp_repo_dir, capsys, monkeypatch):
+        """Test that an invalid range is reported as a usage error"""
+
+        monkeypatch.setattr(sys, "argv", ["hook", "--range", "nope..HEAD"])
+        with pytest.raises(SystemExit) as exit_info:
+            commit_hook.main()
+        assert exit_info.value.code == 2
+        assert "Invalid --range: nope..HEAD" in capsys.readouterr()[1]
+
+    def test_check_repo_exclude(self, temp_repo_dir, capsys):
+        """Test that excluded files are not checked"""
+
+        os.mkdir("vendor")
+        write_file(temp_repo_dir, "vendor/a.py", "x=1\n")
+        write_file(temp_repo_dir, "b_pb2.py", "x=1\n")
+        write_file(temp_repo_dir, "c.py", "x = 1\n")
+        cmd(temp_repo_dir, "git add .")
+        assert not commit_hook.check_repo()
+        capsys.readouterr()
+
+        assert commit_hook.check_repo(exclude="vendor/ *_pb2.py")
+        assert capsys.readouterr()[0].count("Running pep8") == 1
+        write_file(temp_repo_dir, "setup.cfg",
+                   "[pep8_pre_commit_hook]\ninclude = vendor/\n")
+        with pytest.raises(SystemExit):
+            commit_hook.check_repo(exclude="vendor/ *_pb2.py")
+
+    def test_check_repo_range(self, temp_repo_dir, capsys):
+        """Test checking the files changed between two commits"""
+
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m base --no-verify")
+        write_file(temp_repo_dir, "a.py", "x = 1\ny=2\n")
+        write_file(temp_repo_dir, "b.py", "x = 1\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m head --no-verify")
+
+        # The working tree and the index don't matter
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        write_file(temp_repo_dir, "c.py", "x=1\n")
+        cmd(temp_repo_dir, "git add .")
+
+        for jobs in [1, 2]:
+            assert not commit_hook.check_repo(
+                engine="inprocess", jobs=jobs, cache=True,
+                revision_range="HEAD~1..HEAD")
+            out = capsys.readouterr()[0]
+            assert out.count("Running pep8") == 2
+            assert "a.py:2:2: E225" in out
+            assert "c.py" not in out
+
+        assert commit_hook.check_repo(
+            changed_lines_only=True, exclude="a.py",
+            revision_range="HEAD~1...HEAD")
+
+    def test_check_repo_shard(self, temp_repo_dir, capsys):
+        """Test splitting a range over shards and merging their reports"""
+
+        cmd(temp_repo_dir, "git commit -q -m base --no-verify --allow-empty")
+        for index in range(6):
+            write_file(temp_repo_dir, "{}.py".format(index),
+                       "x = {}\n".format(index) * (index + 1))
+        write_file(temp_repo_dir, "bad.py", "x=1\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m head --no-verify")
+        capsys.readouterr()
+
+        for shard_by in ["path", "size"]:
+            checked = []
+            reports = []
+            for index in [1, 2, 3]:
+                reports.append(os.path.join(
+                    temp_repo_dir, "{}.json".format(index)))
+                try:
+                    commit_hook.check_repo(
+                        engine="inprocess", revision_range="HEAD~1..HEAD",
+                        shard=(index, 3), shard_by=shard_by,
+                        report=reports[-1])
+                except SystemExit:
+                    # A shard without files
+                    pass
+                checked.extend(
+                    line.split()[3]
+                    for line in capsys.readouterr()[0].splitlines()
+                    if line.startswith("Running pep8 on"))
+            assert sorted(checked) == [
+                "0.py", "1.py", "2.py", "3.py", "4.py", "5.py", "bad.py"]
+
+            with pytest.raises(SystemExit) as error:
+                commit_hook.merge_reports_main(reports)
+            assert error.value.code == 1
+            output = capsys.readouterr()[0]
+            assert "bad.py\t\tFAILED" in output
+            assert "7 files checked by 3 shards, 1 failed" in output
 
-        # Edit "a"
-        write_file(temp_repo_dir, "a", "bar")
-        assert commit_hook._get_list_of_committed_files() == []
+    def test_check_queue(self, temp_repo_dir, capsys):
+        """Test checking the files of a queue shared by runners"""
 
-        # Add "a"
-        cmd(temp_repo_dir, "git add " + test_file)
-        assert commit_hook._get_list_of_committed_files() == [test_file]
+        write_file(temp_repo_dir, "a.py", "x=1\n")
+        write_file(temp_repo_dir, "b.py", "x = 2\n")
+        write_file(temp_repo_dir, "c.py", "x = 2\n")
+        write_file(temp_repo_dir, "d.txt", "x=4\n")
+        cmd(temp_repo_dir, "git add .")
+        queue = os.path.join(temp_repo_dir, "queue")
+
+        assert not commit_hook.check_queue(
+            queue, engine="inprocess", batch_size=1, owner="one")
+        output = capsys.readouterr()[0]
+        # The content of c.py is checked as b.py
+        assert output.count("Running pep8") == 2
+        assert "All batches done: 2 files checked by all runners, 1 failed" \
+            in output
+
+        assert commit_hook.check_queue(queue, owner="two")
+        output = capsys.readouterr()[0]
+        assert "Checked 0 files, 0 failed" in output
+        assert "All batches done" in output
+
+    def test_check_queue_config(self, temp_repo_dir, capsys):
+        """Test that a blob is queued for every config it is checked with"""
+
+        os.mkdir("legacy")
+        write_file(temp_repo_dir, "legacy/setup.cfg",
+                   "[pep8]\nignore = E225\n")
+        write_file(temp_repo_dir, "legacy/a.py", "x=1\n")
+        write_file(temp_repo_dir, "z.py", "x=1\n")
+        cmd(temp_repo_dir, "git add .")
+
+        assert not commit_hook.check_queue(
+            os.path.join(temp_repo_dir, "queue"), engine="inprocess")
+        out = capsys.readouterr()[0]
+        assert "Checked 2 files, 1 failed" in out
+        assert "z.py:1:2: E225" in out
+
+    def test_check_queue_lease(self, temp_repo_dir, capsys, monkeypatch):
+        """Test that leases are renewed and released with fail_fast"""
+
+        renewed = []
+        renew = commit_hook.WorkQueue.renew
+        monkeypatch.setattr(
+            commit_hook.WorkQueue, "renew",
+            lambda queue, batch: renewed.append(batch.name) or renew(
+                queue, batch))
+
+        write_file(temp_repo_dir, "a.py", "x=1\n")
+        write_file(temp_repo_dir, "b.py", "x = 2\n")
+        write_file(temp_repo_dir, "c.py", "x = 3\n")
+        cmd(temp_repo_dir, "git add .")
+        queue = os.path.join(temp_repo_dir, "queue")
+
+        assert not commit_hook.check_queue(
+            queue, engine="inprocess", batch_size=10, fail_fast=True)
+        output = capsys.readouterr()[0]
+        assert "Checked 1 files, 1 failed" in output
+        assert "All batches done: 1 files checked by all runners, 1 failed" \
+            in output
+        assert renewed == ["00000000"]
+
+        assert commit_hook.check_queue(
+            os.path.join(temp_repo_dir, "other"), engine="inprocess",
+            batch_size=10, include="b.py c.py")
+        assert renewed[1:] == ["00000000", "00000000"]
+
+    def test_watch_repo(self, temp_repo_dir, checked_files):
+        """Test that files checked when saved are not checked on commit"""
+
+        write_file(temp_repo_dir, "a.py", "x=1\n")
+        write_file(temp_repo_dir, "b.txt", "x=1\n")
+        os.mkdir("c")
+        commit_hook.watch_repo(
+            engine="inprocess",
+            changes=[["missing", "c", "a.py", "b.txt", "missing.py"]])
+        assert checked_files == ["a.py"]
+
+        cmd(temp_repo_dir, "git add .")
+        del checked_files[:]
+        assert not commit_hook.check_repo(
+            engine="inprocess", cache=True, staged=True)
+        assert checked_files == []
+
+    def test_watch_repo_config(self, temp_repo_dir, capsys):
+        """Test that the configs are looked up again once one is saved"""
+
+        os.mkdir("legacy")
+        write_file(temp_repo_dir, "legacy/a.py", "x=1\n")
+
+        def saved_config():
+            """Add a config to the directory of the saved file."""
+            yield ["legacy/a.py"]
+            write_file(temp_repo_dir, "legacy/setup.cfg",
+                       "[pep8]\nignore = E225\n")
+            yield ["legacy/setup.cfg", "legacy/a.py"]
+        commit_hook.watch_repo(engine="inprocess", changes=saved_config())
+        out = capsys.readouterr()[0]
+        assert out.count("1 violations (max 0) - FAILED") == 1
+        assert out.count("0 violations (max 0) - PASSED") == 1
+
+    def test_watch_repo_baseline(self, temp_repo_dir, capsys):
+        """Test that every save is filtered by the whole baseline"""
+
+        write_file(temp_repo_dir, "a.py", "x=1\n")
+        cmd(temp_repo_dir, "git add .")
+        commit_hook.create_baseline(engine="inprocess", output="baseline")
+        capsys.readouterr()
+
+        commit_hook.watch_repo(
+            engine="inprocess", baseline="baseline",
+            changes=[["a.py"], ["a.py"]])
+        out = capsys.readouterr()[0]
+        assert out.count("0 violations (max 0) - PASSED") == 2
+
+    def test_memory_results(self, temp_repo_dir, monkeypatch, checked_files):
+        """Test that the hook server checks unchanged files once"""
+
+        monkeypatch.setattr(commit_hook, "_MEMORY_RESULTS", cache.LRU(10))
+
+        write_file(temp_repo_dir, "a.py", "x=1\n")
+        cmd(temp_repo_dir, "git add .")
+        for _ in range(2):
+            assert not commit_hook.check_repo(engine="inprocess")
+        assert checked_files == ["a.py"]
+
+    def test_server_engines(self, temp_repo_dir, monkeypatch):
+        """Test that the hook server keeps the engines between checks"""
+
+        created = []
+
+        def create_engine(*args):
+            """Create an engine and record its arguments."""
+            created.append(args)
+            return engine.create_engine(*args)
+        monkeypatch.setattr(commit_hook, "create_engine", create_engine)
+        monkeypatch.setattr(commit_hook, "_SERVER_ENGINES", {})
+
+        for contents in ["x=1\n", "x=2\n"]:
+            write_file(temp_repo_dir, "a.py", contents)
+            cmd(temp_repo_dir, "git add .")
+            assert not commit_hook.check_repo(engine="inprocess")
+        assert len(created) == 1
+
+        # An edited config gets a new engine
+        write_file(temp_repo_dir, "setup.cfg", "[pep8]\nignore = E225\n")
+        assert commit_hook.check_repo(engine="inprocess")
+        assert len(created) == 2
+
+    def test_check_push(self, temp_repo_dir, capsys):
+        """Test checking every commit about to be pushed"""
+
+        def commit(message):
+            """Commit all files and return the SHA of the commit"""
+            cmd(temp_repo_dir, "git add -A")
+            cmd(temp_repo_dir, "git commit -q --no-verify -m " + message)
+            return cmd(temp_repo_dir, "git rev-parse HEAD").decode().strip()
+
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        base = commit("base")
+        write_file(temp_repo_dir, "a.py", "x=1\n")
+        first = commit("first")
+        write_file(temp_repo_dir, "b.py", "x=1\n")
+        head = commit("second")
+
+        zero = "0" * 40
+        lines = ["refs/heads/master {} refs/heads/master {}\n".format(
+            head, base)]
+        assert not commit_hook.check_push(lines)
+        out = capsys.readouterr()[0]
+        assert "Checking commit " + first in out
+        assert "Checking commit " + head not in out
+        assert out.count("Running pep8") == 1
+
+        # Deleted refs and commits the remote has are not checked
+        assert commit_hook.check_push(
+            ["(delete) {} refs/heads/master {}\n".format(zero, head)])
+        cmd(temp_repo_dir, "git update-ref refs/remotes/origin/master " +
+            first)
+        lines = ["refs/heads/master {} refs/heads/master {}\n".format(
+            head, zero)]
+        assert not commit_hook.check_push(lines, "origin")
+        out = capsys.readouterr()[0]
+        assert "Checking commit " + head in out
+        assert "Checking commit " + first not in out
+        assert not commit_hook.check_push(lines, "other")
+        assert "Checking commit " + first in capsys.readouterr()[0]
+
+    def test_check_push_baseline(self, temp_repo_dir, capsys):
+        """Test that every pushed commit is filtered by the whole baseline"""
+
+        def commit(message):
+            """Commit all files and return the SHA of the commit"""
+            cmd(temp_repo_dir, "git add -A")
+            cmd(temp_repo_dir, "git commit -q --no-verify -m " + message)
+            return cmd(temp_repo_dir, "git rev-parse HEAD").decode().strip()
+
+        write_file(temp_repo_dir, "a.py", "x=1\ny=2\n")
+        base = commit("base")
+        commit_hook.create_baseline(engine="inprocess", output="baseline")
+        write_file(temp_repo_dir, "a.py", "x=1\ny=2\nz = 3\n")
+        commit("first")
+        write_file(temp_repo_dir, "a.py", "x=1\ny=2\nz = 4\n")
+        head = commit("second")
+        capsys.readouterr()
+
+        lines = ["refs/heads/master {} refs/heads/master {}\n".format(
+            head, base)]
+        assert commit_hook.check_push(
+            lines, engine="inprocess", baseline="baseline")
+        out = capsys.readouterr()[0]
+        assert out.count("0 violations (max 0) - PASSED") == 2
+
+    def test_check_push_config(self, temp_repo_dir, capsys):
+        """Test that a blob moved under another config is checked again"""
+
+        os.mkdir("legacy")
+        write_file(temp_repo_dir, "legacy/setup.cfg",
+                   "[pep8]\nignore = E225\n")
+        cmd(temp_repo_dir, "git add -A")
+        cmd(temp_repo_dir, "git commit -q --no-verify -m base")
+        base = cmd(temp_repo_dir, "git rev-parse HEAD").decode().strip()
+        write_file(temp_repo_dir, "legacy/a.py", "x=1\n")
+        cmd(temp_repo_dir, "git add -A")
+        cmd(temp_repo_dir, "git commit -q --no-verify -m first")
+        write_file(temp_repo_dir, "z.py", "x=1\n")
+        cmd(temp_repo_dir, "git add -A")
+        cmd(temp_repo_dir, "git commit -q --no-verify -m second")
+        head = cmd(temp_repo_dir, "git rev-parse HEAD").decode().strip()
+        capsys.readouterr()
+
+        lines = ["refs/heads/master {} refs/heads/master {}\n".format(
+            head, base)]
+        assert not commit_hook.check_push(lines, engine="inprocess")
+        out = capsys.readouterr()[0]
+        assert "z.py:1:2: E225" in out
+
+    def test_check_push_merge(self, temp_repo_dir, capsys):
+        """Test that the conflict resolutions of pushed merges are checked"""
+
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        write_file(temp_repo_dir, "b.py", "x = 1\n")
+        cmd(temp_repo_dir, "git add -A")
+        cmd(temp_repo_dir, "git commit -q --no-verify -m base")
+        base = cmd(temp_repo_dir, "git rev-parse HEAD").decode().strip()
+        cmd(temp_repo_dir, "git checkout -q -b side")
+        write_file(temp_repo_dir, "a.py", "x = 2\n")
+        write_file(temp_repo_dir, "b.py", "x = 2\n")
+        cmd(temp_repo_dir, "git commit -q -a --no-verify -m side")
+        cmd(temp_repo_dir, "git checkout -q -")
+        write_file(temp_repo_dir, "a.py", "x = 3\n")
+        cmd(temp_repo_dir, "git commit -q -a --no-verify -m main")
+        with pytest.raises(subprocess.CalledProcessError):
+            cmd(temp_repo_dir, "git merge -q side")
+        write_file(temp_repo_dir, "a.py", "x=4\n")
+        cmd(temp_repo_dir, "git add -A")
+        cmd(temp_repo_dir, "git commit -q --no-verify -m merge")
+        head = cmd(temp_repo_dir, "git rev-parse HEAD").decode().strip()
+        capsys.readouterr()
+
+        lines = ["refs/heads/master {} refs/heads/master {}\n".format(
+            head, base)]
+        assert not commit_hook.check_push(lines, engine="inprocess")
+        out = capsys.readouterr()[0].split("Checking commit " + head)[1]
+        assert "Running pep8 on a.py (file 1/1)" in out
+        assert "E225" in out
+        assert "b.py" not in out
+
+    def test_check_receive(self, temp_repo_dir, capsys, checked_files):
+        """Test checking pushed commits in bare repositories"""
+
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m base --no-verify")
+        write_file(temp_repo_dir, "b.py", "x=1\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m head --no-verify")
+        head = cmd(temp_repo_dir, "git rev-parse HEAD").decode().strip()
+
+        # The pushed objects are in the bare repositories, but no ref
+        # points to them yet
+        for name in ["one.git", "two.git"]:
+            cmd(temp_repo_dir, "git clone -q --bare . " + name)
+            cmd(os.path.join(temp_repo_dir, name),
+                "git update-ref refs/heads/master HEAD~1")
+
+        cache_directory = os.path.join(temp_repo_dir, "cache")
+        lines = ["{} {} refs/heads/master\n".format("0" * 40, head)]
+        for name in ["one.git", "two.git"]:
+            os.chdir(os.path.join(temp_repo_dir, name))
+            assert not commit_hook.check_receive(
+                lines, engine="inprocess", cache_directory=cache_directory)
+            assert "b.py:1:2: E225" in capsys.readouterr()[0]
+        assert checked_files == ["b.py"]
+
+        assert commit_hook.check_receive(
+            ["{} {} refs/heads/master\n".format(head, "0" * 40)])
+
+    def test_audit_repo(self, temp_repo_dir, capsys):
+        """Test that an interrupted audit resumes"""
+
+        def checked_files():
+            """Return the files checked since the last call."""
+            return sorted(line.split()[3]
+                          for line in capsys.readouterr()[0].splitlines()
+                          if line.startswith("Running pep8 on"))
+
+        write_file(temp_repo_dir, "a.py", "x=1\n")
+        write_file(temp_repo_dir, "b.py", "x = 2\n")
+        write_file(temp_repo_dir, "c.py", "x=3\n")
+        write_file(temp_repo_dir, "d.py", "x = 2\n")
+        write_file(temp_repo_dir, "e.txt", "x=4\n")
+        cmd(temp_repo_dir, "git add .")
+        checkpoint = os.path.join(
+            temp_repo_dir, ".git", "pep8_commit_hook", "audit")
+
+        assert not commit_hook.audit_repo(engine="inprocess", fail_fast=True)
+        assert os.path.exists(checkpoint)
+        first = checked_files()
+        assert len(first) == 1
+
+        assert not commit_hook.audit_repo(engine="inprocess")
+        assert not os.path.exists(checkpoint)
+        # Every blob is checked once, d.py has the content of b.py
+        assert sorted(first + checked_files()) == ["a.py", "b.py", "c.py"]
+
+        assert commit_hook.audit_repo(engine="inprocess", include="b.py")
+        assert checked_files() == ["b.py"]
+
+    def test_audit_repo_config(self, temp_repo_dir, capsys, monkeypatch):
+        """Test that a blob is audited with every config it is checked with"""
+
+        trees = []
+
+        def config_tree(config):
+            """Create a config tree and record it."""
+            trees.append(configtree.ConfigTree(config))
+            return trees[-1]
+        monkeypatch.setattr(commit_hook, "ConfigTree", config_tree)
+        monkeypatch.setattr(commit_hook, "AUDIT_CHUNK_SIZE", 1)
+
+        os.mkdir("legacy")
+        write_file(temp_repo_dir, "legacy/setup.cfg",
+                   "[pep8]\nignore = E225\n")
+        write_file(temp_repo_dir, "legacy/a.py", "x=1\n")
+        write_file(temp_repo_dir, "legacy/b.py", "x=1\n")
+        write_file(temp_repo_dir, "z.py", "x=1\n")
+        cmd(temp_repo_dir, "git add .")
+
+        assert not commit_hook.audit_repo(engine="inprocess")
+        out = capsys.readouterr()[0]
+        assert "Audited 2 files, 1 failed" in out
+        assert "z.py:1:2: E225" in out
+        # Every chunk looks up the configs in the same tree
+        assert len(trees) == 1
+
+        # The baseline is matched by path, so every path is checked
+        cmd(temp_repo_dir, "git commit -q -m init --no-verify")
+        commit_hook.create_baseline(engine="inprocess", output="baseline")
+        cmd(temp_repo_dir, "git add baseline")
+        assert commit_hook.audit_repo(engine="inprocess", baseline="baseline")
+        assert "Audited 3 files, 0 failed" in capsys.readouterr()[0]
 
     def test_is_python_file(self, temp_repo_dir):
         """Test commit_hook._is_python_file"""
@@ -68,6 +824,11 @@ class TestPep8CommitHook(object):
         write_file(temp_repo_dir, "b", "#!/usr/bin/env python")
         assert commit_hook._is_python_file(test_file)
 
+        # Binary, and content instead of the file contents
+        assert commit_hook._is_python_file("b", b"#!python\0") is False
+        assert commit_hook._is_python_file("b", b"#!/bin/sh\npython") is False
+        assert commit_hook._is_python_file("b", b"#!/bin/python\n\xff")
+
     def test_parse_score(self):
         """Test commit_hook._parse_score"""
 
@@ -79,3 +840,9 @@ class TestPep8CommitHook(object):
 
         text = "...\n..."
         assert commit_hook._parse_violations(text) == 2
+
+
+def _staged_blob_shas():
+    """Return the staged blob SHA of every staged file."""
+    return dict((entry.path, entry.new_sha)
+                for entry in gitrepo.GitRepo().staged_entries())
@@ -0,0 +1,112 @@
+"""
+This module contains the tests for the configuration of the commit hook.
+"""
+
+import collections
+import os
+
+import pytest
+
+from conftest import write_file
+from git_pep8_commit_hook import config
+
+
+class TestConfig(object):
+    """
+    Test class for the configuration of the commit hook.
+    """
+    # pylint: disable=no-self-use,protected-access
+
+    def test_read_options(self, temp_repo_dir):
+        """Test config.read_options"""
+
+        write_file(temp_repo_dir, "setup.cfg", "\n".join([
+            "[pep8_pre_commit_hook]",
+            "pep8-params = --first",
+            "jobs = 4",
+            "cache = true",
+            "engine = batch"]))
+        defaults = collections.OrderedDict([
+            ("pep8-params", None), ("jobs", 1), ("cache", False),
+            ("engine", "subprocess"), ("staged", False)])
+        options = config.read_options("setup.cfg", defaults)
+        assert options == ("--first", 4, True, "batch", False)
+        assert options.jobs == 4
+        with pytest.raises(AttributeError):
+            options.jobs = 2
+
+        defaults = {"pep8-params": "--show-source"}
+        assert config.read_options("setup.cfg", defaults).pep8_params == (
+            "--show-source --first")
+        assert config.read_options("missing.cfg", defaults) == (
+            "--show-source",)
+
+    def test_read_options_sources(self, temp_repo_dir):
+        """Test the precedence of the config files"""
+
+        write_file(temp_repo_dir, "tox.ini", "\n".join([
+            "[pep8_pre_commit_hook]",
+            "pep8-params = --first",
+            "engine = batch",
+            "jobs = 2"]))
+        write_file(temp_repo_dir, "setup.cfg", "\n".join([
+            "[pep8_pre_commit_hook]",
+            "jobs = 3"]))
+        defaults = collections.OrderedDict([
+            ("pep8-params", "--show-source"), ("engine", "subprocess"),
+            ("jobs", 1), ("cache", False), ("exclude", None)])
+        assert config.read_options("setup.cfg", defaults) == (
+            "--show-source --first", "batch", 3, False, None)
+
+        if config.tomllib is None:
+            return
+        write_file(temp_repo_dir, "pyproject.toml", "\n".join([
+            "[tool.pep8_pre_commit_hook]",
+            "pep8-params = '--show-pep8'",
+            "cache = true",
+            "jobs = 5",
+            "exclude = ['vendor/', '*_pb2.py']"]))
+        assert config.read_options("setup.cfg", defaults) == (
+            "--show-source --show-pep8 --first", "batch", 3, True,
+            "vendor/ *_pb2.py")
+
+    def test_read_once(self, temp_repo_dir, monkeypatch):
+        """Test that unchanged config files are read once"""
+
+        write_file(temp_repo_dir, "setup.cfg",
+                   "[pep8_pre_commit_hook]\njobs = 3\n")
+        loads = []
+        load_ini = config._load_ini
+
+        def counting_load_ini(path):
+            """Record the loaded file"""
+            loads.append(path)
+            return load_ini(path)
+
+        monkeypatch.setattr(config, "_load_ini", counting_load_ini)
+        for _ in range(3):
+            assert config.read_options("setup.cfg", {"jobs": 1}) == (3,)
+        assert loads == ["setup.cfg"]
+
+        write_file(temp_repo_dir, "setup.cfg",
+                   "[pep8_pre_commit_hook]\njobs = 42\n")
+        assert config.read_options("setup.cfg", {"jobs": 1}) == (42,)
+
+    def test_files_fingerprint(self, temp_repo_dir):
+        """Test config.files_fingerprint"""
+
+        state = os.path.join(temp_repo_dir, "state", "configs")
+        write_file(temp_repo_dir, "a.cfg", "a")
+        fingerprint = config.files_fingerprint(["a.cfg", "missing.cfg"])
+        assert config.files_fingerprint(["a.cfg"], state) == fingerprint
+        assert len(config._read_state(state)) == 1
+
+        # The digest is taken from the state while the file is unchanged
+        config._write_state(state, dict(
+            (key, "0" * 40) for key in config._read_state(state)))
+        assert config.files_fingerprint(["a.cfg"], state) != fingerprint
+
+        write_file(temp_repo_dir, "a.cfg", "b")
+        changed = config.files_fingerprint(["a.cfg"], state)
+        assert changed not in [fingerprint, config.files_fingerprint([])]
+        assert len(config._read_state(state)) == 1
@@ -0,0 +1,71 @@
+"""
+This module contains the tests for the per-directory config lookup.
+"""
+
+import os
+
+from conftest import write_file
+from git_pep8_commit_hook import commit_hook, configtree
+
+
+class TestConfigTree(object):
+    """
+    Test class for configtree.ConfigTree.
+    """
+    # pylint: disable=no-self-use
+
+    def test_config_for(self, temp_repo_dir, monkeypatch):
+        """Test finding the nearest config once per directory"""
+
+        for directory in ["a/b/c", "d", "e"]:
+            os.makedirs(os.path.join(temp_repo_dir, directory))
+        write_file(temp_repo_dir, "a/tox.ini", "[pep8]\nignore = E225\n")
+        write_file(temp_repo_dir, "a/b/c/setup.cfg", "[metadata]\n")
+        write_file(temp_repo_dir, "d/.pep8", "[pep8]\n")
+        write_file(temp_repo_dir, "e/setup.cfg", "not a config")
+
+        lookups = []
+        find_config = configtree._find_config
+
+        def counting_find_config(directory):
+            """Record the looked up directory"""
+            lookups.append(directory)
+            return find_config(directory)
+
+        monkeypatch.setattr(configtree, "_find_config", counting_find_config)
+
+        tree = configtree.ConfigTree("setup.cfg")
+        filenames = ["x.py", "a/x.py", "a/b/c/x.py", "d/x.py", "a/b/y.py",
+                     "e/x.py", "./a/b/c/y.py"]
+        assert [tree.config_for(filename) for filename in filenames] == [
+            "setup.cfg", os.path.join("a", "tox.ini"),
+            os.path.join("a", "tox.ini"), os.path.join("d", ".pep8"),
+            os.path.join("a", "tox.ini"), "setup.cfg",
+            os.path.join("a", "tox.ini")]
+        assert sorted(lookups) == sorted(
+            ["a", os.path.join("a", "b"), os.path.join("a", "b", "c"), "d",
+             "e"])
+
+        assert list(tree.group(filenames).items()) == [
+            ("setup.cfg", ["x.py", "e/x.py"]),
+            (os.path.join("a", "tox.ini"),
+             ["a/x.py", "a/b/c/x.py", "a/b/y.py", "./a/b/c/y.py"]),
+            (os.path.join("d", ".pep8"), ["d/x.py"])]
+
+    def test_check_files(self, temp_repo_dir):
+        """Test checking every file with its nearest config"""
+
+        os.mkdir("sub")
+        write_file(temp_repo_dir, "sub/setup.cfg", "[pep8]\nignore = E225\n")
+        write_file(temp_repo_dir, "sub/a.py", "x=1\n")
+        write_file(temp_repo_dir, "b.py", "x=1\n")
+
+        for name in ["subprocess", "batch", "inprocess"]:
+            for jobs in [1, 2]:
+                assert commit_hook.check_files(
+                    ["sub/a.py"], "pep8", "setup.cfg", None, 0, name, jobs)
+                failed_files = []
+                assert not commit_hook.check_files(
+                    ["b.py", "sub/a.py"], "pep8", "setup.cfg", None, 0,
+                    name, jobs, failed_files=failed_files)
+                assert failed_files == ["b.py"]
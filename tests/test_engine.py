@@ -0,0 +1,236 @@
+"""
+This module contains the tests for the pep8 engines.
+"""
+
+import os
+import stat
+import time
+
+import pytest
+
+from conftest import write_file
+from git_pep8_commit_hook import commit_hook, engine
+
+
+BAD_SOURCE = "import os, sys\nx=1\ny = 2 \n"
+
+
+class TestEngine(object):
+    """
+    Test class for the pep8 engines.
+    """
+    # pylint: disable=protected-access,no-self-use
+
+    def test_pep8_arguments(self):
+        """Test engine.pep8_arguments"""
+
+        assert engine.pep8_arguments(None, "setup.cfg") == [
+            "--config=setup.cfg"]
+        assert engine.pep8_arguments("--first", "setup.cfg") == [
+            "--first", "--config=setup.cfg"]
+        assert engine.pep8_arguments("--config=a.cfg", "setup.cfg") == [
+            "--config=a.cfg"]
+
+    def test_inprocess_matches_subprocess(self, temp_repo_dir):
+        """Test that both engines produce the same pep8 output"""
+
+        test_file = write_file(temp_repo_dir, "a.py", BAD_SOURCE)
+        write_file(temp_repo_dir, "setup.cfg", "[pep8]\nignore = E225\n")
+
+        params_list = [None, "--first", "--show-source", "--max-line-length=5"]
+        for params in params_list:
+            inprocess = engine.InProcessEngine("setup.cfg", params)
+            subprocess = engine.SubprocessEngine("pep8", "setup.cfg", params)
+            out = inprocess.check(test_file)
+            assert out == subprocess.check(test_file)
+            assert commit_hook._parse_violations(out) > 0
+
+    def test_parse_pep8_options(self, temp_repo_dir):
+        """Test passing the parsed pep8 options to the in-process engine"""
+
+        test_file = write_file(temp_repo_dir, "a.py", BAD_SOURCE)
+        write_file(temp_repo_dir, "setup.cfg", "[pep8]\nignore = E225\n")
+
+        arguments = engine.pep8_arguments("--first", "setup.cfg")
+        options = engine.parse_pep8_options(arguments, "setup.cfg")
+        assert options["ignore"] == ["E225"]
+        os.remove("setup.cfg")
+        assert engine.InProcessEngine(
+            "setup.cfg", "--first", options).check(test_file) == (
+                engine.InProcessEngine("setup.cfg", "--first --ignore=E225")
+                .check(test_file))
+
+    def test_check_data(self, temp_repo_dir):
+        """Test checking content instead of the file contents"""
+
+        test_file = write_file(temp_repo_dir, "a.py", "")
+        data = BAD_SOURCE.encode("utf-8")
+        for name in ["subprocess", "batch", "inprocess"]:
+            for jobs in [1, 2]:
+                checker = engine.create_engine(
+                    name, "pep8", "setup.cfg", None, jobs)
+                assert checker.check(test_file) == b""
+
+                out = checker.check(test_file, data)
+                assert out.startswith(b"a.py:1:10: E401")
+                assert list(checker.check_many(
+                    [test_file, test_file], lambda _: data)) == [out, out]
+
+    def test_decode_lines(self):
+        """Test engine._decode_lines"""
+
+        assert engine._decode_lines(b"a\r\nb\n") == ["a\n", "b\n"]
+        data = u"# -*- coding: latin-1 -*-\nx = '\xe6'\n".encode("latin-1")
+        assert engine._decode_lines(data)[1] == u"x = '\xe6'\n"
+        assert engine._decode_lines(b"# coding: nope\n\xe6") == [
+            u"# coding: nope\n", u"\xe6"]
+
+    def test_check_files(self, temp_repo_dir):
+        """Test commit_hook.check_files with the in-process engine"""
+
+        good_file = write_file(temp_repo_dir, "a.py", "x = 1\n")
+        bad_file = write_file(temp_repo_dir, "b.py", BAD_SOURCE)
+
+        assert commit_hook.check_files(
+            [good_file], "pep8", "setup.cfg", None, 0, "inprocess")
+        assert not commit_hook.check_files(
+            [good_file, bad_file], "pep8", "setup.cfg", None, 0, "inprocess")
+        assert commit_hook.check_files(
+            [good_file, bad_file], "pep8", "setup.cfg", None, 3, "inprocess")
+
+    def test_parallel(self, temp_repo_dir):
+        """Test that the parallel engine keeps the order of the files"""
+
+        test_files = []
+        for i in range(20):
+            source = "x = 1\n" if i % 3 else BAD_SOURCE
+            test_files.append(write_file(temp_repo_dir, "%d.py" % i, source))
+
+        inprocess = engine.InProcessEngine("setup.cfg")
+        parallel = engine.create_engine("inprocess", "pep8", "setup.cfg",
+                                        None, jobs=3)
+        assert isinstance(parallel, engine.ParallelEngine)
+        assert list(parallel.check_many(test_files)) == [
+            inprocess.check(test_file) for test_file in test_files]
+
+        # The pool is kept for the next check, unless it was cancelled
+        pool = parallel.pool
+        assert list(parallel.check_many(test_files[:2])) == [
+            inprocess.check(test_file) for test_file in test_files[:2]]
+        assert parallel.pool is pool
+        results = parallel.check_many(test_files)
+        next(results)
+        results.close()
+        assert parallel.pool is None
+        assert parallel.check(test_files[0]) == inprocess.check(test_files[0])
+        parallel.close()
+        assert parallel.pool is None
+
+    def test_batches(self, temp_repo_dir):
+        """Test engine._batches"""
+
+        small = write_file(temp_repo_dir, "small.py", "x = 1\n")
+        large = write_file(
+            temp_repo_dir, "large.py", "x = 1\n" * engine.BATCH_SIZE)
+
+        assert list(engine._batches([small] * 8, 1)) == [
+            [(small, None), (small, None)]] * 4
+        batches = engine._batches([small] * 3 + [large] + [small] * 36, 1)
+        assert [len(batch) for batch in batches] == [4, 10, 10, 10, 6]
+
+    def test_batch_matches_subprocess(self, temp_repo_dir):
+        """Test that the batch engine splits the output per file"""
+
+        test_files = [
+            write_file(temp_repo_dir, "a.py", BAD_SOURCE),
+            write_file(temp_repo_dir, "b.py", "x = 1\n"),
+            write_file(temp_repo_dir, "c.py", "x=1\n")]
+
+        for params in [None, "--show-source", "--show-pep8"]:
+            batch = engine.BatchEngine("pep8", "setup.cfg", params)
+            subprocess = engine.SubprocessEngine("pep8", "setup.cfg", params)
+            assert list(batch.check_many(test_files)) == [
+                subprocess.check(test_file) for test_file in test_files]
+
+    def test_split_output(self):
+        """Test engine.split_output"""
+
+        output = (b"a.py:1:1: E1 a\n"
+                  b"  source\n"
+                  b"b:1:2.py:2:1: E2 b\n"
+                  b"b:1:2.py\n"
+                  b"a.py:3:1: E3 a\n")
+        assert engine.split_output(output, ["a.py", "b:1:2.py", "c.py"]) == {
+            "a.py": b"a.py:1:1: E1 a\n  source\na.py:3:1: E3 a\n",
+            "b:1:2.py": b"b:1:2.py:2:1: E2 b\nb:1:2.py\n",
+            "c.py": b""}
+
+    def test_filter_output(self):
+        """Test engine.filter_output"""
+
+        output = (b"a.py:1:1: E1 a\n"
+                  b"  source\n"
+                  b"a.py:3:1: E3 a\n"
+                  b"  source\n")
+        assert engine.filter_output(
+            output, "a.py", lambda row, _: row == 3) == (
+                b"a.py:3:1: E3 a\n  source\n")
+        assert engine.filter_output(output, "a.py", lambda *_: True) == output
+
+    def test_chunks(self):
+        """Test that engine._chunks stays below the command line limit"""
+
+        max_length = engine._max_command_length()
+        filenames = ["%06d.py" % i for i in range(max_length // 5)]
+        chunks = list(engine._chunks(filenames, 100))
+        assert len(chunks) > 1
+        assert sum(chunks, []) == filenames
+        for chunk in chunks:
+            assert engine._command_length(chunk) <= max_length - 100
+
+    def test_concurrent_commands(self, temp_repo_dir):
+        """Test running several pep8 commands at the same time"""
+
+        test_files = []
+        for i in range(10):
+            source = "x = 1\n" if i % 3 else BAD_SOURCE
+            test_files.append(write_file(temp_repo_dir, "%d.py" % i, source))
+
+        sequential = engine.SubprocessEngine("pep8", "setup.cfg")
+        expected = [sequential.check(test_file) for test_file in test_files]
+
+        for name in ["subprocess", "batch"]:
+            concurrent = engine.create_engine(
+                name, "pep8", "setup.cfg", None, jobs=4)
+            assert concurrent.jobs == 4
+            assert list(concurrent.check_many(test_files)) == expected
+
+    def test_concurrent_commands_not_found(self, temp_repo_dir):
+        """Test that a missing pep8 command raises OSError"""
+
+        test_file = write_file(temp_repo_dir, "a.py", "")
+        for name in ["subprocess", "batch"]:
+            concurrent = engine.create_engine(
+                name, "no-such-pep8", "setup.cfg", None, jobs=4)
+            with pytest.raises(OSError):
+                list(concurrent.check_many([test_file] * 4))
+
+    def test_close_kills_commands(self, temp_repo_dir):
+        """Test that closing the results kills the running pep8 commands"""
+
+        command = os.path.join(temp_repo_dir, "slow-pep8")
+        write_file(temp_repo_dir, command, "\n".join([
+            "#!/bin/sh",
+            'case "$*" in *slow*) exec sleep 30;; esac',
+            'echo "fast.py:1:1: E1 fast"']))
+        os.chmod(command, stat.S_IRWXU)
+
+        start = time.time()
+        for name in ["subprocess", "batch"]:
+            checker = engine.create_engine(
+                name, command, "setup.cfg", None, jobs=2)
+            results = checker.check_many(["fast.py", "slow.py"])
+            assert next(results) == b"fast.py:1:1: E1 fast\n"
+            results.close()
+            assert not checker.processes
+        assert time.time() - start < 10
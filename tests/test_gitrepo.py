@@ -0,0 +1,290 @@
+"""
+This module contains the tests for the git repository access.
+"""
+
+import io
+import os
+import subprocess
+
+import pytest
+
+from conftest import cmd, write_file
+from git_pep8_commit_hook import gitrepo
+
+
+class TestGitRepo(object):
+    """
+    Test class for gitrepo.GitRepo.
+    """
+    # pylint: disable=no-self-use,protected-access
+
+    def test_staged_entries(self, temp_repo_dir):
+        """Test gitrepo.GitRepo.staged_entries"""
+
+        repo = gitrepo.GitRepo()
+
+        def staged_paths():
+            """Return the paths of the staged entries."""
+            return [entry.path for entry in repo.staged_entries()]
+
+        # Test empty tree
+        assert staged_paths() == []
+
+        # Create file "a"
+        test_file = write_file(temp_repo_dir, "a", "foo")
+        assert staged_paths() == []
+
+        # Add "a"
+        cmd(temp_repo_dir, "git add " + test_file)
+        assert staged_paths() == [test_file]
+
+        # Commit "a"
+        old_sha = cmd(temp_repo_dir, "git hash-object a").decode("utf-8")
+        cmd(temp_repo_dir, "git commit -m msg")
+        assert staged_paths() == []
+
+        # Edit "a"
+        write_file(temp_repo_dir, "a", "bar")
+        assert staged_paths() == []
+
+        # Add "a"
+        cmd(temp_repo_dir, "git add " + test_file)
+        sha = cmd(temp_repo_dir, "git hash-object a").decode("utf-8").strip()
+        assert list(repo.staged_entries()) == [
+            ("100644", "100644", old_sha.strip(), sha, "M", test_file)]
+
+        # Paths with spaces and deleted files
+        write_file(temp_repo_dir, "b c.py", "")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git rm -q --cached a")
+        assert staged_paths() == ["b c.py"]
+        assert [entry.status for entry in repo.staged_entries("D")] == ["D"]
+
+    def test_diff_entries(self, temp_repo_dir):
+        """Test gitrepo.GitRepo.diff_entries"""
+
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m base --no-verify")
+        write_file(temp_repo_dir, "b.py", "x = 2\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m head --no-verify")
+
+        repo = gitrepo.GitRepo()
+        entries = list(repo.diff_entries(["HEAD~1..HEAD"]))
+        assert [(entry.status, entry.path) for entry in entries] == [
+            ("A", "b.py")]
+        with repo.blob_reader() as reader:
+            assert reader.read(entries[0].new_sha) == b"x = 2\n"
+        assert list(repo.diff_entries(["HEAD..HEAD~1"], "AM")) == []
+        assert repo.changed_lines(["HEAD~1..HEAD"]) == {
+            "b.py": gitrepo.LineRanges([(1, 1)])}
+
+    def test_commit_entries(self, temp_repo_dir):
+        """Test gitrepo.GitRepo.rev_list and commit_entries"""
+
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m base --no-verify")
+        cmd(temp_repo_dir, "git rm -q a.py")
+        write_file(temp_repo_dir, "b.py", "x = 2\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m head --no-verify")
+
+        repo = gitrepo.GitRepo()
+        commits = list(repo.rev_list(["HEAD", "^" + "1" * 40]))
+        assert len(commits) == 2
+        assert list(repo.rev_list(["HEAD", "^HEAD~1"])) == commits[1:]
+        assert [(commit, [(entry.status, entry.path) for entry in entries])
+                for commit, entries in repo.commit_entries(commits)] == [
+                    (commits[0], [("A", "a.py")]),
+                    (commits[1], [("D", "a.py"), ("A", "b.py")])]
+        assert [commit for commit, _ in repo.commit_entries(
+            commits, pathspecs=["b.py"])] == commits[1:]
+
+        assert repo.remote_shas() == []
+        cmd(temp_repo_dir, "git update-ref refs/remotes/origin/a HEAD")
+        assert repo.remote_shas("origin") == commits[1:]
+        assert repo.remote_shas("other") == []
+
+    def test_commit_entries_merge(self, temp_repo_dir):
+        """Test that merge commits yield the files differing from every
+        parent"""
+
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        write_file(temp_repo_dir, "b.py", "x = 1\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m base --no-verify")
+        cmd(temp_repo_dir, "git checkout -q -b side")
+        write_file(temp_repo_dir, "a.py", "x = 2\n")
+        write_file(temp_repo_dir, "b.py", "x = 2\n")
+        cmd(temp_repo_dir, "git commit -q -a -m side --no-verify")
+        cmd(temp_repo_dir, "git checkout -q -")
+        write_file(temp_repo_dir, "a.py", "x = 3\n")
+        cmd(temp_repo_dir, "git commit -q -a -m main --no-verify")
+        with pytest.raises(subprocess.CalledProcessError):
+            cmd(temp_repo_dir, "git merge -q side")
+        # a.py resolves the conflict, b.py is taken from the side branch
+        write_file(temp_repo_dir, "a.py", "x = 4\n")
+        write_file(temp_repo_dir, "c.py", "x = 5\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m merge --no-verify")
+
+        repo = gitrepo.GitRepo()
+        head = cmd(temp_repo_dir, "git rev-parse HEAD").decode().strip()
+        blobs = cmd(temp_repo_dir, "git rev-parse HEAD~1:a.py HEAD:a.py")
+        old_sha, new_sha = blobs.decode().split()
+        assert [(commit, [(entry.status, entry.path) for entry in entries])
+                for commit, entries in repo.commit_entries([head])] == [
+                    (head, [("M", "a.py"), ("A", "c.py")])]
+        entry = list(repo.commit_entries([head]))[0][1][0]
+        assert (entry.old_sha, entry.new_sha) == (old_sha, new_sha)
+        assert entry.old_mode == entry.new_mode == "100644"
+
+    def test_tracked_files(self, temp_repo_dir):
+        """Test gitrepo.GitRepo.tracked_files"""
+
+        write_file(temp_repo_dir, "a b.py", "")
+        write_file(temp_repo_dir, "c", "")
+        cmd(temp_repo_dir, "git add *.py")
+        assert list(gitrepo.GitRepo().tracked_files()) == ["a b.py"]
+
+    def test_index_entries(self, temp_repo_dir):
+        """Test gitrepo.GitRepo.index_entries"""
+
+        write_file(temp_repo_dir, "a b.py", "x = 1\n")
+        write_file(temp_repo_dir, "c", "")
+        cmd(temp_repo_dir, "git add .")
+        sha = cmd(temp_repo_dir, "git hash-object c").decode().strip()
+
+        entries = list(gitrepo.GitRepo().index_entries())
+        assert [(entry.status, entry.path) for entry in entries] == [
+            ("A", "a b.py"), ("A", "c")]
+        assert entries[1].new_sha == sha
+        assert entries[1].new_mode == "100644"
+        assert [entry.path for entry in gitrepo.GitRepo().index_entries(
+            [":(glob)*.py"])] == ["a b.py"]
+
+    def test_blob_sizes(self, temp_repo_dir):
+        """Test gitrepo.GitRepo.blob_sizes"""
+
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        cmd(temp_repo_dir, "git add .")
+        sha = cmd(temp_repo_dir, "git hash-object a.py").decode().strip()
+        assert gitrepo.GitRepo().blob_sizes([sha, "1" * 40]) == {sha: 6}
+
+    def test_valid_revisions(self, temp_repo_dir):
+        """Test gitrepo.GitRepo.valid_revisions"""
+
+        write_file(temp_repo_dir, "a.py", "x = 1\n")
+        cmd(temp_repo_dir, "git add .")
+        cmd(temp_repo_dir, "git commit -q -m base --no-verify")
+
+        repo = gitrepo.GitRepo()
+        assert repo.valid_revisions(["HEAD"])
+        assert repo.valid_revisions(["HEAD..HEAD", "HEAD...HEAD"])
+        assert not repo.valid_revisions(["nope..HEAD"])
+        assert not repo.valid_revisions(["--all"])
+
+    def test_git_dir(self, temp_repo_dir):
+        """Test gitrepo.GitRepo.git_dir"""
+
+        assert gitrepo.GitRepo().git_dir == ".git"
+        assert gitrepo.GitRepo(temp_repo_dir).git_dir == os.path.join(
+            temp_repo_dir, ".git")
+
+    def test_read_paths(self):
+        """Test gitrepo.read_paths"""
+
+        stream = io.BytesIO(b"a.py\r\n\nb c.py\n")
+        assert list(gitrepo.read_paths(stream)) == ["a.py", "b c.py"]
+        stream = io.BytesIO(b"a\nb.py\0c.py\0")
+        assert list(gitrepo.read_paths(stream, b"\0")) == ["a\nb.py", "c.py"]
+
+    def test_split_stream(self):
+        """Test gitrepo._split_stream"""
+
+        stream = io.BytesIO(b"a\0bc\0\0d")
+        assert list(gitrepo._split_stream(stream, b"\0", 2)) == [
+            b"a", b"bc", b"", b"d"]
+
+
+class TestBlobReader(object):
+    """
+    Test class for gitrepo.BlobReader.
+    """
+    # pylint: disable=no-self-use
+
+    def test_read(self, temp_repo_dir):
+        """Test reading several blobs from one process"""
+
+        contents = [b"", b"x = 1\n", b"\x00\xff" * 10000]
+        shas = []
+        for i, content in enumerate(contents):
+            with open(write_file(temp_repo_dir, str(i), ""), "wb") as wfile:
+                wfile.write(content)
+            shas.append(cmd(temp_repo_dir, "git hash-object -w " + str(i))
+                        .decode("utf-8").strip())
+
+        with gitrepo.BlobReader() as reader:
+            for sha, content in zip(shas * 2, contents * 2):
+                assert reader.read(sha) == content
+            with pytest.raises(KeyError):
+                reader.read("0" * 40)
+            assert reader.read(shas[1]) == contents[1]
+        assert reader.process is None
+
+    def test_read_prefix(self, temp_repo_dir):
+        """Test reading only the start of blobs"""
+
+        content = b"\x00\xff" * 100000
+        with open(write_file(temp_repo_dir, "a", ""), "wb") as wfile:
+            wfile.write(content)
+        sha = cmd(temp_repo_dir, "git hash-object -w a").decode("utf-8")
+
+        with gitrepo.BlobReader() as reader:
+            assert reader.read(sha.strip(), 3) == content[:3]
+            assert reader.read(sha.strip(), 0) == b""
+            assert reader.read(sha.strip(), len(content) * 2) == content
+            assert reader.read(sha.strip()) == content
+
+
+class TestChangedLines(object):
+    """
+    Test class for the changed lines of the staged diff.
+    """
+    # pylint: disable=no-self-use,protected-access
+
+    def test_line_ranges(self):
+        """Test gitrepo.LineRanges"""
+
+        ranges = gitrepo.LineRanges([(10, 12), (1, 1), (13, 14), (20, 20)])
+        assert (ranges.starts, ranges.ends) == ([1, 10, 20], [1, 14, 20])
+        assert [row for row in range(25) if row in ranges] == [
+            1, 10, 11, 12, 13, 14, 20]
+        assert 1 not in gitrepo.LineRanges()
+
+    def test_changed_lines(self, temp_repo_dir):
+        """Test gitrepo.GitRepo.changed_lines"""
+
+        write_file(temp_repo_dir, "a b.py", "1\n2\n3\n4\n5\n")
+        write_file(temp_repo_dir, "c.py", "1\n")
+        cmd(temp_repo_dir, "git add .")
+        assert gitrepo.GitRepo().changed_lines() == {
+            "a b.py": gitrepo.LineRanges([(1, 5)]),
+            "c.py": gitrepo.LineRanges([(1, 1)])}
+
+        cmd(temp_repo_dir, "git commit -m msg")
+        write_file(temp_repo_dir, "a b.py", "1\nx\n3\n5\ny\nz\n")
+        write_file(temp_repo_dir, "c.py", "")
+        cmd(temp_repo_dir, "git add .")
+        assert gitrepo.GitRepo().changed_lines() == {
+            "a b.py": gitrepo.LineRanges([(2, 2), (5, 6)]),
+            "c.py": gitrepo.LineRanges()}
+
+    def test_unquote_path(self):
+        """Test gitrepo._unquote_path"""
+
+        assert gitrepo._unquote_path(b"b/a b.py\t") == b"b/a b.py"
+        assert gitrepo._unquote_path(b'"b/\\"\\t\\303\\246.py"') == (
+            b'b/"\t\xc3\xa6.py')
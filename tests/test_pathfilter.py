@@ -0,0 +1,65 @@
+"""
+This module contains the tests for the include and exclude patterns.
+"""
+
+import os
+
+from conftest import cmd, write_file
+from git_pep8_commit_hook import gitrepo, pathfilter
+
+
+PATHS = ["a.py", "src/b.py", "src/vendor/c.py", "vendor/d.py",
+         "migrations/0001.py", "src/e_pb2.py", "vendored.py"]
+
+
+class TestPathFilter(object):
+    """
+    Test class for pathfilter.PathFilter.
+    """
+    # pylint: disable=no-self-use,protected-access
+
+    def test_match(self):
+        """Test matching paths against the patterns"""
+
+        path_filter = pathfilter.PathFilter()
+        assert not path_filter
+        assert [path for path in PATHS if path_filter(path)] == PATHS
+
+        path_filter = pathfilter.PathFilter(
+            exclude="vendor/ migrations *_pb2.py")
+        assert [path for path in PATHS if path_filter(path)] == [
+            "a.py", "src/b.py", "vendored.py"]
+
+        path_filter = pathfilter.PathFilter(
+            include="src/", exclude="/vendor src/v?ndor")
+        assert [path for path in PATHS if path_filter(path)] == [
+            "src/b.py", "src/e_pb2.py"]
+        assert path_filter("./src/b.py")
+
+        path_filter = pathfilter.PathFilter(include="src/**/*.py [am]*")
+        assert [path for path in PATHS if path_filter(path)] == [
+            "a.py", "src/b.py", "src/vendor/c.py", "migrations/0001.py",
+            "src/e_pb2.py"]
+
+    def test_pathspecs(self, temp_repo_dir):
+        """Test that git selects the same files"""
+
+        for path in PATHS:
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            write_file(temp_repo_dir, path, "")
+        cmd(temp_repo_dir, "git add .")
+
+        repo = gitrepo.GitRepo()
+        for include, exclude in [(None, None), (None, "vendor/ *_pb2.py"),
+                                 ("src/ a.py", "src/vendor"),
+                                 ("**/[am]*", None)]:
+            path_filter = pathfilter.PathFilter(include, exclude)
+            expected = sorted(path for path in PATHS if path_filter(path))
+            assert sorted(
+                repo.tracked_files(path_filter.pathspecs())) == expected
+            assert sorted(
+                entry.path
+                for entry in repo.staged_entries(
+                    pathspecs=path_filter.pathspecs())) == expected
@@ -0,0 +1,133 @@
+"""
+This module contains the tests for the hook server and its client.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import threading
+
+import pytest
+
+from git_pep8_commit_hook import client, commit_hook, server
+
+
+def _main():
+    """Print the arguments and the environment like a hook."""
+    print(" ".join(sys.argv[1:]))
+    print(os.getcwd())
+    print(os.environ.get("GIT_INDEX_FILE"))
+    print(os.environ.get("VIRTUAL_ENV"))
+    sys.exit(len(sys.argv) - 1)
+
+
+@pytest.fixture
+def hook_server(request, temp_repo_dir):
+    """Run a hook server in a thread."""
+    path = os.path.join(temp_repo_dir, "run", "hook.sock")
+    instance = server.HookServer(path, _main)
+    thread = threading.Thread(target=instance.serve_forever)
+    thread.start()
+
+    def stop_server():
+        """Stop the server and remove its socket."""
+        instance.shutdown()
+        thread.join()
+        instance.server_close()
+
+    request.addfinalizer(stop_server)
+
+    return instance
+
+
+class TestServer(object):
+    """
+    Test class for the hook server.
+    """
+    # pylint: disable=no-self-use,redefined-outer-name
+
+    def test_request(self, hook_server, temp_repo_dir, monkeypatch):
+        """Test running the hook in the server"""
+
+        cwd = os.getcwd()
+        response = server.request(
+            hook_server.server_address, ["--staged", "a.py"], temp_repo_dir,
+            {"GIT_INDEX_FILE": "index.lock"})
+        assert response["output"].split("\n") == [
+            "--staged a.py", temp_repo_dir, "index.lock", "None", ""]
+        assert response["errors"] == ""
+        assert response["status"] == 2
+        assert os.getcwd() == cwd
+        assert sys.argv[0] != "git_pep8_commit_hook"
+
+        # The git variables and the search path of the client are forwarded
+        monkeypatch.setenv("GIT_INDEX_FILE", "other.lock")
+        monkeypatch.setenv("VIRTUAL_ENV", "/venv")
+        response = server.request(hook_server.server_address, [])
+        assert response["output"].split("\n")[2:] == [
+            "other.lock", "/venv", ""]
+        monkeypatch.delenv("VIRTUAL_ENV")
+        response = server.request(hook_server.server_address, [])
+        assert response["output"].split("\n")[2:] == [
+            "other.lock", "None", ""]
+
+        # The server can't read the stdin of the client
+        for argv in [["--files-from", "-"], ["--files-from=-"],
+                     ["--files-from=/dev/stdin"]]:
+            assert server.request(hook_server.server_address, argv) is None
+        assert not server.reads_stdin(["--files-from", "a-b", "-z"])
+
+        # A second server doesn't take over the socket
+        with pytest.raises(OSError):
+            server.HookServer(hook_server.server_address, _main)
+
+    def test_errors(self, temp_repo_dir):
+        """Test that the error output is sent apart from the output"""
+
+        instance = server.HookServer(
+            os.path.join(temp_repo_dir, "hook.sock"), commit_hook.main)
+        try:
+            output, errors, status = instance.run_hook(
+                ["--bogus"], temp_repo_dir, {})
+        finally:
+            instance.server_close()
+        assert status == 2
+        assert output == ""
+        assert errors.startswith("usage:")
+        assert "--bogus" in errors
+
+    def test_no_server(self, temp_repo_dir):
+        """Test that requests fail without server"""
+
+        path = os.path.join(temp_repo_dir, "hook.sock")
+        assert server.request(path, []) is None
+
+        # A socket left by a server that died is replaced
+        instance = server.HookServer(path, _main)
+        instance.socket.close()
+        instance = server.HookServer(path, _main)
+        instance.server_close()
+        assert not os.path.exists(path)
+
+    def test_client(self, hook_server, temp_repo_dir, monkeypatch, capsys):
+        """Test that the client falls back to checking in process"""
+
+        monkeypatch.setattr(sys, "argv", ["git_pep8_commit_hook", "a.py"])
+        monkeypatch.setattr(commit_hook, "main", lambda: print("local"))
+        monkeypatch.setenv(server.SOCKET_ENV, hook_server.server_address)
+        with pytest.raises(SystemExit) as error:
+            client.main()
+        assert error.value.code == 1
+        assert capsys.readouterr()[0].startswith("a.py\n")
+
+        for argv in [["audit"], ["--files-from=-"]]:
+            monkeypatch.setattr(sys, "argv", ["git_pep8_commit_hook"] + argv)
+            client.main()
+            assert capsys.readouterr()[0] == "local\n"
+
+        monkeypatch.setenv(
+            server.SOCKET_ENV, os.path.join(temp_repo_dir, "missing.sock"))
+        monkeypatch.setattr(sys, "argv", ["git_pep8_commit_hook", "a.py"])
+        client.main()
+        assert capsys.readouterr()[0] == "local\n"
@@ -0,0 +1,72 @@
+"""
+This module contains the tests for splitting the checks over shards.
+"""
+
+import json
+import os
+
+import pytest
+
+from git_pep8_commit_hook import shard
+
+
+class TestShard(object):
+    """
+    Test class for the shards.
+    """
+    # pylint: disable=no-self-use
+
+    def test_parse_shard(self):
+        """Test shard.parse_shard"""
+
+        assert shard.parse_shard("2/4") == (2, 4)
+        assert shard.parse_shard("1/1") == (1, 1)
+        for text in ["0/4", "5/4", "2", "a/b", "-1/4"]:
+            with pytest.raises(ValueError):
+                shard.parse_shard(text)
+
+    def test_path_shard(self):
+        """Test that every path is in one stable shard"""
+
+        paths = ["src/{}.py".format(index) for index in range(100)]
+        shards = [shard.path_shard(path, 4) for path in paths]
+        assert set(shards) == set([1, 2, 3, 4])
+        assert shards == [shard.path_shard(path, 4) for path in paths]
+        assert shard.path_shard("src\\1.py", 4) == shards[1]
+
+    def test_size_shards(self):
+        """Test balancing the sizes of the shards"""
+
+        sizes = {"a.py": 10, "b.py": 6, "c.py": 5, "d.py": 4, "e.py": 1}
+        shards = shard.size_shards(sizes, 2)
+        totals = [sum(size for path, size in sizes.items()
+                      if shards[path] == index) for index in [1, 2]]
+        assert sorted(totals) == [12, 14]
+        assert shards["a.py"] != shards["b.py"]
+        assert shard.size_shards({}, 2) == {}
+
+    def test_merge_reports(self, tmpdir):
+        """Test shard.write_report and shard.merge_reports"""
+
+        paths = [os.path.join(str(tmpdir), name)
+                 for name in ["1.json", "2.json", "3.json"]]
+        shard.write_report(paths[0], (1, 3), 2, [], True)
+        shard.write_report(paths[1], (2, 3), 3, ["b.py", "a.py"], False)
+        with open(paths[1]) as file_handle:
+            assert json.load(file_handle)["failed_files"] == ["a.py", "b.py"]
+
+        result = shard.merge_reports(paths[:2])
+        assert result["missing"] == [3]
+        assert result["checked"] == 5
+        assert result["failed_files"] == ["a.py", "b.py"]
+        assert not result["passed"]
+
+        shard.write_report(paths[1], (2, 3), 3, [], True)
+        shard.write_report(paths[2], (3, 3), 0, [], True)
+        assert shard.merge_reports(paths)["passed"]
+
+        with pytest.raises(ValueError):
+            shard.merge_reports([paths[0], paths[0]])
+        shard.write_report(paths[2], (3, 4), 0, [], True)
+        with pytest.raises(ValueError):
+            shard.merge_reports(paths)
@@ -0,0 +1,64 @@
+"""
+This module contains the tests for watching the working tree.
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from conftest import write_file
+from git_pep8_commit_hook import watch
+
+
+def _inotify():
+    """Return an Inotify instance, or skip the test without inotify."""
+    try:
+        return watch.Inotify()
+    except (AttributeError, OSError):
+        pytest.skip("inotify is not available")
+
+
+class TestWatch(object):
+    """
+    Test class for watching the working tree.
+    """
+    # pylint: disable=no-self-use
+
+    def test_watch_tree(self, tmpdir):
+        """Test that saved files are reported once they settle"""
+
+        root = str(tmpdir)
+        os.mkdir(os.path.join(root, ".git"))
+        inotify = _inotify()
+
+        def save():
+            """Save files several times, like editors do."""
+            time.sleep(0.2)
+            for _ in range(3):
+                write_file(root, "a.py", "x = 1\n")
+            write_file(root, ".git/index", "")
+            os.mkdir(os.path.join(root, "sub"))
+            write_file(root, "sub/b.py", "x = 1\n")
+        thread = threading.Thread(target=save)
+        thread.start()
+
+        changes = watch.watch_tree(root, 0.3, inotify)
+        saved = set()
+        while saved != set(["a.py", os.path.join("sub", "b.py")]):
+            files = next(changes)
+            assert not saved.intersection(files)
+            saved.update(files)
+        changes.close()
+        thread.join()
+        assert inotify.fd == -1
+
+    def test_paths(self):
+        """Test that paths are passed to inotify as bytes"""
+
+        # pylint: disable=protected-access
+        assert watch._encode_path(b"a/b.py") == b"a/b.py"
+        assert watch._encode_path(u"a/b.py") == b"a/b.py"
+        assert watch._decode_path(b"b.py") == "b.py"
+        assert watch._decode_path("b.py") == "b.py"
@@ -0,0 +1,85 @@
+"""
+This module contains the tests for the work queue shared by runners.
+"""
+
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from git_pep8_commit_hook import workqueue
+
+
+def _work(directory, owner):
+    """Fill the queue unless another runner did, and process batches."""
+    queue = workqueue.WorkQueue(directory, owner)
+    queue.fill(range(100), 3)
+    queue.wait(30, 0.01)
+    while True:
+        batch = queue.claim()
+        if batch is None:
+            break
+        queue.complete(batch, {"owner": owner, "items": batch.items})
+
+
+class TestWorkQueue(object):
+    """
+    Test class for workqueue.WorkQueue.
+    """
+    # pylint: disable=no-self-use
+
+    def test_processes(self, tmpdir):
+        """Test that runners in several processes share the batches"""
+
+        directory = os.path.join(str(tmpdir), "queue")
+        processes = [
+            multiprocessing.Process(
+                target=_work, args=(directory, "runner{}".format(index)))
+            for index in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+
+        queue = workqueue.WorkQueue(directory)
+        assert queue.finished()
+        results = list(queue.results())
+        assert len(results) == 34
+        assert sorted(item for result in results
+                      for item in result["items"]) == list(range(100))
+
+    def test_expired_lease(self, tmpdir):
+        """Test that the batch of a runner that died is claimed again"""
+
+        directory = str(tmpdir)
+        dead = workqueue.WorkQueue(directory, "dead", lease_time=-1)
+        assert dead.fill(["a.py", "b.py", "c.py"], 2)
+        live = workqueue.WorkQueue(directory, "live")
+        assert not live.fill(["d.py"], 2)
+
+        first = dead.claim()
+        assert first.items == ["a.py", "b.py"]
+        second = live.claim()
+        assert second.items == ["c.py"]
+        live.complete(second, {})
+        assert not live.finished()
+
+        # The lease of the dead runner expired
+        stolen = live.claim()
+        assert stolen.name == first.name
+        assert live.claim() is None
+        assert not dead.renew(first)
+        assert live.renew(stolen)
+        live.complete(stolen, {})
+        assert live.finished()
+
+    def test_wait(self, tmpdir):
+        """Test waiting for another runner to fill the queue"""
+
+        queue = workqueue.WorkQueue(str(tmpdir))
+        start = time.time()
+        with pytest.raises(OSError):
+            queue.wait(0.1, 0.01)
+        assert time.time() - start >= 0.1